@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+import asyncpg
+from asyncpg import Connection
+
+from app.core.config import RESPONSE_CACHE_MAX_BYTES, SHARDS_DATABASE_URLS
+from app.crud.citizen import IMPORT_VERSIONS_CHANNEL
+
+# (endpoint, import_id, import version, *extra key parts)
+CacheKey = Tuple[Hashable, ...]
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized responses limited by total size of cached bodies.
+    Keys start with endpoint name, import id and import version, so updated imports
+    are read again and their old entries are evicted.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._keys_by_import: Dict[int, Set[CacheKey]] = defaultdict(set)
+        self._size = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: Optional[CacheKey]) -> Optional[bytes]:
+        if key is None or key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: Optional[CacheKey], body: bytes) -> None:
+        if key is None or len(body) > self.max_bytes:
+            return
+
+        self._remove(key)
+        self._entries[key] = body
+        self._keys_by_import[key[1]].add(key)
+        self._size += len(body)
+
+        while self._size > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    def evict_import(self, import_id: int) -> None:
+        for key in list(self._keys_by_import.get(import_id, ())):
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_import.clear()
+        self._size = 0
+
+    def _remove(self, key: CacheKey) -> None:
+        body = self._entries.pop(key, None)
+        if body is None:
+            return
+        self._size -= len(body)
+        import_keys = self._keys_by_import[key[1]]
+        import_keys.discard(key)
+        if not import_keys:
+            del self._keys_by_import[key[1]]
+
+
+class ImportVersions:
+    """
+    Versions of imports known by current process. Versions are updated by notifications
+    from databases of all shards, which are received with dedicated connections outside of pools.
+    While notifications can not be received, no version is known, so cache is bypassed,
+    and connection is reestablished with growing delay between failed attempts.
+    """
+
+    def __init__(self, response_cache: ResponseCache, min_reconnect_delay: float = 1.0,
+                 max_reconnect_delay: float = 60.0):
+        self._response_cache = response_cache
+        self._versions: Dict[int, int] = dict()
+        self._listeners: List[Connection] = list()
+        self._started = False
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._min_reconnect_delay = min_reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._reconnect_delay = min_reconnect_delay
+        self._next_reconnect_at = 0.0
+        # Incremented on reset, so versions read from database before reset are not remembered
+        self.epoch = 0
+
+    @property
+    def listening(self) -> bool:
+        return bool(self._listeners) and not any(listener.is_closed() for listener in self._listeners)
+
+    async def start(self) -> None:
+        self._started = True
+        try:
+            await self._listen()
+        except (OSError, asyncpg.PostgresError):
+            logging.exception("Could not listen for import versions, they will be read from database")
+
+    async def stop(self) -> None:
+        self._started = False
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        for listener in self._listeners:
+            await listener.close()
+        self._listeners = list()
+        self.reset()
+
+    def get(self, import_id: int) -> Optional[int]:
+        if not self.listening:
+            self._schedule_reconnect()
+            return None
+        return self._versions.get(import_id)
+
+    def remember(self, import_id: int, version: int, epoch: int) -> None:
+        """
+        Saves version read from database, unless database was reset or newer version was notified since then
+        """
+        if epoch == self.epoch and self.listening and version > self._versions.get(import_id, 0):
+            self._versions[import_id] = version
+
+    def forget(self, import_id: int) -> None:
+        self._versions.pop(import_id, None)
+        self._response_cache.evict_import(import_id)
+
+    def reset(self) -> None:
+        self.epoch += 1
+        self._versions.clear()
+        self._response_cache.clear()
+
+    async def _listen(self) -> None:
+        """
+        Connects listeners to all shards. When any connection fails, all listeners are dropped
+        and next attempt is postponed twice as long as previous one
+        """
+        for listener in self._listeners:
+            listener.terminate()
+        self._listeners = list()
+
+        listeners = list()
+        try:
+            for shard_database_url in SHARDS_DATABASE_URLS:
+                listeners.append(await asyncpg.connect(str(shard_database_url)))
+                await listeners[-1].add_listener(IMPORT_VERSIONS_CHANNEL, self._on_notification)
+        except BaseException:
+            for listener in listeners:
+                listener.terminate()
+            self._next_reconnect_at = time.monotonic() + self._reconnect_delay
+            self._reconnect_delay = min(self._reconnect_delay * 2, self._max_reconnect_delay)
+            raise
+
+        self.reset()
+        self._listeners = listeners
+        self._reconnect_delay = self._min_reconnect_delay
+
+    def _schedule_reconnect(self) -> None:
+        if (not self._started
+                or (self._reconnect_task is not None and not self._reconnect_task.done())
+                or time.monotonic() < self._next_reconnect_at):
+            return
+        self.reset()
+        self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        try:
+            await self._listen()
+        except (OSError, asyncpg.PostgresError):
+            logging.exception("Could not reconnect to listen for import versions")
+
+    def _on_notification(self, connection: Connection, pid: int, channel: str, payload: str) -> None:
+        if payload == "reset":
+            self.reset()
+            return
+
+        import_id, version = map(int, payload.split(":"))
+        if version > self._versions.get(import_id, 0):
+            self._versions[import_id] = version
+        self._response_cache.evict_import(import_id)
+
+
+def make_etag(import_id: int, version: Optional[int], current_date: Optional[date] = None) -> Optional[str]:
+    """
+    Builds strong entity tag of import read response. Responses depending on current date
+    should pass it, so tag changes every day.
+    :return: entity tag or None if import does not exist
+    """
+    if version is None:
+        return None
+    if current_date is None:
+        return f'"{import_id}-{version}"'
+    return f'"{import_id}-{version}-{current_date:%Y%m%d}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks If-None-Match header against entity tag using weak comparison, as RFC 7232 requires
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.replace("W/", "", 1) == etag:
+            return True
+    return False
+
+
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES)
+import_versions = ImportVersions(response_cache=response_cache)
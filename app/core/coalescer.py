@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import CITIZEN_UPDATES_COALESCING_MAX_BATCH, CITIZEN_UPDATES_COALESCING_WINDOW
+from app.crud.citizen import update_citizens_data
+from app.db.database import DataBase, sharded_db
+from app.models.citizen import Citizen, CitizenToUpdate
+
+# (import_id, citizen_id, citizen data to update, future of updated citizen)
+PendingUpdate = Tuple[int, int, CitizenToUpdate, asyncio.Future]
+
+
+class CitizenUpdatesCoalescer:
+    """
+    Collects concurrent updates of citizens and applies them on one pool connection of their shard
+    in one transaction.
+    Every update is run in its own savepoint, so failed update is rolled back alone and its caller
+    gets its own error. Updates are collected for window seconds after the first of them, or until
+    there are max_batch of them.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[PendingUpdate] = list()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushes: List[asyncio.Task] = list()
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    async def stop(self) -> None:
+        self._flush()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def update(self, import_id: int, citizen_id: int, citizen: CitizenToUpdate) -> Citizen:
+        """
+        Schedules update of citizen and waits until transaction with it is committed
+        :return: updated citizen information
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((import_id, citizen_id, citizen, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        # Updates of imports of every shard are applied in their own transaction
+        pending_by_shard: Dict[int, List[PendingUpdate]] = dict()
+        for pending_update in self._pending:
+            pending_by_shard.setdefault(id(sharded_db.for_import(pending_update[0])), list()).append(pending_update)
+        self._pending = list()
+
+        for pending in pending_by_shard.values():
+            flush = asyncio.ensure_future(self._apply(sharded_db.for_import(pending[0][0]), pending))
+            self._flushes.append(flush)
+            flush.add_done_callback(self._flushes.remove)
+
+    @staticmethod
+    async def _apply(db: DataBase, pending: List[PendingUpdate]) -> None:
+        results = list()
+        try:
+            async with db.pool.acquire() as conn:
+                async with conn.transaction():
+                    for import_id, citizen_id, citizen, future in pending:
+                        try:
+                            async with conn.transaction():
+                                updated_citizen = await update_citizens_data(
+                                    conn=conn,
+                                    import_id=import_id,
+                                    citizen_id=citizen_id,
+                                    citizen=citizen
+                                )
+                        except Exception as exception:
+                            if not future.done():
+                                future.set_exception(exception)
+                        else:
+                            results.append((future, updated_citizen))
+        except Exception as exception:
+            logging.exception(f"Batch of {len(pending)} citizen updates was not committed")
+            for _, _, _, future in pending:
+                if not future.done():
+                    future.set_exception(exception)
+            return
+
+        for future, updated_citizen in results:
+            if not future.done():
+                future.set_result(updated_citizen)
+
+
+citizen_updates_coalescer = CitizenUpdatesCoalescer(
+    window=CITIZEN_UPDATES_COALESCING_WINDOW,
+    max_batch=CITIZEN_UPDATES_COALESCING_MAX_BATCH
+)
@@ -17,9 +17,65 @@ else:
     DATABASE_URL = DatabaseURL(DATABASE_URL)
 
 
+# Comma separated URLs of databases of additional shards, database of DATABASE_URL is the first shard.
+# Import is stored in shard number import_id modulo number of shards, so number of shards can be changed
+# only when there are no imports
+SHARDS_DATABASE_URLS = [DATABASE_URL] + [
+    DatabaseURL(shard_database_url.strip())
+    for shard_database_url in os.getenv("EXTRA_SHARDS_DATABASE_URLS", "").split(",")
+    if shard_database_url.strip()
+]
+
+# How shard of new import is chosen: "round_robin" - shards in turn,
+# "least_loaded" - shard with the least imports being written by process
+SHARDS_POLICY = os.getenv("SHARDS_POLICY", "round_robin")
+
+# Comma separated URLs of read replicas of database of the first shard. Read-only endpoints use
+# the least loaded replica, which has replayed the last write of client, other endpoints use primary database
+REPLICA_DATABASE_URLS = [
+    DatabaseURL(replica_database_url.strip())
+    for replica_database_url in os.getenv("REPLICA_DATABASE_URLS", "").split(",")
+    if replica_database_url.strip()
+]
+
 MAX_CONNECTIONS_COUNT = int(os.getenv("MAX_CONNECTIONS_COUNT", 7))
 MIN_CONNECTIONS_COUNT = int(os.getenv("MIN_CONNECTIONS_COUNT", 5))
 
+# Set to 1 when database is reached through PgBouncer in transaction pooling mode:
+# service statements are not prepared on connections and asyncpg statement cache is disabled
+PGBOUNCER_TRANSACTION_MODE = bool(int(os.getenv("PGBOUNCER_TRANSACTION_MODE", 0)))
+
+# Number of citizens sent to database in one COPY while streaming import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+
+# Number of citizens fetched from server-side cursor per chunk of GET citizens response
+CITIZENS_STREAM_CHUNK_SIZE = int(os.getenv("CITIZENS_STREAM_CHUNK_SIZE", 500))
+
+# How GET citizens response is built: "stream" - serialized in application from server-side cursor,
+# "database" - whole JSON document is assembled by PostgreSQL and passed through as is
+CITIZENS_LISTING_ENGINE = os.getenv("CITIZENS_LISTING_ENGINE", "stream")
+
+# How GET birthdays response is built: "database" - read from presents by month aggregate,
+# "numpy" - counted in application from relatives edges and their birth months
+BIRTHDAYS_ENGINE = os.getenv("BIRTHDAYS_ENGINE", "database")
+
+# How age statistics by town are computed: "histogram" - from numbers of citizens by town and age
+# read from histogram of birth dates, "python" - from ages of all citizens fetched to application,
+# "database" - percentiles are computed by database with percentile_cont and only results are fetched
+AGE_STATS_ENGINE = os.getenv("AGE_STATS_ENGINE", "histogram")
+
+# Memory budget of per-process cache of import read responses, 0 disables cache
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Background import jobs: max number of waiting jobs and number of concurrently running jobs per worker
+IMPORT_JOBS_QUEUE_SIZE = int(os.getenv("IMPORT_JOBS_QUEUE_SIZE", 10))
+IMPORT_JOBS_CONCURRENCY = int(os.getenv("IMPORT_JOBS_CONCURRENCY", 1))
+
+# Concurrent PATCH requests of citizens are collected for this many seconds (or until there are
+# max batch size of them) and applied in one transaction, 0 disables coalescing
+CITIZEN_UPDATES_COALESCING_WINDOW = float(os.getenv("CITIZEN_UPDATES_COALESCING_WINDOW", 0))
+CITIZEN_UPDATES_COALESCING_MAX_BATCH = int(os.getenv("CITIZEN_UPDATES_COALESCING_MAX_BATCH", 100))
+
 # Queries and responses examples for documentation
 IMPORT_ENDPOINT_QUERY_BODY_EXAMPLE = {"citizens": [
                 {
@@ -43,10 +99,35 @@ IMPORT_RESPONSE_201_EXAMPLE = {
     }
 }
 
+IMPORT_JOB_RESPONSE_202_EXAMPLE = {
+    "application/json": {
+        "data": {
+            "job_id": 1
+        }
+    }
+}
+
+GET_IMPORT_JOB_RESPONSE_200_EXAMPLE = {
+    "application/json": {
+        "data": {
+            "job_id": 1,
+            "state": "done",
+            "progress": 1.0,
+            "import_id": 1,
+            "error": None
+        }
+    }
+}
+
 
 PATCH_ENDPOINT_QUERY_BODY_EXAMPLE = {"name": "Рассеяная",
                                      "gender": "female"}
 
+PATCH_BATCH_ENDPOINT_QUERY_BODY_EXAMPLE = {"citizens": [
+    {"citizen_id": 1, "street": "Бассейная", "relatives": [2]},
+    {"citizen_id": 2, "relatives": [1]}
+]}
+
 IMPORT_ID_DESCRIPTION = "Import session id"
 PATCH_RESPONSE_200_EXAMPLE = {
     "application/json": {
@@ -64,6 +145,37 @@ PATCH_RESPONSE_200_EXAMPLE = {
     }
 }
 
+PATCH_BATCH_RESPONSE_200_EXAMPLE = {
+    "application/json": {
+        "example": {
+            "data": [
+                {
+                    "citizen_id": 1,
+                    "town": "Москва",
+                    "street": "Бассейная",
+                    "building": "дом Колотушкина",
+                    "apartment": 666,
+                    "name": "Рассеяная",
+                    "birth_date": "23.11.2001",
+                    "gender": "female",
+                    "relatives": [2]
+                },
+                {
+                    "citizen_id": 2,
+                    "town": "Москва",
+                    "street": "Льва Толстого",
+                    "building": "16к7стр5",
+                    "apartment": 7,
+                    "name": "Иванов Иван Иванович",
+                    "birth_date": "01.02.2000",
+                    "gender": "male",
+                    "relatives": [1]
+                }
+            ]
+        }
+    }
+}
+
 GET_CITIZENS_RESPONSE_200_EXAMPLE = {
     "application/json": {
         "data": [
@@ -153,6 +265,29 @@ GET_AGE_STATS_BY_TOWN_200_EXAMPLE = {
     }
 }
 
+GET_AGE_STATS_200_EXAMPLE = {
+    "application/json": {
+        "data": [
+            {
+                "breakdown": ["town"],
+                "groups": [
+                    {"dimensions": {"town": "Москва"}, "percentiles": {"p50": 35.0, "p99": 59.5}},
+                    {"dimensions": {"town": "Санкт-Петербург"}, "percentiles": {"p50": 45.0, "p99": 97.15}}
+                ]
+            },
+            {
+                "breakdown": ["town", "gender"],
+                "groups": [
+                    {"dimensions": {"town": "Москва", "gender": "female"}, "percentiles": {"p50": 31.0, "p99": 56.7}},
+                    {"dimensions": {"town": "Москва", "gender": "male"}, "percentiles": {"p50": 39.0, "p99": 59.9}},
+                    {"dimensions": {"town": "Санкт-Петербург", "gender": "male"},
+                     "percentiles": {"p50": 45.0, "p99": 97.15}}
+                ]
+            }
+        ]
+    }
+}
+
 RESET_DATABASE_RESPONSE_200_EXAMPLE = {
     "application/json": {
         "data_was_reset": "ok"
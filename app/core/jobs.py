@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+import asyncpg
+from asyncpg import Connection
+from starlette.exceptions import HTTPException
+
+from app.core.config import DATABASE_URL, IMPORT_JOBS_CONCURRENCY, IMPORT_JOBS_QUEUE_SIZE
+from app.crud.citizen import insert_citizens_data
+from app.crud.import_job import (
+    IMPORT_INTERRUPTED_ERROR,
+    create_import_job,
+    fail_interrupted_import_jobs,
+    release_import_job,
+    set_import_job_state,
+    update_import_job_progress
+)
+from app.db.database import sharded_db
+from app.models.citizen import Citizen
+from app.models.import_job import ImportJobState
+
+
+class ImportJobQueue:
+    """
+    Bounded in-process queue of imports, which are run by fixed number of workers.
+    Job state is saved in database, so it can be requested from any application process.
+    Job states and progress are written through dedicated connection of the queue, so imports
+    never wait for second pool connection. The connection also keeps locks of jobs owned
+    by the process: jobs of stopped processes are marked as failed when application starts.
+    """
+
+    def __init__(self, max_size: int, concurrency: int):
+        self._max_size = max_size
+        self._concurrency = concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = list()
+        self._conn: Optional[Connection] = None
+        self._conn_lock: Optional[asyncio.Lock] = None
+        self._job_ids: Set[int] = set()
+
+    async def start(self) -> None:
+        self._conn = await asyncpg.connect(str(DATABASE_URL))
+        self._conn_lock = asyncio.Lock()
+        await fail_interrupted_import_jobs(conn=self._conn)
+
+        self._queue = asyncio.Queue(maxsize=self._max_size)
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self._concurrency)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = list()
+
+        async with self._conn_lock:
+            for job_id in self._job_ids:
+                await set_import_job_state(conn=self._conn, job_id=job_id, state=ImportJobState.failed,
+                                           error=IMPORT_INTERRUPTED_ERROR)
+            self._job_ids = set()
+            await self._conn.close()
+            self._conn = None
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    async def submit(self, citizens: List[Citizen]) -> int:
+        """
+        Registers job and puts it to queue
+        :return: job id
+        :raises asyncio.QueueFull: if there are already max_size waiting jobs
+        """
+        async with self._conn_lock:
+            job_id: int = await create_import_job(conn=self._conn, num_citizens=len(citizens))
+            try:
+                self._queue.put_nowait((job_id, citizens))
+            except asyncio.QueueFull:
+                await set_import_job_state(conn=self._conn, job_id=job_id, state=ImportJobState.failed,
+                                           error="Import jobs queue is full")
+                await release_import_job(conn=self._conn, job_id=job_id)
+                raise
+
+        self._job_ids.add(job_id)
+        return job_id
+
+    async def _work(self) -> None:
+        while True:
+            job: Tuple[int, List[Citizen]] = await self._queue.get()
+            try:
+                await self._run(*job)
+            except Exception:
+                logging.exception(f"Import job {job[0]} was not processed")
+            finally:
+                self._queue.task_done()
+
+    async def _set_state(self, job_id: int, state: ImportJobState, import_id: Optional[int] = None,
+                         error: Optional[str] = None) -> None:
+        async with self._conn_lock:
+            await set_import_job_state(conn=self._conn, job_id=job_id, state=state, import_id=import_id, error=error)
+            if state in (ImportJobState.done, ImportJobState.failed):
+                await release_import_job(conn=self._conn, job_id=job_id)
+                self._job_ids.discard(job_id)
+
+    async def _run(self, job_id: int, citizens: List[Citizen]) -> None:
+
+        async def report_progress(num_imported: int) -> None:
+            async with self._conn_lock:
+                await update_import_job_progress(conn=self._conn, job_id=job_id, num_imported=num_imported)
+
+        await self._set_state(job_id=job_id, state=ImportJobState.running)
+
+        async with sharded_db.acquire_for_new_import() as (conn, shard_num):
+            try:
+                import_id = await insert_citizens_data(conn=conn, citizens=citizens, on_progress=report_progress,
+                                                       shard_num=shard_num, num_shards=len(sharded_db.shards))
+            except HTTPException as exception:
+                await self._set_state(job_id=job_id, state=ImportJobState.failed, error=exception.detail)
+                return
+            except Exception:
+                logging.exception(f"Import job {job_id} failed")
+                await self._set_state(job_id=job_id, state=ImportJobState.failed, error="Internal error")
+                return
+
+        await self._set_state(job_id=job_id, state=ImportJobState.done, import_id=import_id)
+
+
+import_job_queue = ImportJobQueue(max_size=IMPORT_JOBS_QUEUE_SIZE, concurrency=IMPORT_JOBS_CONCURRENCY)
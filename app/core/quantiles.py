@@ -0,0 +1,125 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+def sort_by_group_and_value(values: np.ndarray, group_codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sorts values by group and then by value in one sort
+    :param values: values to sort
+    :param group_codes: non-negative integer code of group of every value
+    :return: sorted group codes and values
+    """
+
+    if np.issubdtype(values.dtype, np.integer):
+        # Integer values of bounded range and their groups are packed into one integer key,
+        # which is sorted faster than pairs of keys
+        min_value = int(values.min())
+        values_span = int(values.max()) - min_value + 1
+        if (int(group_codes.max()) + 1) * values_span <= np.iinfo(np.int64).max:
+            sorted_keys = np.sort(group_codes.astype(np.int64) * values_span + (values - min_value))
+            return sorted_keys // values_span, sorted_keys % values_span + min_value
+
+    order = np.lexsort((values, group_codes))
+    return group_codes[order], values[order]
+
+
+def grouped_quantiles(
+        values: np.ndarray,
+        group_codes: np.ndarray,
+        quantiles: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes quantiles of values in every group with linear interpolation, as np.percentile does.
+    Values are sorted once by (group, value), and positions of all quantiles of all groups
+    are found by index arithmetic over bounds of groups in sorted values
+    :param values: values to compute quantiles of
+    :param group_codes: non-negative integer code of group of every value
+    :param quantiles: quantiles to compute, from 0 to 1
+    :return: codes of present groups in ascending order and matrix of their quantiles,
+    one row per group and one column per quantile
+    """
+
+    if len(values) == 0:
+        return np.empty(0, dtype=group_codes.dtype), np.empty((0, len(quantiles)), dtype=np.float64)
+
+    sorted_group_codes, sorted_values = sort_by_group_and_value(values=values, group_codes=group_codes)
+    sorted_values = sorted_values.astype(np.float64)
+
+    group_starts = np.flatnonzero(np.concatenate(([True], sorted_group_codes[1:] != sorted_group_codes[:-1])))
+    group_sizes = np.diff(np.append(group_starts, len(sorted_values)))
+
+    # Fractional position of every quantile inside its group, and its neighbour values
+    positions = np.asarray(quantiles, dtype=np.float64)[np.newaxis, :] * (group_sizes - 1)[:, np.newaxis]
+    positions_below = np.floor(positions).astype(np.int64)
+    positions_above = np.minimum(positions_below + 1, (group_sizes - 1)[:, np.newaxis])
+    weights_above = positions - positions_below
+    values_below = sorted_values[group_starts[:, np.newaxis] + positions_below]
+    values_above = sorted_values[group_starts[:, np.newaxis] + positions_above]
+
+    return sorted_group_codes[group_starts], _interpolate(values_below, values_above, weights_above)
+
+
+def grouped_weighted_quantiles(
+        values: np.ndarray,
+        group_codes: np.ndarray,
+        weights: np.ndarray,
+        quantiles: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes quantiles of values repeated by their weights in every group, with the same result as
+    grouped_quantiles of expanded values. Positions of quantiles are found in cumulative weights,
+    so cost depends on number of distinct values, not on their total weight
+    :param values: distinct values of every group
+    :param group_codes: non-negative integer code of group of every value
+    :param weights: positive integer number of repeats of every value
+    :param quantiles: quantiles to compute, from 0 to 1
+    :return: codes of present groups in ascending order and matrix of their quantiles,
+    one row per group and one column per quantile
+    """
+
+    if len(values) == 0:
+        return np.empty(0, dtype=group_codes.dtype), np.empty((0, len(quantiles)), dtype=np.float64)
+
+    order = np.lexsort((values, group_codes))
+    sorted_values = values[order].astype(np.float64)
+    sorted_group_codes = group_codes[order]
+    sorted_weights = weights[order].astype(np.int64)
+
+    group_starts = np.flatnonzero(np.concatenate(([True], sorted_group_codes[1:] != sorted_group_codes[:-1])))
+    cumulative_weights = np.cumsum(sorted_weights)
+    # Number of expanded values before every group and in every group
+    group_offsets = cumulative_weights[group_starts] - sorted_weights[group_starts]
+    group_sizes = np.add.reduceat(sorted_weights, group_starts)
+
+    # Positions in expanded values are mapped to distinct values covering them in cumulative weights
+    positions = np.asarray(quantiles, dtype=np.float64)[np.newaxis, :] * (group_sizes - 1)[:, np.newaxis]
+    positions_below = np.floor(positions).astype(np.int64)
+    positions_above = np.minimum(positions_below + 1, (group_sizes - 1)[:, np.newaxis])
+    weights_above = positions - positions_below
+    values_below = sorted_values[
+        np.searchsorted(cumulative_weights, group_offsets[:, np.newaxis] + positions_below, side="right")
+    ]
+    values_above = sorted_values[
+        np.searchsorted(cumulative_weights, group_offsets[:, np.newaxis] + positions_above, side="right")
+    ]
+
+    return sorted_group_codes[group_starts], _interpolate(values_below, values_above, weights_above)
+
+
+def _interpolate(values_below: np.ndarray, values_above: np.ndarray, weights_above: np.ndarray) -> np.ndarray:
+    """
+    Interpolates linearly between neighbour values from the nearest of them, as np.percentile does,
+    so quantile equals neighbour value when it is at the neighbour
+    :param values_below: values at floor of quantiles positions
+    :param values_above: values at next positions
+    :param weights_above: fractional parts of quantiles positions
+    :return: interpolated quantiles
+    """
+
+    differences = values_above - values_below
+    return np.where(
+        weights_above < 0.5,
+        values_below + differences * weights_above,
+        values_above - differences * (1 - weights_above)
+    )
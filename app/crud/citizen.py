@@ -1,6 +1,6 @@
-from collections import defaultdict
-from datetime import datetime
-from typing import Dict, List
+import json
+from collections import Counter, defaultdict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 from asyncpg import Connection
@@ -8,105 +8,505 @@ from asyncpg.exceptions import ForeignKeyViolationError, UniqueViolationError
 from starlette.exceptions import HTTPException
 from starlette.status import HTTP_400_BAD_REQUEST
 
-from app.models.citizen import AgeStatsByTown, Citizen, CitizenToUpdate
+from app.core.config import CITIZENS_STREAM_CHUNK_SIZE, IMPORT_BATCH_SIZE
+from app.core.quantiles import grouped_quantiles, grouped_weighted_quantiles
+from app.db.statements import Statement
+from app.models.citizen import (
+    AGE_STATS_DIMENSIONS,
+    BIRTH_DATE_FORMAT,
+    CITIZEN_FIELDS,
+    AgeStatsBreakdown,
+    AgeStatsByTown,
+    AgeStatsGroup,
+    Citizen,
+    CitizenToUpdate,
+    CitizenToUpdateInBatch,
+    parse_birth_date
+)
 
+# Channel of notifications "<import_id>:<version>" about updated imports and "reset" about cleared database
+IMPORT_VERSIONS_CHANNEL = "import_versions"
 
-async def insert_citizens_data(conn: Connection, citizens: List[Citizen]) -> int:
+
+async def insert_citizens_data(
+        conn: Connection,
+        citizens: List[Citizen],
+        on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+        shard_num: int = 0,
+        num_shards: int = 1
+) -> int:
     """
     Добавляет в базу данных информацию по гражданам
     :param conn: asyncpg connection
     :param citizens: citizens to add info about
+    :param on_progress: called with number of copied citizens after every batch
+    :param shard_num: number of shard of connection database
+    :param num_shards: number of shards
     :return:
     """
 
-    async with conn.transaction():
+    generated_import_id = await NEXT_IMPORT_ID.fetchval(conn, num_shards, shard_num)
 
-        generated_import_id = await conn.fetchval("SELECT nextval('imports_seq')")
+    async with conn.transaction():
 
-        citizens_records = [
-            (generated_import_id, citizen.citizen_id, citizen.town,
-             citizen.street, citizen.building, citizen.apartment,
-             citizen.name, datetime.strptime(citizen.birth_date, "%d.%m.%Y"), citizen.gender)
-            for citizen in citizens
-        ]
+        # Citizens were validated as a whole by CitizensToImport, so they are copied to live tables directly.
+        # Relatives are copied after all citizens, because foreign keys are checked for every copied row.
+        for batch_start in range(0, len(citizens), IMPORT_BATCH_SIZE):
+            citizens_batch = citizens[batch_start:batch_start + IMPORT_BATCH_SIZE]
+            await _copy_citizens(
+                conn=conn,
+                import_id=generated_import_id,
+                citizens=citizens_batch,
+                schema_name="public",
+                table_name="citizens"
+            )
+            if on_progress is not None:
+                await on_progress(batch_start + len(citizens_batch))
 
-        try:
-            _ = await conn.copy_records_to_table(
-                table_name="citizens",
-                records=citizens_records,
-                columns=["import_id", "citizen_id", "town", "street", "building",
-                         "apartment", "name", "birth_date", "gender"],
-                schema_name="public"
+        for batch_start in range(0, len(citizens), IMPORT_BATCH_SIZE):
+            await _copy_relatives(
+                conn=conn,
+                import_id=generated_import_id,
+                citizens=citizens[batch_start:batch_start + IMPORT_BATCH_SIZE],
+                schema_name="public",
+                table_name="relatives"
             )
-        except UniqueViolationError:
-            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
-                                detail="Citizen id is not unique")
 
-        citizen_relatives = list()
-        for citizen in citizens:
-            for relative_id in citizen.relatives:
-                citizen_relatives.append((generated_import_id, citizen.citizen_id, relative_id))
+        await _copy_presents(conn=conn, import_id=generated_import_id, citizens=citizens)
+        await _copy_town_birth_dates(conn=conn, import_id=generated_import_id, citizens=citizens)
+        await INSERT_IMPORT.execute(conn, generated_import_id)
 
-        try:
-            _ = await conn.copy_records_to_table(
-                table_name="relatives",
-                records=citizen_relatives,
-                columns=["import_id", "citizen_id", "relative_id"],
-                schema_name="public"
-            )
-        except UniqueViolationError:
-            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
-                                detail="Detected duplicated relative_id")
-        except ForeignKeyViolationError:
-            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
-                                detail="Detected nonexistent relative_id")
+    return generated_import_id
+
+
+async def insert_citizens_data_from_stream(
+        conn: Connection,
+        citizens: AsyncIterator[Citizen],
+        shard_num: int = 0,
+        num_shards: int = 1
+) -> int:
+    """
+    Добавляет в базу данных граждан по мере чтения потока, пачками по IMPORT_BATCH_SIZE.
+    Согласованность родственников проверяется целиком после того, как весь поток прочитан.
+    :param conn: asyncpg connection
+    :param citizens: async iterator over validated citizens
+    :param shard_num: number of shard of connection database
+    :param num_shards: number of shards
+    :return: generated import id
+    """
+
+    generated_import_id = await NEXT_IMPORT_ID.fetchval(conn, num_shards, shard_num)
+
+    async with conn.transaction():
+
+        await _create_staging_tables(conn=conn)
+        citizens_batch = list()
+        async for citizen in citizens:
+            citizens_batch.append(citizen)
+            if len(citizens_batch) >= IMPORT_BATCH_SIZE:
+                await _copy_citizens_to_staging(conn=conn, import_id=generated_import_id, citizens=citizens_batch)
+                citizens_batch = list()
+
+        await _copy_citizens_to_staging(conn=conn, import_id=generated_import_id, citizens=citizens_batch)
+
+        await _validate_staged_import(conn=conn)
+        await _publish_staged_import(conn=conn, import_id=generated_import_id)
+
+    return generated_import_id
+
+
+# Ids of imports of every shard are numbers of this shard modulo number of shards
+NEXT_IMPORT_ID = Statement(
+    "next_import_id",
+    """
+    SELECT nextval('imports_seq') * $1::int8 + $2::int8
+    """
+)
+
+
+async def _create_staging_tables(conn: Connection) -> None:
+    """
+    Creates temporary staging tables of import. Tables are not written to WAL and are dropped
+    when import transaction ends, so they do not accumulate dead rows. Must be called inside transaction.
+    :param conn: asyncpg connection
+    :return:
+    """
+
+    await conn.execute(
+        """
+        CREATE TEMPORARY TABLE citizens_staging (LIKE public.citizens) ON COMMIT DROP;
+        CREATE TEMPORARY TABLE relatives_staging (LIKE public.relatives) ON COMMIT DROP;
+        """
+    )
+
+
+async def _copy_citizens_to_staging(conn: Connection, import_id: int, citizens: List[Citizen]) -> None:
+    """
+    Copies batch of citizens and their relatives to staging tables
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :param citizens: batch of citizens
+    :return:
+    """
+
+    await _copy_citizens(conn=conn, import_id=import_id, citizens=citizens,
+                         schema_name="pg_temp", table_name="citizens_staging")
+    await _copy_relatives(conn=conn, import_id=import_id, citizens=citizens,
+                          schema_name="pg_temp", table_name="relatives_staging")
+
+
+async def _copy_citizens(
+        conn: Connection,
+        import_id: int,
+        citizens: List[Citizen],
+        schema_name: str,
+        table_name: str
+) -> None:
+    """
+    Copies batch of citizens to live or staging citizens table
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :param citizens: batch of citizens
+    :param schema_name: schema of table
+    :param table_name: table with columns of public.citizens
+    :return:
+    """
+
+    if not citizens:
+        return
+
+    citizens_records = [
+        (import_id, citizen.citizen_id, citizen.town,
+         citizen.street, citizen.building, citizen.apartment,
+         citizen.name, parse_birth_date(citizen.birth_date), citizen.gender)
+        for citizen in citizens
+    ]
+    _ = await conn.copy_records_to_table(
+        table_name=table_name,
+        records=citizens_records,
+        columns=["import_id", "citizen_id", "town", "street", "building",
+                 "apartment", "name", "birth_date", "gender"],
+        schema_name=schema_name
+    )
+
+
+async def _copy_relatives(
+        conn: Connection,
+        import_id: int,
+        citizens: List[Citizen],
+        schema_name: str,
+        table_name: str
+) -> None:
+    """
+    Copies relatives of batch of citizens to live or staging relatives table
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :param citizens: batch of citizens
+    :param schema_name: schema of table
+    :param table_name: table with columns of public.relatives
+    :return:
+    """
+
+    relatives_records = [
+        (import_id, citizen.citizen_id, relative_id)
+        for citizen in citizens
+        for relative_id in citizen.relatives
+    ]
+    if relatives_records:
+        _ = await conn.copy_records_to_table(
+            table_name=table_name,
+            records=relatives_records,
+            columns=["import_id", "citizen_id", "relative_id"],
+            schema_name=schema_name
+        )
+
+
+async def _copy_presents(conn: Connection, import_id: int, citizens: List[Citizen]) -> None:
+    """
+    Counts presents of citizens per month and copies them to presents by month aggregate.
+    Presents are counted in application: rows copied in import transaction have no statistics yet,
+    so planner can not choose sane plan to aggregate them in database.
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :param citizens: all citizens of import
+    :return:
+    """
 
-        return generated_import_id
+    birth_months = {citizen.citizen_id: parse_birth_date(citizen.birth_date).month for citizen in citizens}
+    presents = Counter(
+        (citizen.citizen_id, birth_months[relative_id])
+        for citizen in citizens
+        for relative_id in citizen.relatives
+    )
+    if presents:
+        _ = await conn.copy_records_to_table(
+            table_name="presents_by_month",
+            records=[(import_id, citizen_id, month, num_presents)
+                     for (citizen_id, month), num_presents in presents.items()],
+            columns=["import_id", "citizen_id", "month", "presents"],
+            schema_name="public"
+        )
 
 
-async def get_citizen(conn: Connection, import_id: int, citizen_id: int) -> Citizen:
+async def _copy_town_birth_dates(conn: Connection, import_id: int, citizens: List[Citizen]) -> None:
     """
-    Вовзращает из базы информаицю о гражданине по import_id и citizen_id
+    Counts citizens by town and birth date and copies them to town birth dates histogram
     :param conn: asyncpg connection
     :param import_id: id of upload from provider
-    :param citizen_id: citizen id of citizen to update
-    :return: citizen information
+    :param citizens: all citizens of import
+    :return:
+    """
+
+    town_birth_dates = Counter((citizen.town, parse_birth_date(citizen.birth_date)) for citizen in citizens)
+    if town_birth_dates:
+        _ = await conn.copy_records_to_table(
+            table_name="town_birth_dates",
+            records=[(import_id, town, birth_date, num_citizens)
+                     for (town, birth_date), num_citizens in town_birth_dates.items()],
+            columns=["import_id", "town", "birth_date", "citizens"],
+            schema_name="public"
+        )
+
+
+async def _validate_staged_import(conn: Connection) -> None:
+    """
+    Validates staged import with set-based queries. Is needed for citizens imported from stream,
+    which can not be validated as a whole before copying.
+    Queries of temporary tables are not registered as service statements: tables do not exist
+    when pool connections are created.
+    :param conn: asyncpg connection
+    :return:
     """
-    citizen_row = await conn.fetchrow(
+
+    # Temporary tables are not analyzed by autovacuum, without statistics anti-joins below get nested loop plans
+    await conn.execute("ANALYZE pg_temp.citizens_staging, pg_temp.relatives_staging")
+
+    staged_import_errors = await conn.fetchrow(
+        """
+        SELECT
+            EXISTS (
+                SELECT 1
+                FROM pg_temp.citizens_staging
+                GROUP BY citizen_id
+                HAVING COUNT(*) > 1
+            ) AS duplicated_citizens,
+            EXISTS (
+                SELECT 1
+                FROM pg_temp.relatives_staging
+                GROUP BY citizen_id, relative_id
+                HAVING COUNT(*) > 1
+            ) AS duplicated_relatives,
+            EXISTS (
+                SELECT 1
+                FROM pg_temp.relatives_staging relatives
+                WHERE NOT EXISTS (
+                    SELECT 1
+                    FROM pg_temp.citizens_staging citizens
+                    WHERE citizens.citizen_id = relatives.relative_id
+                )
+            ) AS nonexistent_relatives,
+            EXISTS (
+                SELECT 1
+                FROM pg_temp.relatives_staging relatives
+                WHERE NOT EXISTS (
+                    SELECT 1
+                    FROM pg_temp.relatives_staging reverse_relatives
+                    WHERE reverse_relatives.citizen_id = relatives.relative_id
+                          AND reverse_relatives.relative_id = relatives.citizen_id
+                )
+            ) AS inconsistent_relatives
         """
-        SELECT town,
-               street,
-               building,
-               apartment,
-               name,
-               birth_date,
-               gender,
-               array_agg(relative_id) relatives
-        FROM public.citizens citizens LEFT JOIN public.relatives relatives_
-        ON citizens.import_id = relatives_.import_id AND citizens.citizen_id = relatives_.citizen_id
-        WHERE citizens.import_id = $1 AND citizens.citizen_id = $2
-        GROUP BY town, street, building, apartment, name, birth_date, gender
-        """,
-        import_id,
-        citizen_id
     )
 
-    if citizen_row is None:
+    if staged_import_errors["duplicated_citizens"]:
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
-                            detail=f"Citizen with id = {citizen_id} is not presented in import id: {import_id}")
-    citizen = Citizen(
-        citizen_id=citizen_id,
-        town=citizen_row["town"],
-        street=citizen_row["street"],
-        building=citizen_row["building"],
-        apartment=citizen_row["apartment"],
-        name=citizen_row["name"],
-        birth_date=citizen_row["birth_date"].strftime("%d.%m.%Y"),
-        gender=citizen_row["gender"],
-        relatives=citizen_row["relatives"] if citizen_row["relatives"][0] is not None else []
+                            detail="Citizen id is not unique")
+    if staged_import_errors["duplicated_relatives"]:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Detected duplicated relative_id")
+    if staged_import_errors["nonexistent_relatives"]:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Detected nonexistent relative_id")
+    if staged_import_errors["inconsistent_relatives"]:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Relatives data is inconsistent")
+
+
+async def _publish_staged_import(conn: Connection, import_id: int) -> None:
+    """
+    Moves staged import to live tables in one statement. Must be called inside transaction.
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :return:
+    """
+
+    await conn.execute(
+        """
+        WITH inserted_citizens AS (
+            INSERT INTO public.citizens (import_id, citizen_id, town, street, building,
+                                         apartment, name, birth_date, gender)
+            SELECT import_id, citizen_id, town, street, building, apartment, name, birth_date, gender
+            FROM pg_temp.citizens_staging
+        ), inserted_import AS (
+            INSERT INTO public.imports (import_id)
+            VALUES ($1)
+        ), inserted_presents AS (
+            INSERT INTO public.presents_by_month (import_id, citizen_id, month, presents)
+            SELECT relatives.import_id, relatives.citizen_id, EXTRACT(MONTH FROM relative.birth_date), COUNT(*)
+            FROM pg_temp.relatives_staging relatives JOIN pg_temp.citizens_staging relative
+            ON relative.citizen_id = relatives.relative_id
+            GROUP BY 1, 2, 3
+        ), inserted_town_birth_dates AS (
+            INSERT INTO public.town_birth_dates (import_id, town, birth_date, citizens)
+            SELECT import_id, town, birth_date, COUNT(*)
+            FROM pg_temp.citizens_staging
+            GROUP BY 1, 2, 3
+        )
+        INSERT INTO public.relatives (import_id, citizen_id, relative_id)
+        SELECT import_id, citizen_id, relative_id
+        FROM pg_temp.relatives_staging
+        """,
+        import_id
     )
 
-    return citizen
+
+INSERT_IMPORT = Statement(
+    "insert_import",
+    """
+    INSERT INTO public.imports (import_id)
+    VALUES ($1)
+    """
+)
+
+
+UPDATE_CITIZEN = Statement(
+    "update_citizen",
+    """
+    WITH old_citizen AS (
+        SELECT town, birth_date
+        FROM public.citizens
+        WHERE import_id = $1 AND citizen_id = $2
+    ),
+    updated_citizen AS (
+        UPDATE public.citizens
+        SET town = COALESCE($3, town),
+            street = COALESCE($4, street),
+            building = COALESCE($5, building),
+            apartment = COALESCE($6, apartment),
+            name = COALESCE($7, name),
+            birth_date = COALESCE($8, birth_date),
+            gender = COALESCE($9, gender)
+        WHERE import_id = $1 AND citizen_id = $2
+        RETURNING town, street, building, apartment, name, birth_date, gender
+    ),
+    old_relatives AS (
+        SELECT relative_id
+        FROM public.relatives
+        WHERE import_id = $1 AND citizen_id = $2
+    ),
+    new_relatives AS (
+        SELECT unnest($10::int8[]) relative_id
+    ),
+    removed_relatives AS (
+        SELECT relative_id FROM old_relatives WHERE $10::int8[] IS NOT NULL
+        EXCEPT
+        SELECT relative_id FROM new_relatives
+    ),
+    added_relatives AS (
+        SELECT relative_id FROM new_relatives
+        EXCEPT
+        SELECT relative_id FROM old_relatives
+    ),
+    -- Both directions of removed edges are matched by primary key conditions, so only they are read
+    deleted_relatives AS (
+        DELETE FROM public.relatives relatives_
+        WHERE EXISTS (SELECT 1 FROM updated_citizen)
+              AND relatives_.import_id = $1
+              AND (relatives_.citizen_id = $2
+                   AND relatives_.relative_id = ANY(ARRAY(SELECT relative_id FROM removed_relatives))
+                   OR relatives_.citizen_id = ANY(ARRAY(SELECT relative_id FROM removed_relatives))
+                   AND relatives_.relative_id = $2)
+    ),
+    added_edges AS (
+        SELECT $2::int8 citizen_id, relative_id FROM added_relatives
+        UNION
+        SELECT relative_id, $2::int8 FROM added_relatives
+    ),
+    inserted_relatives AS (
+        INSERT INTO public.relatives (import_id, citizen_id, relative_id)
+        SELECT $1::int8, citizen_id, relative_id
+        FROM added_edges
+        WHERE EXISTS (SELECT 1 FROM updated_citizen)
+    ),
+    -- Every edge (citizen_id, relative_id) is a present in month of relative birthday, so presents
+    -- are adjusted by difference between new and old edges of updated citizen
+    old_edges AS (
+        SELECT $2::int8 citizen_id, relative_id FROM old_relatives
+        UNION
+        SELECT relative_id, $2::int8 FROM old_relatives
+    ),
+    final_relatives AS (
+        SELECT relative_id FROM new_relatives
+        UNION ALL
+        SELECT relative_id FROM old_relatives WHERE $10::int8[] IS NULL
+    ),
+    new_edges AS (
+        SELECT $2::int8 citizen_id, relative_id FROM final_relatives
+        UNION
+        SELECT relative_id, $2::int8 FROM final_relatives
+    ),
+    presents_deltas AS (
+        SELECT edge.citizen_id,
+               EXTRACT(MONTH FROM CASE WHEN edge.relative_id = $2 THEN updated_citizen.birth_date
+                                       ELSE relative.birth_date END)::int4 AS month,
+               1 delta
+        FROM updated_citizen,
+             new_edges edge JOIN public.citizens relative
+             ON relative.import_id = $1 AND relative.citizen_id = edge.relative_id
+        UNION ALL
+        SELECT edge.citizen_id, EXTRACT(MONTH FROM relative.birth_date)::int4, -1
+        FROM updated_citizen,
+             old_edges edge JOIN public.citizens relative
+             ON relative.import_id = $1 AND relative.citizen_id = edge.relative_id
+    ),
+    updated_presents AS (
+        INSERT INTO public.presents_by_month (import_id, citizen_id, month, presents)
+        SELECT $1::int8, citizen_id, month, SUM(delta)
+        FROM presents_deltas
+        GROUP BY citizen_id, month
+        HAVING SUM(delta) <> 0
+        ON CONFLICT (import_id, citizen_id, month)
+        DO UPDATE SET presents = presents_by_month.presents + EXCLUDED.presents
+    ),
+    -- Citizen is moved from bucket of old town and birth date to bucket of new ones
+    town_birth_dates_deltas AS (
+        SELECT town, birth_date, 1 delta FROM updated_citizen
+        UNION ALL
+        SELECT town, birth_date, -1 FROM old_citizen WHERE EXISTS (SELECT 1 FROM updated_citizen)
+    ),
+    updated_town_birth_dates AS (
+        INSERT INTO public.town_birth_dates (import_id, town, birth_date, citizens)
+        SELECT $1::int8, town, birth_date, SUM(delta)
+        FROM town_birth_dates_deltas
+        GROUP BY town, birth_date
+        HAVING SUM(delta) <> 0
+        ON CONFLICT (import_id, town, birth_date)
+        DO UPDATE SET citizens = town_birth_dates.citizens + EXCLUDED.citizens
+    ),
+    bumped_import AS (
+        UPDATE public.imports
+        SET version = nextval('imports_versions_seq')
+        WHERE import_id = $1 AND EXISTS (SELECT 1 FROM updated_citizen)
+        RETURNING import_id, version
+    )
+    SELECT updated_citizen.*,
+           COALESCE($10::int8[], ARRAY(SELECT relative_id FROM old_relatives ORDER BY relative_id)) relatives,
+           CASE WHEN bumped_import.import_id IS NOT NULL
+                THEN pg_notify($11, bumped_import.import_id || ':' || bumped_import.version)
+           END
+    FROM updated_citizen LEFT JOIN bumped_import ON true
+    """
+)
 
 
 async def update_citizens_data(
@@ -116,185 +516,490 @@ async def update_citizens_data(
         citizen: CitizenToUpdate
 ) -> Citizen:
     """
-    Обновляет в базе информацию о гражданине, возвращает обновленную информацию.
+    Обновляет в базе информацию о гражданине одним запросом, возвращает обновленную информацию.
+    Обновляются только переданные поля, связи с родственниками меняются только для
+    добавленных и удаленных родственников.
     :param conn: asyncpg connection to database
     :param import_id: id of upload from provider
     :param citizen_id: citizen_id of citizen to update
     :param citizen: citizen data to for updating
     :return: Updated citizen information
     """
-    citizen_from_db: Citizen = await get_citizen(
-        conn=conn,
-        import_id=import_id,
-        citizen_id=citizen_id
+    if citizen.relatives is not None and len(set(citizen.relatives)) != len(citizen.relatives):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Detected duplicated relative_id")
+
+    try:
+        citizen_row = await UPDATE_CITIZEN.fetchrow(
+            conn,
+            import_id,
+            citizen_id,
+            citizen.town,
+            citizen.street,
+            citizen.building,
+            citizen.apartment,
+            citizen.name,
+            parse_birth_date(citizen.birth_date) if citizen.birth_date else None,
+            citizen.gender,
+            citizen.relatives,
+            IMPORT_VERSIONS_CHANNEL
+        )
+    except ForeignKeyViolationError:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"Found nonexistent relative import id = {import_id}")
+    except UniqueViolationError:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Detected duplicated relative_id")
+
+    if citizen_row is None:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"Citizen with id = {citizen_id} is not presented in import id: {import_id}")
+
+    return Citizen.construct(
+        {
+            "citizen_id": citizen_id,
+            "town": citizen_row["town"],
+            "street": citizen_row["street"],
+            "building": citizen_row["building"],
+            "apartment": citizen_row["apartment"],
+            "name": citizen_row["name"],
+            "birth_date": citizen_row["birth_date"].strftime(BIRTH_DATE_FORMAT),
+            "gender": citizen_row["gender"],
+            "relatives": citizen_row["relatives"]
+        },
+        CITIZEN_FIELDS
     )
 
-    # Update basic citizens information
-    citizen_from_db.town = citizen.town if citizen.town else citizen_from_db.town
-    citizen_from_db.street = citizen.street if citizen.street else citizen_from_db.street
-    citizen_from_db.building = citizen.building if citizen.building else citizen_from_db.building
-    citizen_from_db.apartment = citizen.apartment if citizen.apartment else citizen_from_db.apartment
-    citizen_from_db.name = citizen.name if citizen.name else citizen_from_db.name
-    citizen_from_db.gender = citizen.gender if citizen.gender else citizen_from_db.gender
 
-    citizen_from_db.birth_date = datetime.strptime(
-        citizen.birth_date,
-        "%d.%m.%Y"
-    ) if citizen.birth_date else datetime.strptime(citizen_from_db.birth_date, "%d.%m.%Y")
+UPDATE_CITIZENS_BATCH = Statement(
+    "update_citizens_batch",
+    """
+    WITH changes AS (
+        SELECT *
+        FROM unnest($2::int8[], $3::varchar[], $4::varchar[], $5::varchar[],
+                    $6::int4[], $7::varchar[], $8::date[], $9::varchar[])
+             changes(citizen_id, town, street, building, apartment, name, birth_date, gender)
+    ),
+    old_citizens AS (
+        SELECT town, birth_date
+        FROM public.citizens
+        WHERE import_id = $1 AND citizen_id = ANY($2::int8[])
+    ),
+    updated_citizens AS (
+        UPDATE public.citizens citizens
+        SET town = COALESCE(changes.town, citizens.town),
+            street = COALESCE(changes.street, citizens.street),
+            building = COALESCE(changes.building, citizens.building),
+            apartment = COALESCE(changes.apartment, citizens.apartment),
+            name = COALESCE(changes.name, citizens.name),
+            birth_date = COALESCE(changes.birth_date, citizens.birth_date),
+            gender = COALESCE(changes.gender, citizens.gender)
+        FROM changes
+        WHERE citizens.import_id = $1 AND citizens.citizen_id = changes.citizen_id
+        RETURNING citizens.citizen_id, citizens.town, citizens.birth_date
+    ),
+    old_relatives AS (
+        SELECT citizen_id, relative_id
+        FROM public.relatives
+        WHERE import_id = $1 AND citizen_id = ANY($10::int8[])
+    ),
+    new_relatives AS (
+        SELECT citizen_id, relative_id
+        FROM unnest($11::int8[], $12::int8[]) new_relatives(citizen_id, relative_id)
+    ),
+    removed_relatives AS (
+        SELECT citizen_id, relative_id FROM old_relatives
+        EXCEPT
+        SELECT citizen_id, relative_id FROM new_relatives
+    ),
+    added_relatives AS (
+        SELECT citizen_id, relative_id FROM new_relatives
+        EXCEPT
+        SELECT citizen_id, relative_id FROM old_relatives
+    ),
+    -- Both directions of every edge, as separate rows
+    removed_edges AS (
+        SELECT citizen_id, relative_id FROM removed_relatives
+        UNION
+        SELECT relative_id, citizen_id FROM removed_relatives
+    ),
+    added_edges AS (
+        SELECT citizen_id, relative_id FROM added_relatives
+        UNION
+        SELECT relative_id, citizen_id FROM added_relatives
+    ),
+    -- Citizens of removed edges are matched by primary key condition, so only their relatives are read
+    deleted_relatives AS (
+        DELETE FROM public.relatives relatives_
+        USING removed_edges edge
+        WHERE relatives_.import_id = $1
+              AND relatives_.citizen_id = ANY(ARRAY(SELECT citizen_id FROM removed_edges))
+              AND relatives_.citizen_id = edge.citizen_id
+              AND relatives_.relative_id = edge.relative_id
+    ),
+    inserted_relatives AS (
+        INSERT INTO public.relatives (import_id, citizen_id, relative_id)
+        SELECT $1::int8, citizen_id, relative_id
+        FROM added_edges
+    ),
+    -- Every edge (citizen_id, relative_id) is a present in month of relative birthday, so presents
+    -- are adjusted by difference between new and old edges of updated citizens
+    old_edges AS (
+        SELECT citizen_id, relative_id
+        FROM public.relatives
+        WHERE import_id = $1 AND citizen_id = ANY($2::int8[])
+        UNION
+        SELECT relative_id, citizen_id
+        FROM public.relatives
+        WHERE import_id = $1 AND citizen_id = ANY($2::int8[])
+    ),
+    new_edges AS (
+        (SELECT citizen_id, relative_id FROM old_edges
+         EXCEPT
+         SELECT citizen_id, relative_id FROM removed_edges)
+        UNION
+        SELECT citizen_id, relative_id FROM added_edges
+    ),
+    presents_deltas AS (
+        SELECT edge.citizen_id, EXTRACT(MONTH FROM COALESCE(changes.birth_date, relative.birth_date))::int4 AS month,
+               1 delta
+        FROM new_edges edge
+             JOIN public.citizens relative ON relative.import_id = $1 AND relative.citizen_id = edge.relative_id
+             LEFT JOIN changes ON changes.citizen_id = edge.relative_id
+        UNION ALL
+        SELECT edge.citizen_id, EXTRACT(MONTH FROM relative.birth_date)::int4, -1
+        FROM old_edges edge
+             JOIN public.citizens relative ON relative.import_id = $1 AND relative.citizen_id = edge.relative_id
+    ),
+    updated_presents AS (
+        INSERT INTO public.presents_by_month (import_id, citizen_id, month, presents)
+        SELECT $1::int8, citizen_id, month, SUM(delta)
+        FROM presents_deltas
+        GROUP BY citizen_id, month
+        HAVING SUM(delta) <> 0
+        ON CONFLICT (import_id, citizen_id, month)
+        DO UPDATE SET presents = presents_by_month.presents + EXCLUDED.presents
+    ),
+    -- Citizens are moved from buckets of old towns and birth dates to buckets of new ones
+    town_birth_dates_deltas AS (
+        SELECT town, birth_date, 1 delta FROM updated_citizens
+        UNION ALL
+        SELECT town, birth_date, -1 FROM old_citizens
+    ),
+    updated_town_birth_dates AS (
+        INSERT INTO public.town_birth_dates (import_id, town, birth_date, citizens)
+        SELECT $1::int8, town, birth_date, SUM(delta)
+        FROM town_birth_dates_deltas
+        GROUP BY town, birth_date
+        HAVING SUM(delta) <> 0
+        ON CONFLICT (import_id, town, birth_date)
+        DO UPDATE SET citizens = town_birth_dates.citizens + EXCLUDED.citizens
+    ),
+    bumped_import AS (
+        UPDATE public.imports
+        SET version = nextval('imports_versions_seq')
+        WHERE import_id = $1 AND EXISTS (SELECT 1 FROM updated_citizens)
+        RETURNING import_id, version
+    )
+    SELECT ARRAY(SELECT citizen_id FROM updated_citizens) updated_citizens_ids,
+           (SELECT pg_notify($13, import_id || ':' || version) FROM bumped_import)
+    """
+)
 
-    async with conn.transaction():
 
-        await conn.execute(
-            """
-            UPDATE public.citizens
-            SET town = $1,
-                street = $2,
-                building = $3,
-                apartment = $4,
-                name = $5,
-                birth_date = $6,
-                gender = $7
-            WHERE import_id = $8 AND citizen_id = $9
-            """,
-            citizen_from_db.town,
-            citizen_from_db.street,
-            citizen_from_db.building,
-            citizen_from_db.apartment,
-            citizen_from_db.name,
-            citizen_from_db.birth_date,
-            citizen_from_db.gender,
-            import_id,
-            citizen_id
-        )
+SELECT_CITIZENS_BY_IDS = Statement(
+    "select_citizens_by_ids",
+    """
+    SELECT citizen_id,
+           town,
+           street,
+           building,
+           apartment,
+           name,
+           to_char(birth_date, 'DD.MM.YYYY') birth_date,
+           gender,
+           ARRAY(
+               SELECT relative_id
+               FROM public.relatives relatives
+               WHERE relatives.import_id = citizens.import_id
+                     AND relatives.citizen_id = citizens.citizen_id
+               ORDER BY relative_id
+           ) relatives
+    FROM public.citizens citizens
+    WHERE citizens.import_id = $1 AND citizens.citizen_id = ANY($2::int8[])
+    """
+)
 
-        # Relative information update
+
+async def update_citizens_data_batch(
+        conn: Connection,
+        import_id: int,
+        citizens: List[CitizenToUpdateInBatch]
+) -> List[Citizen]:
+    """
+    Обновляет в базе информацию о нескольких гражданах в одной транзакции, возвращает обновленную информацию.
+    Все граждане обновляются одним запросом, связи с родственниками меняются только для добавленных
+    и удаленных родственников. Родственники граждан из пачки должны быть согласованы между собой.
+    :param conn: asyncpg connection to database
+    :param import_id: id of upload from provider
+    :param citizens: citizens data for updating with their ids
+    :return: Updated citizens information in the same order
+    """
+    relatives_by_citizen: Dict[int, set] = dict()
+    for citizen in citizens:
         if citizen.relatives is not None:
-            await conn.execute(
-                """
-                DELETE
-                FROM public.relatives
-                WHERE (import_id = $1 AND citizen_id = $2)
-                      OR
-                      (import_id = $1 AND relative_id = $2)
-                """,
+            relatives_by_citizen[citizen.citizen_id] = set(citizen.relatives)
+            if len(relatives_by_citizen[citizen.citizen_id]) != len(citizen.relatives):
+                raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                    detail="Detected duplicated relative_id")
+
+    for citizen_id, relatives in relatives_by_citizen.items():
+        for relative_id in relatives:
+            if relative_id in relatives_by_citizen and citizen_id not in relatives_by_citizen[relative_id]:
+                raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                    detail="Relatives data is inconsistent")
+
+    new_relatives = [(citizen_id, relative_id)
+                     for citizen_id, relatives in relatives_by_citizen.items()
+                     for relative_id in relatives]
+
+    async with conn.transaction():
+        try:
+            updated_row = await UPDATE_CITIZENS_BATCH.fetchrow(
+                conn,
                 import_id,
-                citizen_id
+                [citizen.citizen_id for citizen in citizens],
+                [citizen.town for citizen in citizens],
+                [citizen.street for citizen in citizens],
+                [citizen.building for citizen in citizens],
+                [citizen.apartment for citizen in citizens],
+                [citizen.name for citizen in citizens],
+                [parse_birth_date(citizen.birth_date) if citizen.birth_date else None for citizen in citizens],
+                [citizen.gender for citizen in citizens],
+                list(relatives_by_citizen),
+                [citizen_id for citizen_id, _ in new_relatives],
+                [relative_id for _, relative_id in new_relatives],
+                IMPORT_VERSIONS_CHANNEL
             )
+        except ForeignKeyViolationError:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                detail=f"Found nonexistent relative import id = {import_id}")
+        except UniqueViolationError:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                detail="Detected duplicated relative_id")
 
-            if citizen.relatives:
-                update_for_relatives = list()
+        missing_citizens_ids = sorted(
+            {citizen.citizen_id for citizen in citizens} - set(updated_row["updated_citizens_ids"])
+        )
+        if missing_citizens_ids:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                detail=f"Citizens with ids = {missing_citizens_ids} "
+                                       f"are not presented in import id: {import_id}")
 
-                for relative_id in citizen.relatives:
+        citizens_rows = await SELECT_CITIZENS_BY_IDS.fetch(
+            conn, import_id, [citizen.citizen_id for citizen in citizens]
+        )
 
-                    if relative_id == citizen_id:
-                        update_for_relatives.append((import_id, citizen_id, relative_id))
-                    else:
-                        update_for_relatives.extend(
-                            [(import_id, citizen_id, relative_id),
-                             (import_id, relative_id, citizen_id)]
-                        )
+    citizens_rows_by_id = {citizen_row["citizen_id"]: citizen_row for citizen_row in citizens_rows}
+    return [Citizen.construct(dict(citizens_rows_by_id[citizen.citizen_id]), CITIZEN_FIELDS) for citizen in citizens]
 
-                try:
-                    _ = await conn.copy_records_to_table(
-                        table_name="relatives",
-                        records=update_for_relatives,
-                        columns=["import_id", "citizen_id", "relative_id"],
-                        schema_name="public"
-                    )
-                except ForeignKeyViolationError:
-                    raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
-                                        detail=f"Found nonexistent relative import id = {import_id}")
-                except UniqueViolationError:
-                    raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
-                                        detail="Detected duplicated relative_id")
 
-            citizen_from_db.relatives = citizen.relatives
-        citizen_from_db.birth_date = citizen_from_db.birth_date.strftime("%d.%m.%Y")
+SELECT_IMPORT_VERSION = Statement(
+    "select_import_version",
+    """
+    SELECT version
+    FROM public.imports
+    WHERE import_id = $1
+    """
+)
 
-        return citizen_from_db
 
+async def get_import_version(conn: Connection, import_id: int) -> Optional[int]:
+    """
+    Returns current version of import data
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :return: import version or None if import does not exist
+    """
 
-async def get_citizens_data(conn: Connection, import_id: int) -> List[Citizen]:
+    return await SELECT_IMPORT_VERSION.fetchval(conn, import_id)
 
+
+SELECT_IMPORT_HAS_CITIZENS = Statement(
+    "select_import_has_citizens",
     """
-    Возвращает список всех жителей для указанного набора данных.
+    SELECT EXISTS(
+        SELECT 1
+        FROM public.citizens
+        WHERE import_id = $1
+    )
+    """
+)
+
+
+async def check_import_has_citizens(conn: Connection, import_id: int) -> None:
+    """
+    Проверяет, что в наборе данных есть жители, до того как начнется отправка ответа
     :param conn: asyncpg connection
     :param import_id: id of upload from provider
-    :return: Citizens data with chosen import_id
+    :return:
     """
 
-    citizens: List[Citizen] = list()
-    citizens_rows = await conn.fetch(
-        """
-        SELECT citizens.citizen_id AS citizen_id_,
-               town,
-               street,
-               building,
-               apartment,
-               name,
-               birth_date,
-               gender,
-               array_agg(relative_id) relatives
-        FROM public.citizens citizens LEFT JOIN public.relatives relatives_
-        ON citizens.import_id = relatives_.import_id AND citizens.citizen_id = relatives_.citizen_id
-        WHERE citizens.import_id = $1
-        GROUP BY (citizens.citizen_id, town, street, building, apartment, name, birth_date, gender)
-        """,
-        import_id
-    )
-    if len(citizens_rows) == 0:
+    if not await SELECT_IMPORT_HAS_CITIZENS.fetchval(conn, import_id):
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
                             detail=f"There is no data with import id = {import_id}")
-    for citizen_row in citizens_rows:
-        citizens.append(Citizen(
-            citizen_id=citizen_row["citizen_id_"],
-            town=citizen_row["town"],
-            street=citizen_row["street"],
-            building=citizen_row["building"],
-            apartment=citizen_row["apartment"],
-            name=citizen_row["name"],
-            birth_date=citizen_row["birth_date"].strftime("%d.%m.%Y"),
-            gender=citizen_row["gender"],
-            relatives=citizen_row["relatives"] if citizen_row["relatives"][0] is not None else []
-    ))
-
-    return citizens
+
+
+SELECT_CITIZENS = Statement(
+    "select_citizens",
+    """
+    SELECT citizen_id,
+           town,
+           street,
+           building,
+           apartment,
+           name,
+           to_char(birth_date, 'DD.MM.YYYY') birth_date,
+           gender,
+           ARRAY(
+               SELECT relative_id
+               FROM public.relatives relatives
+               WHERE relatives.import_id = citizens.import_id
+                     AND relatives.citizen_id = citizens.citizen_id
+               ORDER BY relative_id
+           ) relatives
+    FROM public.citizens citizens
+    WHERE citizens.import_id = $1
+    ORDER BY citizen_id
+    """
+)
+
+
+async def iterate_citizens_json(conn: Connection, import_id: int) -> AsyncIterator[bytes]:
+    """
+    Возвращает по частям JSON со списком всех жителей для указанного набора данных:
+    строки читаются курсором на стороне сервера и сразу сериализуются в байты.
+    Ошибка о несуществующем import_id возникает до первой части ответа.
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :return: chunks of '{"data": [...]}' response body
+    """
+
+    async with conn.transaction():
+
+        cursor = await SELECT_CITIZENS.cursor(conn, import_id)
+
+        citizens_rows = await cursor.fetch(CITIZENS_STREAM_CHUNK_SIZE)
+        if len(citizens_rows) == 0:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                detail=f"There is no data with import id = {import_id}")
+
+        chunk_prefix = b'{"data":['
+        while citizens_rows:
+            citizens_json = json.dumps(
+                [{"citizen_id": citizen_row["citizen_id"],
+                  "town": citizen_row["town"],
+                  "street": citizen_row["street"],
+                  "building": citizen_row["building"],
+                  "apartment": citizen_row["apartment"],
+                  "name": citizen_row["name"],
+                  "birth_date": citizen_row["birth_date"],
+                  "gender": citizen_row["gender"],
+                  "relatives": citizen_row["relatives"]}
+                 for citizen_row in citizens_rows],
+                ensure_ascii=False,
+                separators=(",", ":")
+            )
+            # Brackets of serialized list are replaced with separators between chunks
+            yield chunk_prefix + citizens_json[1:-1].encode("utf-8")
+            chunk_prefix = b","
+            citizens_rows = await cursor.fetch(CITIZENS_STREAM_CHUNK_SIZE)
+
+        yield b"]}"
+
+
+SELECT_CITIZENS_JSON = Statement(
+    "select_citizens_json",
+    """
+    SELECT json_build_object(
+               'data',
+               json_agg(
+                   json_build_object(
+                       'citizen_id', citizen_id,
+                       'town', town,
+                       'street', street,
+                       'building', building,
+                       'apartment', apartment,
+                       'name', name,
+                       'birth_date', to_char(birth_date, 'DD.MM.YYYY'),
+                       'gender', gender,
+                       'relatives', ARRAY(
+                           SELECT relative_id
+                           FROM public.relatives relatives
+                           WHERE relatives.import_id = citizens.import_id
+                                 AND relatives.citizen_id = citizens.citizen_id
+                           ORDER BY relative_id
+                       )
+                   )
+                   ORDER BY citizen_id
+               )
+           )::text
+    FROM public.citizens citizens
+    WHERE citizens.import_id = $1
+    HAVING COUNT(*) > 0
+    """
+)
+
+
+async def get_citizens_json_from_database(conn: Connection, import_id: int) -> str:
+    """
+    Возвращает JSON со списком всех жителей для указанного набора данных, собранный в PostgreSQL
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :return: '{"data": [...]}' response body
+    """
+
+    citizens_json = await SELECT_CITIZENS_JSON.fetchval(conn, import_id)
+
+    if citizens_json is None:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"There is no data with import id = {import_id}")
+
+    return citizens_json
+
+
+SELECT_NUM_PRESENTS_BY_CITIZEN_PER_MONTH = Statement(
+    "select_num_presents_by_citizen_per_month",
+    """
+    SELECT citizen_id, month, presents
+    FROM public.presents_by_month
+    WHERE import_id = $1 AND presents > 0
+    ORDER BY month, citizen_id
+    """
+)
 
 
 async def get_num_presents_by_citizen_per_month(conn: Connection, import_id: int) -> Dict[int, List[Dict[int, int]]]:
     """
-    Возвращает жителей и количество подарков, которые они должны покупать помесячно
+    Возвращает жителей и количество подарков, которые они должны покупать помесячно.
+    Количество подарков читается из таблицы presents_by_month, которая заполняется при импорте
+    и изменяется при обновлении дат рождения и родственников.
     :param conn: asyncpg connection
     :param import_id: id of upload from provider
     :return: number of presents for every user per month
     """
 
-    num_presents_by_citizen_per_month_rows = await conn.fetch(
-        """
-        SELECT citizen_id_, month, COUNT(DISTINCT relative_id) num_birthdays
-        FROM
-            (SELECT citizens.citizen_id AS relative_id,
-                    relatives.relative_id AS citizen_id_,
-                    EXTRACT(MONTH from birth_date)::integer AS month
-            FROM public.citizens citizens LEFT JOIN public.relatives relatives
-            ON citizens.citizen_id = relatives.citizen_id AND citizens.import_id = relatives.import_id
-            WHERE citizens.import_id = $1) subquery
-        GROUP BY citizen_id_, month
-        """,
-        import_id
-    )
+    num_presents_by_citizen_per_month_rows = await SELECT_NUM_PRESENTS_BY_CITIZEN_PER_MONTH.fetch(conn, import_id)
 
     if len(num_presents_by_citizen_per_month_rows) == 0:
-        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
-                            detail=f"There is no data with import id = {import_id}")
+        await check_import_has_citizens(conn=conn, import_id=import_id)
 
     num_presents_by_citizen_per_month = defaultdict(list)
     for row in num_presents_by_citizen_per_month_rows:
-        if row["citizen_id_"] is not None:
-            num_presents_by_citizen_per_month[str(row["month"])].append(
-                {"citizen_id": row["citizen_id_"],
-                 "presents": row["num_birthdays"]}
-            )
+        num_presents_by_citizen_per_month[str(row["month"])].append(
+            {"citizen_id": row["citizen_id"],
+             "presents": row["presents"]}
+        )
 
     num_presents_by_citizen_per_month = dict(num_presents_by_citizen_per_month)
     for month_num in map(str, range(1, 12 + 1)):
@@ -304,6 +1009,116 @@ async def get_num_presents_by_citizen_per_month(conn: Connection, import_id: int
     return num_presents_by_citizen_per_month
 
 
+# Rows of binary COPY of (citizen_id int8, month int4): every row starts with number of fields,
+# and every value is preceded by its length
+RELATIVES_BIRTH_MONTHS_COPY_DTYPE = np.dtype([
+    ("num_fields", ">i2"),
+    ("citizen_id_length", ">i4"),
+    ("citizen_id", ">i8"),
+    ("month_length", ">i4"),
+    ("month", ">i4")
+])
+# Signature, flags field and header extension length precede rows, end of data marker follows them
+BINARY_COPY_HEADER_SIZE = 19
+BINARY_COPY_TRAILER_SIZE = 2
+
+
+async def get_num_presents_by_citizen_per_month_numpy(
+        conn: Connection,
+        import_id: int
+) -> Dict[str, List[Dict[str, int]]]:
+    """
+    Возвращает жителей и количество подарков, которые они должны покупать помесячно.
+    Родственные связи и месяцы рождения родственников читаются бинарным COPY в массивы NumPy,
+    и подарки по всем жителям и месяцам считаются одним bincount.
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :return: number of presents for every user per month
+    """
+
+    copy_chunks: List[bytes] = list()
+
+    async def collect_chunk(chunk: bytes) -> None:
+        copy_chunks.append(chunk)
+
+    await conn.copy_from_query(
+        """
+        SELECT relatives.citizen_id, EXTRACT(MONTH FROM relative.birth_date)::int4
+        FROM public.relatives relatives JOIN public.citizens relative
+        ON relative.import_id = relatives.import_id AND relative.citizen_id = relatives.relative_id
+        WHERE relatives.import_id = $1 AND relative.birth_date IS NOT NULL
+        """,
+        import_id,
+        output=collect_chunk,
+        format="binary"
+    )
+    copy_data = b"".join(copy_chunks)
+    header_extension_size = int.from_bytes(copy_data[BINARY_COPY_HEADER_SIZE - 4:BINARY_COPY_HEADER_SIZE], "big")
+    rows_offset = BINARY_COPY_HEADER_SIZE + header_extension_size
+    edges = np.frombuffer(
+        copy_data,
+        dtype=RELATIVES_BIRTH_MONTHS_COPY_DTYPE,
+        count=(len(copy_data) - rows_offset - BINARY_COPY_TRAILER_SIZE) // RELATIVES_BIRTH_MONTHS_COPY_DTYPE.itemsize,
+        offset=rows_offset
+    )
+
+    if len(edges) == 0:
+        await check_import_has_citizens(conn=conn, import_id=import_id)
+
+    # Citizens ids are replaced with their indices, so (citizen, month) pairs are dense keys of one bincount
+    citizens_ids, citizens_indices = np.unique(edges["citizen_id"], return_inverse=True)
+    presents = np.bincount(
+        citizens_indices * 12 + edges["month"] - 1,
+        minlength=len(citizens_ids) * 12
+    ).reshape(len(citizens_ids), 12)
+
+    num_presents_by_citizen_per_month = dict()
+    for month_index in range(12):
+        month_citizens_indices = np.flatnonzero(presents[:, month_index])
+        num_presents_by_citizen_per_month[str(month_index + 1)] = [
+            {"citizen_id": citizen_id, "presents": num_presents}
+            for citizen_id, num_presents in zip(citizens_ids[month_citizens_indices].tolist(),
+                                                presents[month_citizens_indices, month_index].tolist())
+        ]
+
+    return num_presents_by_citizen_per_month
+
+
+SELECT_CITIZENS_AGE_AND_TOWN = Statement(
+    "select_citizens_age_and_town",
+    """
+    SELECT EXTRACT(YEAR from age(timezone('utc', now()), birth_date))::int4 age, town
+    FROM public.citizens
+    WHERE import_id = $1
+    """
+)
+
+AGE_PERCENTILES = (0.5, 0.75, 0.99)
+
+
+def make_age_stats_by_town(ages: np.ndarray, towns: List[str]) -> List[AgeStatsByTown]:
+    """
+    Computes age stats (50, 75 and 99 percentile) of all towns at once
+    :param ages: age of every citizen
+    :param towns: town of every citizen
+    :return: age statistics by town
+    """
+
+    # Towns are coded in order of appearance by hashing, which is much faster than sorting of strings
+    towns_codes_by_name = {town: town_code for town_code, town in enumerate(dict.fromkeys(towns))}
+    towns_names = list(towns_codes_by_name)
+    towns_codes = np.fromiter(map(towns_codes_by_name.__getitem__, towns), dtype=np.int64, count=len(towns))
+    present_towns_codes, percentiles = grouped_quantiles(
+        values=ages,
+        group_codes=towns_codes,
+        quantiles=AGE_PERCENTILES
+    )
+    return [
+        AgeStatsByTown(town=towns_names[town_code], p50=p50, p75=p75, p99=p99)
+        for town_code, (p50, p75, p99) in zip(present_towns_codes.tolist(), np.round(percentiles, 2).tolist())
+    ]
+
+
 async def get_citizens_age_and_town(conn: Connection, import_id: int) -> List[AgeStatsByTown]:
 
     """
@@ -313,35 +1128,169 @@ async def get_citizens_age_and_town(conn: Connection, import_id: int) -> List[Ag
     :return: age statistics by town
     """
 
-    citizens_age_and_town = await conn.fetch(
-        """
-        SELECT EXTRACT(YEAR from age(timezone('utc', now()), birth_date)) age, town
+    citizens_age_and_town = await SELECT_CITIZENS_AGE_AND_TOWN.fetch(conn, import_id)
+
+    if len(citizens_age_and_town) == 0:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"There is no data with import id = {import_id}")
+
+    ages = np.fromiter((age for age, _ in citizens_age_and_town), dtype=np.int64, count=len(citizens_age_and_town))
+    return make_age_stats_by_town(ages=ages, towns=[town for _, town in citizens_age_and_town])
+
+
+SELECT_AGE_PERCENTILES_BY_TOWN = Statement(
+    "select_age_percentiles_by_town",
+    """
+    SELECT town, percentile_cont($2::float8[]) WITHIN GROUP (
+        ORDER BY EXTRACT(YEAR from age(timezone('utc', now()), birth_date))
+    ) percentiles
+    FROM public.citizens
+    WHERE import_id = $1
+    GROUP BY town
+    """
+)
+
+
+async def get_age_percentiles_by_town(conn: Connection, import_id: int) -> List[AgeStatsByTown]:
+
+    """
+    Returns age stats (50, 75 and 99 percentile) by town in selected import_id.
+    Percentiles are computed by database with percentile_cont, which interpolates linearly
+    between the same neighbour ages as np.percentile, so only results by town are fetched
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :return: age statistics by town
+    """
+
+    percentiles_by_town = await SELECT_AGE_PERCENTILES_BY_TOWN.fetch(conn, import_id, AGE_PERCENTILES)
+
+    if len(percentiles_by_town) == 0:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"There is no data with import id = {import_id}")
+
+    # Rounded in application as np.round does it, not by half away from zero rounding of database
+    return [
+        AgeStatsByTown(
+            town=town,
+            p50=float(round(np.float64(p50), 2)),
+            p75=float(round(np.float64(p75), 2)),
+            p99=float(round(np.float64(p99), 2))
+        )
+        for town, (p50, p75, p99) in percentiles_by_town
+    ]
+
+
+SELECT_TOWN_AGES_HISTOGRAM = Statement(
+    "select_town_ages_histogram",
+    """
+    SELECT town, EXTRACT(YEAR from age(timezone('utc', now()), birth_date))::int4 age, SUM(citizens)::int8 citizens
+    FROM public.town_birth_dates
+    WHERE import_id = $1
+    GROUP BY 1, 2
+    HAVING SUM(citizens) > 0
+    """
+)
+
+
+async def get_age_stats_from_histogram(conn: Connection, import_id: int) -> List[AgeStatsByTown]:
+
+    """
+    Returns age stats (50, 75 and 99 percentile) by town in selected import_id.
+    Ages as of today are derived from histogram of birth dates by town, and percentiles are interpolated
+    from cumulative numbers of citizens, so cost depends on number of distinct ages, not of citizens
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :return: age statistics by town
+    """
+
+    town_ages_histogram = await SELECT_TOWN_AGES_HISTOGRAM.fetch(conn, import_id)
+
+    if len(town_ages_histogram) == 0:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"There is no data with import id = {import_id}")
+
+    towns_names = sorted({town for town, _, _ in town_ages_histogram})
+    towns_codes_by_name = {town: town_code for town_code, town in enumerate(towns_names)}
+    present_towns_codes, percentiles = grouped_weighted_quantiles(
+        values=np.array([age for _, age, _ in town_ages_histogram], dtype=np.int64),
+        group_codes=np.array([towns_codes_by_name[town] for town, _, _ in town_ages_histogram], dtype=np.int64),
+        weights=np.array([num_citizens for _, _, num_citizens in town_ages_histogram], dtype=np.int64),
+        quantiles=AGE_PERCENTILES
+    )
+    return [
+        AgeStatsByTown(town=towns_names[town_code], p50=p50, p75=p75, p99=p99)
+        for town_code, (p50, p75, p99) in zip(present_towns_codes.tolist(), np.round(percentiles, 2).tolist())
+    ]
+
+
+async def get_age_stats_by_dimensions(
+        conn: Connection,
+        import_id: int,
+        breakdowns: List[Tuple[str, ...]],
+        quantiles: List[float]
+) -> List[AgeStatsBreakdown]:
+
+    """
+    Returns age percentiles of citizens grouped by every breakdown in selected import_id.
+    All breakdowns are computed in one scan of citizens of import with GROUPING SETS,
+    rows of every grouping set are told apart by GROUPING bit mask of grouped dimensions
+    :param conn: asyncpg connection
+    :param import_id: id of upload from provider
+    :param breakdowns: distinct tuples of dimensions from AGE_STATS_DIMENSIONS, empty tuple is all citizens
+    :param quantiles: quantiles to compute, from 0 to 1
+    :return: age statistics of groups of every breakdown
+    """
+
+    # Query text depends on requested dimensions, so it is not registered statement.
+    # Dimensions are whitelisted column names, values are passed as parameters
+    dimensions = [dimension for dimension in AGE_STATS_DIMENSIONS
+                  if any(dimension in breakdown for breakdown in breakdowns)]
+    grouping_mask_column = f"GROUPING({', '.join(dimensions)})" if dimensions else "0"
+    dimensions_columns = "".join(f"{dimension}, " for dimension in dimensions)
+    grouping_sets = ", ".join(f"({', '.join(breakdown)})" for breakdown in breakdowns)
+    age_stats_rows = await conn.fetch(
+        f"""
+        SELECT {grouping_mask_column} grouping_mask,
+               {dimensions_columns}
+               percentile_cont($2::float8[]) WITHIN GROUP (
+                   ORDER BY EXTRACT(YEAR from age(timezone('utc', now()), birth_date))
+               ) percentiles
         FROM public.citizens
         WHERE import_id = $1
+        GROUP BY GROUPING SETS ({grouping_sets})
+        ORDER BY {dimensions_columns}1
         """,
-        import_id
+        import_id,
+        quantiles
     )
 
-    if len(citizens_age_and_town) == 0:
+    # Grouping set of all citizens has one row even if there are no citizens
+    if all(age_stats_row["percentiles"] is None for age_stats_row in age_stats_rows):
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
                             detail=f"There is no data with import id = {import_id}")
-    ages_by_town = defaultdict(list)
-    for age_as_string, town in citizens_age_and_town:
-        ages_by_town[town].append(int(age_as_string))
-
-    age_stats_by_town: List[AgeStatsByTown] = list()
-
-    for town in ages_by_town:
-        age_stats_by_town.append(
-            AgeStatsByTown(
-                town=town,
-                p50=float(round(np.percentile(ages_by_town[town], q=50, interpolation="linear"), 2)),
-                p75=float(round(np.percentile(ages_by_town[town], q=75, interpolation="linear"), 2)),
-                p99=float(round(np.percentile(ages_by_town[town], q=99, interpolation="linear"), 2))
+
+    # Bit of dimension in GROUPING mask is set when rows are not grouped by it, the first dimension is high bit
+    breakdowns_by_grouping_mask = {
+        sum(1 << (len(dimensions) - 1 - dimension_num)
+            for dimension_num, dimension in enumerate(dimensions) if dimension not in breakdown): breakdown
+        for breakdown in breakdowns
+    }
+    groups_by_breakdown = {breakdown: list() for breakdown in breakdowns}
+    percentiles_names = [f"p{quantile * 100:g}" for quantile in quantiles]
+
+    for age_stats_row in age_stats_rows:
+        breakdown = breakdowns_by_grouping_mask[age_stats_row["grouping_mask"]]
+        groups_by_breakdown[breakdown].append(
+            AgeStatsGroup(
+                dimensions={dimension: age_stats_row[dimension] for dimension in breakdown},
+                percentiles=dict(zip(percentiles_names, np.round(age_stats_row["percentiles"], 2).tolist()))
             )
         )
 
-    return age_stats_by_town
+    return [
+        AgeStatsBreakdown(breakdown=list(breakdown), groups=groups)
+        for breakdown, groups in groups_by_breakdown.items()
+    ]
 
 
 async def clear_db(conn: Connection) -> None:
@@ -355,15 +1304,13 @@ async def clear_db(conn: Connection) -> None:
 
         await conn.execute(
             """
-            DELETE
-            FROM public.relatives
+            TRUNCATE public.import_jobs RESTART IDENTITY
             """
         )
 
         await conn.execute(
             """
-            DELETE
-            FROM public.citizens
+            TRUNCATE public.relatives, public.citizens, public.presents_by_month, public.town_birth_dates, public.imports
             """
         )
 
@@ -372,3 +1319,5 @@ async def clear_db(conn: Connection) -> None:
             ALTER SEQUENCE imports_seq RESTART WITH 1;
             """
         )
+
+        await conn.execute("SELECT pg_notify($1, 'reset')", IMPORT_VERSIONS_CHANNEL)
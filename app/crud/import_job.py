@@ -0,0 +1,177 @@
+from typing import Optional
+
+from asyncpg import Connection
+from starlette.exceptions import HTTPException
+from starlette.status import HTTP_400_BAD_REQUEST
+
+from app.db.statements import Statement
+from app.models.import_job import ImportJob, ImportJobState
+
+IMPORT_INTERRUPTED_ERROR = "Import was interrupted"
+
+
+# Job is locked with session advisory lock of owner process connection while it is queued or running,
+# so jobs of stopped processes can be told from live ones
+INSERT_IMPORT_JOB = Statement(
+    "insert_import_job",
+    """
+    WITH created_job AS (
+        INSERT INTO public.import_jobs (state, num_citizens)
+        VALUES ($1, $2)
+        RETURNING job_id
+    )
+    SELECT job_id, pg_advisory_lock(hashtext('import_jobs'), (job_id % 2147483647)::int4)
+    FROM created_job
+    """
+)
+
+
+async def create_import_job(conn: Connection, num_citizens: int) -> int:
+    """
+    Registers new import job in queued state and locks it for connection session
+    :param conn: dedicated connection of job queue, which keeps job lock until job is released
+    :param num_citizens: number of citizens to import
+    :return: generated job id
+    """
+
+    return await INSERT_IMPORT_JOB.fetchval(conn, ImportJobState.queued.value, num_citizens)
+
+
+RELEASE_IMPORT_JOB = Statement(
+    "release_import_job",
+    """
+    SELECT pg_advisory_unlock(hashtext('import_jobs'), ($1 % 2147483647)::int4)
+    """
+)
+
+
+async def release_import_job(conn: Connection, job_id: int) -> None:
+    """
+    Releases lock of finished import job
+    :param conn: connection which created import job
+    :param job_id: import job id
+    :return:
+    """
+
+    await RELEASE_IMPORT_JOB.execute(conn, job_id)
+
+
+FAIL_INTERRUPTED_IMPORT_JOBS = Statement(
+    "fail_interrupted_import_jobs",
+    """
+    UPDATE public.import_jobs
+    SET state = $1,
+        error = $2
+    WHERE state IN ($3, $4)
+          AND pg_try_advisory_xact_lock(hashtext('import_jobs'), (job_id % 2147483647)::int4)
+    """
+)
+
+
+async def fail_interrupted_import_jobs(conn: Connection) -> None:
+    """
+    Marks as failed queued and running jobs, which are not locked by any process
+    :param conn: asyncpg connection
+    :return:
+    """
+
+    await FAIL_INTERRUPTED_IMPORT_JOBS.execute(
+        conn,
+        ImportJobState.failed.value,
+        IMPORT_INTERRUPTED_ERROR,
+        ImportJobState.queued.value,
+        ImportJobState.running.value
+    )
+
+
+UPDATE_IMPORT_JOB_STATE = Statement(
+    "update_import_job_state",
+    """
+    UPDATE public.import_jobs
+    SET state = $2,
+        import_id = $3,
+        error = $4,
+        num_imported = CASE WHEN $2::varchar = 'done' THEN num_citizens ELSE num_imported END
+    WHERE job_id = $1
+    """
+)
+
+
+async def set_import_job_state(
+        conn: Connection,
+        job_id: int,
+        state: ImportJobState,
+        import_id: Optional[int] = None,
+        error: Optional[str] = None
+) -> None:
+    """
+    Changes import job state, done jobs get import_id and failed jobs get error description
+    :param conn: asyncpg connection
+    :param job_id: import job id
+    :param state: new job state
+    :param import_id: id of upload created by job
+    :param error: reason of job failure
+    :return:
+    """
+
+    await UPDATE_IMPORT_JOB_STATE.execute(conn, job_id, state.value, import_id, error)
+
+
+UPDATE_IMPORT_JOB_PROGRESS = Statement(
+    "update_import_job_progress",
+    """
+    UPDATE public.import_jobs
+    SET num_imported = $2
+    WHERE job_id = $1
+    """
+)
+
+
+async def update_import_job_progress(conn: Connection, job_id: int, num_imported: int) -> None:
+    """
+    Saves number of citizens already copied by import job
+    :param conn: asyncpg connection
+    :param job_id: import job id
+    :param num_imported: number of copied citizens
+    :return:
+    """
+
+    await UPDATE_IMPORT_JOB_PROGRESS.execute(conn, job_id, num_imported)
+
+
+SELECT_IMPORT_JOB = Statement(
+    "select_import_job",
+    """
+    SELECT job_id, state, num_citizens, num_imported, import_id, error
+    FROM public.import_jobs
+    WHERE job_id = $1
+    """
+)
+
+
+async def get_import_job(conn: Connection, job_id: int) -> ImportJob:
+    """
+    Returns import job state and progress
+    :param conn: asyncpg connection
+    :param job_id: import job id
+    :return: import job information
+    """
+
+    job_row = await SELECT_IMPORT_JOB.fetchrow(conn, job_id)
+
+    if job_row is None:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"There is no import job with id = {job_id}")
+
+    if job_row["num_citizens"] == 0:
+        progress = 1.0 if job_row["state"] == ImportJobState.done.value else 0.0
+    else:
+        progress = round(job_row["num_imported"] / job_row["num_citizens"], 4)
+
+    return ImportJob(
+        job_id=job_row["job_id"],
+        state=job_row["state"],
+        progress=progress,
+        import_id=job_row["import_id"],
+        error=job_row["error"]
+    )
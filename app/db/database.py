@@ -1,12 +1,144 @@
+import re
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from asyncpg import Connection
 from asyncpg.pool import Pool
 
+from app.core.config import SHARDS_DATABASE_URLS, SHARDS_POLICY
+from .statements import Statement
+
+# Header with position of the last write of client in WAL of primary: it is returned by writes
+# and is passed back by client to reads, which must see the write
+READ_AFTER_LSN_HEADER = "X-Read-After-LSN"
+LSN_PATTERN = re.compile("[0-9A-F]{1,8}/[0-9A-F]{1,8}", re.IGNORECASE)
+
+SELECT_WRITE_LSN = Statement(
+    "select_write_lsn",
+    """
+    SELECT pg_current_wal_insert_lsn()::text
+    """
+)
+
+# Server which is not in recovery is primary itself, and it has all its writes
+SELECT_LSN_IS_REPLAYED = Statement(
+    "select_lsn_is_replayed",
+    """
+    SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_insert_lsn() END
+           >= $1::text::pg_lsn
+    """
+)
+
 
 class DataBase:
-    pool: Pool = None
+    """
+    Connection pools of primary database and of its read replicas. Writes and reads which
+    must not lag behind primary acquire connections from primary pool, read-only endpoints
+    acquire them by acquire_for_read.
+    """
+
+    def __init__(self):
+        self.pool: Optional[Pool] = None
+        self.replica_pools: List[Pool] = list()
+        # Number of connections acquired and being acquired from every replica pool
+        self._replica_loads: List[int] = list()
+
+    def set_replica_pools(self, replica_pools: List[Pool]) -> None:
+        self.replica_pools = replica_pools
+        self._replica_loads = [0] * len(replica_pools)
+
+    @asynccontextmanager
+    async def acquire_for_read(
+            self,
+            min_lsn: Optional[str] = None,
+            is_fresh: Optional[Callable[[Connection], Awaitable[bool]]] = None
+    ) -> AsyncIterator[Connection]:
+        """
+        Acquires connection of the least loaded replica, which has replayed WAL of primary up to min_lsn
+        and passes is_fresh check, or connection of primary if there is no such replica
+        :param min_lsn: position in WAL of primary, which replica must have replayed
+        :param is_fresh: additional check of replica connection
+        :return: connection
+        """
+        for replica_num in sorted(range(len(self.replica_pools)), key=self._replica_loads.__getitem__):
+            self._replica_loads[replica_num] += 1
+            try:
+                async with self.replica_pools[replica_num].acquire() as conn:
+                    if ((min_lsn is None or await SELECT_LSN_IS_REPLAYED.fetchval(conn, min_lsn))
+                            and (is_fresh is None or await is_fresh(conn))):
+                        yield conn
+                        return
+            finally:
+                self._replica_loads[replica_num] -= 1
+
+        async with self.pool.acquire() as conn:
+            yield conn
 
+    async def get_write_lsn(self, conn: Optional[Connection] = None) -> str:
+        """
+        Returns current position in WAL of primary, which is not before any committed write
+        :param conn: primary connection, is acquired from primary pool if it is not passed
+        :return: position in WAL as text
+        """
+        if conn is not None:
+            return await SELECT_WRITE_LSN.fetchval(conn)
+        async with self.pool.acquire() as conn:
+            return await SELECT_WRITE_LSN.fetchval(conn)
 
+
+class ShardedDataBase:
+    """
+    Databases of shards. Every import is stored in one shard, which generates its id from own sequence
+    as sequence value * number of shards + number of shard, so shard of import is import_id modulo
+    number of shards. Shard of new import is chosen by policy: "round_robin" or "least_loaded".
+    """
+
+    def __init__(self, shards: List[DataBase], policy: str):
+        self.shards = shards
+        self.policy = policy
+        self._next_shard_num = 0
+        # Number of imports being written to every shard by process
+        self._imports_in_progress = [0] * len(shards)
+
+    def for_import(self, import_id: int) -> DataBase:
+        return self.shards[import_id % len(self.shards)]
+
+    @asynccontextmanager
+    async def acquire_for_new_import(self) -> AsyncIterator[Tuple[Connection, int]]:
+        """
+        Acquires primary connection of shard chosen for new import
+        :return: connection and number of shard
+        """
+        shard_num = self._choose_shard_num()
+        self._imports_in_progress[shard_num] += 1
+        try:
+            async with self.shards[shard_num].pool.acquire() as conn:
+                yield conn, shard_num
+        finally:
+            self._imports_in_progress[shard_num] -= 1
+
+    def _choose_shard_num(self) -> int:
+        # Shards are taken in turn, least loaded policy takes the first one with the least imports in progress
+        shards_nums = [(self._next_shard_num + shard_offset) % len(self.shards)
+                       for shard_offset in range(len(self.shards))]
+        shard_num = shards_nums[0]
+        if self.policy == "least_loaded":
+            shard_num = min(shards_nums, key=self._imports_in_progress.__getitem__)
+        self._next_shard_num = (shard_num + 1) % len(self.shards)
+        return shard_num
+
+
+# Database of the first shard
 db = DataBase()
+sharded_db = ShardedDataBase(
+    shards=[db] + [DataBase() for _ in SHARDS_DATABASE_URLS[1:]],
+    policy=SHARDS_POLICY
+)
 
 
 async def get_database():
     return db
+
+
+async def get_sharded_database():
+    return sharded_db
@@ -1,19 +1,52 @@
 import logging
 
 import asyncpg
-
-from app.core.config import DATABASE_URL, MAX_CONNECTIONS_COUNT, MIN_CONNECTIONS_COUNT
-from .database import db
+from asyncpg.pool import Pool
+from databases import DatabaseURL
+
+from app.core.config import (
+    DATABASE_URL,
+    MAX_CONNECTIONS_COUNT,
+    MIN_CONNECTIONS_COUNT,
+    PGBOUNCER_TRANSACTION_MODE,
+    REPLICA_DATABASE_URLS,
+    SHARDS_DATABASE_URLS
+)
+from .database import db, sharded_db
+from .statements import prepare_statements
+
+
+async def create_pool(database_url: DatabaseURL) -> Pool:
+    if PGBOUNCER_TRANSACTION_MODE:
+        # Server connection may change between transactions, so statements can not be kept prepared
+        return await asyncpg.create_pool(
+            str(database_url),
+            min_size=MIN_CONNECTIONS_COUNT,
+            max_size=MAX_CONNECTIONS_COUNT,
+            statement_cache_size=0,
+        )
+
+    return await asyncpg.create_pool(
+        str(database_url),
+        min_size=MIN_CONNECTIONS_COUNT,
+        max_size=MAX_CONNECTIONS_COUNT,
+        init=prepare_statements,
+    )
 
 
 async def connect_to_postgres():
     logging.info(f"Connecting to database with url: {DATABASE_URL}")
 
-    db.pool = await asyncpg.create_pool(
-        str(DATABASE_URL),
-        min_size=MIN_CONNECTIONS_COUNT,
-        max_size=MAX_CONNECTIONS_COUNT,
-    )
+    db.pool = await create_pool(DATABASE_URL)
+    for shard, shard_database_url in zip(sharded_db.shards[1:], SHARDS_DATABASE_URLS[1:]):
+        logging.info(f"Connecting to shard database with url: {shard_database_url}")
+        shard.pool = await create_pool(shard_database_url)
+
+    replica_pools = list()
+    for replica_database_url in REPLICA_DATABASE_URLS:
+        logging.info(f"Connecting to replica database with url: {replica_database_url}")
+        replica_pools.append(await create_pool(replica_database_url))
+    db.set_replica_pools(replica_pools)
 
     logging.info("Connected to database")
 
@@ -21,6 +54,10 @@ async def connect_to_postgres():
 async def close_postgres_connection():
     logging.info("Closing connection")
 
-    await db.pool.close()
+    for replica_pool in db.replica_pools:
+        await replica_pool.close()
+    db.set_replica_pools(list())
+    for shard in sharded_db.shards:
+        await shard.pool.close()
 
     logging.info("Connection closed")
@@ -0,0 +1,49 @@
+from typing import Any, Dict, List, Optional
+
+from asyncpg import Connection, Record
+from asyncpg.cursor import CursorFactory
+
+# All service statements by name, filled when crud modules are imported
+STATEMENTS: Dict[str, "Statement"] = dict()
+
+
+class Statement:
+    """
+    SQL statement of service. Statements are prepared on every pool connection when it is created,
+    so queries find them in connection statement cache and are not parsed and planned on first use.
+    """
+
+    def __init__(self, name: str, sql: str):
+        if name in STATEMENTS:
+            raise ValueError(f"Statement {name} is already registered")
+        self.name = name
+        self.sql = sql
+        STATEMENTS[name] = self
+
+    async def fetch(self, conn: Connection, *args) -> List[Record]:
+        return await conn.fetch(self.sql, *args)
+
+    async def fetchrow(self, conn: Connection, *args) -> Optional[Record]:
+        return await conn.fetchrow(self.sql, *args)
+
+    async def fetchval(self, conn: Connection, *args) -> Any:
+        return await conn.fetchval(self.sql, *args)
+
+    async def execute(self, conn: Connection, *args) -> str:
+        return await conn.execute(self.sql, *args)
+
+    def cursor(self, conn: Connection, *args) -> CursorFactory:
+        return conn.cursor(self.sql, *args)
+
+
+async def prepare_statements(conn: Connection) -> None:
+    """
+    Prepares all registered statements into connection statement cache, is used as init hook of connection pool.
+    Prepared statement handles are bound to the pool acquisition they were created in, so statements are put
+    into the cache asyncpg uses for plain queries instead.
+    Statements are prepared inside transaction: otherwise locks taken while statements
+    are described are kept until the next query on the connection.
+    """
+    async with conn.transaction():
+        for statement in STATEMENTS.values():
+            await conn._get_statement(statement.sql, None)
@@ -1,44 +1,88 @@
+import asyncio
 import os
-from typing import List
+from datetime import datetime
+from typing import AsyncContextManager, AsyncIterator, List, Optional, Tuple
 
-from fastapi import Body, Depends, FastAPI, HTTPException, Path
+from asyncpg import Connection
+from fastapi import Body, Depends, FastAPI, HTTPException, Path, Query
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from starlette.requests import Request
-from starlette.responses import JSONResponse, PlainTextResponse
-from starlette.status import HTTP_201_CREATED, HTTP_200_OK, HTTP_400_BAD_REQUEST
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_202_ACCEPTED,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_400_BAD_REQUEST,
+    HTTP_503_SERVICE_UNAVAILABLE
+)
 
 from app.core.config import (
+    AGE_STATS_ENGINE,
+    BIRTHDAYS_ENGINE,
+    CITIZENS_LISTING_ENGINE,
     IMPORT_ENDPOINT_QUERY_BODY_EXAMPLE,
     IMPORT_ID_DESCRIPTION,
     IMPORT_RESPONSE_201_EXAMPLE,
+    IMPORT_JOB_RESPONSE_202_EXAMPLE,
+    GET_IMPORT_JOB_RESPONSE_200_EXAMPLE,
     PATCH_ENDPOINT_QUERY_BODY_EXAMPLE,
     PATCH_RESPONSE_200_EXAMPLE,
+    PATCH_BATCH_ENDPOINT_QUERY_BODY_EXAMPLE,
+    PATCH_BATCH_RESPONSE_200_EXAMPLE,
     GET_CITIZENS_RESPONSE_200_EXAMPLE,
     GET_CITIZENS_AND_NUM_PRESENTS_RESPONSE_200_EXAMPLE,
+    GET_AGE_STATS_200_EXAMPLE,
     GET_AGE_STATS_BY_TOWN_200_EXAMPLE,
     RESET_DATABASE_RESPONSE_200_EXAMPLE
 )
 from app.crud.citizen import (
-    get_citizens_data,
+    check_import_has_citizens,
+    get_citizens_json_from_database,
+    get_import_version,
     insert_citizens_data,
+    insert_citizens_data_from_stream,
+    iterate_citizens_json,
+    get_age_percentiles_by_town,
+    get_age_stats_by_dimensions,
+    get_age_stats_from_histogram,
     get_citizens_age_and_town,
     update_citizens_data,
+    update_citizens_data_batch,
     get_num_presents_by_citizen_per_month,
+    get_num_presents_by_citizen_per_month_numpy,
     clear_db
 )
-from app.db.database import get_database, DataBase
+from app.core.cache import CacheKey, etag_matches, import_versions, make_etag, response_cache
+from app.core.coalescer import citizen_updates_coalescer
+from app.core.jobs import import_job_queue
+from app.crud.import_job import get_import_job
+from app.db.database import (
+    LSN_PATTERN,
+    READ_AFTER_LSN_HEADER,
+    get_database,
+    get_sharded_database,
+    DataBase,
+    ShardedDataBase
+)
 from app.db.db_utils import connect_to_postgres, close_postgres_connection
 from app.models.citizen import (
+    AGE_STATS_DIMENSIONS,
     AdminCredentials,
+    AgeStatsInResponse,
     AgeStatsByTown,
     AgeStatsByTownInResponse,
     Citizen,
     CitizensToImport,
+    CitizensStreamError,
     CitizenInResponse,
     CitizenToUpdate,
-    SomeCitizensInResponse
+    CitizensToUpdate,
+    SomeCitizensInResponse,
+    parse_citizens_ndjson
 )
+from app.models.import_job import ImportJobInResponse
 
 app = FastAPI(
     docs_url="/",
@@ -46,6 +90,11 @@ app = FastAPI(
     description="REST API service as entrance test in Yandex backend school"
 )
 app.add_event_handler("startup", connect_to_postgres)
+app.add_event_handler("startup", import_job_queue.start)
+app.add_event_handler("startup", import_versions.start)
+app.add_event_handler("shutdown", import_versions.stop)
+app.add_event_handler("shutdown", import_job_queue.stop)
+app.add_event_handler("shutdown", citizen_updates_coalescer.stop)
 app.add_event_handler("shutdown", close_postgres_connection)
 
 
@@ -54,13 +103,95 @@ async def validation_exception_handler(request: Request, exception: Exception):
     return PlainTextResponse(str(exception), status_code=HTTP_400_BAD_REQUEST)
 
 
+async def get_current_import_version(db: DataBase, import_id: int) -> Optional[int]:
+    """
+    Returns current version of import. Version is read from database
+    only when it is not known by current process yet.
+    :return: import version or None if import does not exist
+    """
+    version = import_versions.get(import_id)
+    if version is None:
+        epoch = import_versions.epoch
+        async with db.pool.acquire() as conn:
+            version = await get_import_version(conn=conn, import_id=import_id)
+        if version is not None:
+            import_versions.remember(import_id=import_id, version=version, epoch=epoch)
+
+    return version
+
+
+def get_response_cache_key(endpoint: str, import_id: int, version: Optional[int], *key_parts) -> Optional[CacheKey]:
+    """
+    Cached responses are used only while import versions are updated by notifications,
+    otherwise entries of other processes could outlive database reset
+    :return: cache key or None if response should not be cached
+    """
+    if not response_cache.enabled or version is None or not import_versions.listening:
+        return None
+    return (endpoint, import_id, version) + key_parts
+
+
+def cached_or_not_modified_response(
+        request: Request,
+        etag: Optional[str],
+        cache_key: Optional[CacheKey]
+) -> Optional[Response]:
+    """
+    Answers conditional request with 304 or returns cached response body
+    :return: response or None if response should be built from database
+    """
+    if etag is None:
+        return None
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    cached_body = response_cache.get(cache_key)
+    if cached_body is None:
+        return None
+    return Response(cached_body, status_code=HTTP_200_OK, headers={"ETag": etag}, media_type="application/json")
+
+
+def acquire_for_import_read(
+        db: DataBase,
+        request: Request,
+        import_id: int,
+        version: Optional[int]
+) -> AsyncContextManager[Connection]:
+    """
+    Acquires connection to read import data. Replica is used only if it has replayed the last write of client
+    and has the same version of import, so response matches its entity tag and is cached under right version
+    :return: context manager of replica or primary connection
+    """
+    read_after_lsn = request.headers.get(READ_AFTER_LSN_HEADER)
+    if read_after_lsn is not None and LSN_PATTERN.fullmatch(read_after_lsn) is None:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail=f"{READ_AFTER_LSN_HEADER} header is invalid")
+
+    async def has_import_version(conn: Connection) -> bool:
+        return await get_import_version(conn=conn, import_id=import_id) == version
+
+    return db.acquire_for_read(min_lsn=read_after_lsn, is_fresh=has_import_version)
+
+
+async def set_read_after_lsn(db: DataBase, response: Response, conn: Optional[Connection] = None) -> None:
+    """
+    Returns position of write in WAL of primary to client, so its next reads are not served by replicas
+    which have not replayed the write yet. Is needed only when there are replicas
+    """
+    if db.replica_pools:
+        response.headers[READ_AFTER_LSN_HEADER] = await db.get_write_lsn(conn)
+
+
 @app.post(
     "/imports",
     summary="Import citizens to database",
     status_code=HTTP_201_CREATED,
     responses={HTTP_201_CREATED: {"description": "Created session import ID",
                                   "content": IMPORT_RESPONSE_201_EXAMPLE},
-               HTTP_400_BAD_REQUEST: {"description": "Request failed validation"}}
+               HTTP_202_ACCEPTED: {"description": "Import job ID (with async_mode)",
+                                   "content": IMPORT_JOB_RESPONSE_202_EXAMPLE},
+               HTTP_400_BAD_REQUEST: {"description": "Request failed validation"},
+               HTTP_503_SERVICE_UNAVAILABLE: {"description": "Import jobs queue is full"}}
 )
 async def import_citizens_data(
         *,
@@ -68,7 +199,11 @@ async def import_citizens_data(
             ...,
             example=IMPORT_ENDPOINT_QUERY_BODY_EXAMPLE
         ),
-        db: DataBase = Depends(get_database)
+        async_mode: bool = Query(
+            False,
+            description="Return import job ID right away and import citizens in background"
+        ),
+        sharded_db: ShardedDataBase = Depends(get_sharded_database)
 ):
     """
     Imports information about citizens in database
@@ -82,15 +217,106 @@ async def import_citizens_data(
     - **birth_date**: person's birth date (format: 'dd.mm.YY', must be earlier than current date)
     - **gender**: person's gender
     - **relatives**: list of person's relatives' citizen ids (if A is B's relative then B is A's relative)
+
+    With **async_mode** import is put to background queue, its state can be requested
+    at **/imports/jobs/{job_id}**.
     """
 
     citizens = citizens_to_import.citizens
 
+    if async_mode:
+        if import_job_queue.full():
+            raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Import jobs queue is full")
+
+        try:
+            job_id: int = await import_job_queue.submit(citizens=citizens)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Import jobs queue is full")
+
+        return JSONResponse(jsonable_encoder({"data": {"job_id": job_id}}),
+                            status_code=HTTP_202_ACCEPTED)
+
+    async with sharded_db.acquire_for_new_import() as (conn, shard_num):
+
+        gen_import_id: int = await insert_citizens_data(conn=conn, citizens=citizens,
+                                                        shard_num=shard_num, num_shards=len(sharded_db.shards))
+        response = JSONResponse(jsonable_encoder({"data": {"import_id": gen_import_id}}),
+                                status_code=HTTP_201_CREATED)
+        await set_read_after_lsn(sharded_db.shards[shard_num], response, conn)
+        return response
+
+
+@app.get(
+    "/imports/jobs/{job_id}",
+    summary="Get state of background import job",
+    response_model=ImportJobInResponse,
+    responses={HTTP_200_OK: {"description": "Import job state, progress and created import ID",
+                             "content": GET_IMPORT_JOB_RESPONSE_200_EXAMPLE},
+               HTTP_400_BAD_REQUEST: {"description": "Requested import job ID does not exist"}}
+)
+async def get_import_job_state(
+        *,
+        job_id: int = Path(
+            ...,
+            title="The ID of import job",
+            ge=1
+        ),
+        db: DataBase = Depends(get_database)
+):
+    """
+    Returns state of import job started by **/imports** with async_mode
+
+    - **state**: queued, running, done or failed
+    - **progress**: share of citizens already copied to database
+    - **import_id**: created import session ID (when job is done)
+    - **error**: reason of failure (when job is failed)
+    """
+
     async with db.pool.acquire() as conn:
+        import_job = await get_import_job(conn=conn, job_id=job_id)
+
+        return JSONResponse(jsonable_encoder(ImportJobInResponse(data=import_job)),
+                            status_code=HTTP_200_OK)
+
+
+@app.post(
+    "/imports/stream",
+    summary="Import citizens to database from NDJSON stream",
+    status_code=HTTP_201_CREATED,
+    responses={HTTP_201_CREATED: {"description": "Created session import ID",
+                                  "content": IMPORT_RESPONSE_201_EXAMPLE},
+               HTTP_400_BAD_REQUEST: {"description": "Request failed validation"}}
+)
+async def import_citizens_data_stream(
+        *,
+        request: Request,
+        sharded_db: ShardedDataBase = Depends(get_sharded_database)
+):
+    """
+    Imports information about citizens in database from NDJSON body (one citizen object per line).
+    Citizens are parsed and copied to database in batches while body is being read,
+    so memory usage does not depend on upload size. Citizen fields are the same as for **/imports**.
+    """
+
+    async with sharded_db.acquire_for_new_import() as (conn, shard_num):
+
+        try:
+            gen_import_id: int = await insert_citizens_data_from_stream(
+                conn=conn,
+                citizens=parse_citizens_ndjson(request.stream()),
+                shard_num=shard_num,
+                num_shards=len(sharded_db.shards)
+            )
+        except CitizensStreamError as exception:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                detail=str(exception))
 
-        gen_import_id: int = await insert_citizens_data(conn=conn, citizens=citizens)
-        return JSONResponse(jsonable_encoder({"data": {"import_id": gen_import_id}}),
-                            status_code=HTTP_201_CREATED)
+        response = JSONResponse(jsonable_encoder({"data": {"import_id": gen_import_id}}),
+                                status_code=HTTP_201_CREATED)
+        await set_read_after_lsn(sharded_db.shards[shard_num], response, conn)
+        return response
 
 
 @app.patch(
@@ -120,7 +346,7 @@ async def patch_citizens_data(
             title="Citizen's data to update",
             example=PATCH_ENDPOINT_QUERY_BODY_EXAMPLE
         ),
-        db: DataBase = Depends(get_database)
+        sharded_db: ShardedDataBase = Depends(get_sharded_database)
 ):
     """
     Updates information about one citizen
@@ -135,32 +361,97 @@ async def patch_citizens_data(
     - **relatives**: list of person's relatives' citizen ids (if A is B's relative then B is A's relative)
     """
 
-    # Validate that request does not contain null values
-    if None in citizen.dict(skip_defaults=True).values():
-        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
-                            detail="Null values are not allowed")
+    db = sharded_db.for_import(import_id)
+    validate_citizen_to_update(citizen)
 
-    # Validate that at least one parameter is not empty
-    num_parameters_to_update = sum([
-        param_value is not None for param_value in citizen.dict().values()
-    ])
+    if citizen_updates_coalescer.enabled:
+        updated_citizen: Citizen = await citizen_updates_coalescer.update(
+            import_id=import_id,
+            citizen_id=citizen_id,
+            citizen=citizen
+        )
+    else:
+        async with db.pool.acquire() as conn:
+            updated_citizen = await update_citizens_data(
+                conn=conn,
+                import_id=import_id,
+                citizen_id=citizen_id,
+                citizen=citizen
+            )
+    import_versions.forget(import_id)
+
+    updated_citizen_for_response = CitizenInResponse(data=updated_citizen)
+    response = JSONResponse(jsonable_encoder(updated_citizen_for_response),
+                            status_code=HTTP_200_OK)
+    await set_read_after_lsn(db, response)
+    return response
+
+
+@app.patch(
+    "/imports/{import_id}/citizens",
+    summary="Update data of several citizens",
+    response_model=SomeCitizensInResponse,
+    responses={HTTP_200_OK: {"description": "Updated citizens information",
+                             "content": PATCH_BATCH_RESPONSE_200_EXAMPLE},
+               HTTP_400_BAD_REQUEST: {"description": "Request failed validation"}}
+)
+async def patch_citizens_data_batch(
+        *,
+        import_id: int = Path(
+            ...,
+            title="The ID of import to get citizens from",
+            ge=1,
+            description=IMPORT_ID_DESCRIPTION
+        ),
+        citizens: CitizensToUpdate = Body(
+            ...,
+            title="Citizens' data to update",
+            example=PATCH_BATCH_ENDPOINT_QUERY_BODY_EXAMPLE
+        ),
+        sharded_db: ShardedDataBase = Depends(get_sharded_database)
+):
+    """
+    Updates information about several citizens in one transaction: either all citizens are updated or none.
+    Every citizen has the same parameters as in update of one citizen and its citizen_id.
+    Relatives of citizens in the same request must be consistent with each other
+    """
 
-    if num_parameters_to_update == 0:
+    if len(citizens.citizens) == 0:
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
-                            detail="There are no parameters to update")
+                            detail="There are no citizens to update")
+    for citizen in citizens.citizens:
+        validate_citizen_to_update(citizen)
 
+    db = sharded_db.for_import(import_id)
     async with db.pool.acquire() as conn:
 
-        updated_citizen: Citizen = await update_citizens_data(
+        updated_citizens: List[Citizen] = await update_citizens_data_batch(
             conn=conn,
             import_id=import_id,
-            citizen_id=citizen_id,
-            citizen=citizen
+            citizens=citizens.citizens
         )
+        import_versions.forget(import_id)
 
-        updated_citizen_for_response = CitizenInResponse(data=updated_citizen)
-        return JSONResponse(jsonable_encoder(updated_citizen_for_response),
-                            status_code=HTTP_200_OK)
+        response = JSONResponse(jsonable_encoder(SomeCitizensInResponse(data=updated_citizens)),
+                                status_code=HTTP_200_OK)
+        await set_read_after_lsn(db, response, conn)
+        return response
+
+
+def validate_citizen_to_update(citizen: CitizenToUpdate) -> None:
+    """
+    Validates that update does not contain null values and has at least one parameter to update
+    """
+    citizen_parameters = citizen.dict(skip_defaults=True)
+    citizen_parameters.pop("citizen_id", None)
+
+    if None in citizen_parameters.values():
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Null values are not allowed")
+
+    if len(citizen_parameters) == 0:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="There are no parameters to update")
 
 
 @app.get(
@@ -173,21 +464,72 @@ async def patch_citizens_data(
 )
 async def get_citizens(
         *,
+        request: Request,
         import_id: int = Path(
             ...,
             title="The ID of import session to get citizens from",
             ge=1,
             description=IMPORT_ID_DESCRIPTION
         ),
-        db: DataBase = Depends(get_database)
+        sharded_db: ShardedDataBase = Depends(get_sharded_database)
 ):
-    async with db.pool.acquire() as conn:
-        citizens: List[Citizen] = await get_citizens_data(conn=conn, import_id=import_id)
-
-        return JSONResponse(
-            jsonable_encoder(SomeCitizensInResponse(data=citizens)),
-            status_code=HTTP_200_OK
-        )
+    db = sharded_db.for_import(import_id)
+    version = await get_current_import_version(db, import_id)
+    etag = make_etag(import_id, version)
+    cache_key = get_response_cache_key("citizens", import_id, version, CITIZENS_LISTING_ENGINE)
+    early_response = cached_or_not_modified_response(request, etag, cache_key)
+    if early_response is not None:
+        return early_response
+
+    headers = {"ETag": etag} if etag is not None else None
+    if CITIZENS_LISTING_ENGINE == "database":
+        async with acquire_for_import_read(db, request, import_id, version) as conn:
+            citizens_json: str = await get_citizens_json_from_database(conn=conn, import_id=import_id)
+            response = Response(citizens_json, status_code=HTTP_200_OK, headers=headers,
+                                media_type="application/json")
+            response_cache.put(cache_key, response.body)
+            return response
+
+    async with acquire_for_import_read(db, request, import_id, version) as conn:
+        await check_import_has_citizens(conn=conn, import_id=import_id)
+
+    return StreamingResponse(
+        _stream_citizens(connection=acquire_for_import_read(db, request, import_id, version),
+                         import_id=import_id, cache_key=cache_key),
+        status_code=HTTP_200_OK,
+        headers=headers,
+        media_type="application/json"
+    )
+
+
+async def _stream_citizens(
+        connection: AsyncContextManager[Connection],
+        import_id: int,
+        cache_key: Optional[CacheKey] = None
+) -> AsyncIterator[bytes]:
+    """
+    Streams response body. Connection is acquired only when body is being sent, so it is not held
+    by responses which are never sent, and is returned to pool when body is sent or sending fails.
+    Body is saved to response cache if it fits into cache memory budget.
+    """
+    sent_chunks = list()
+    sent_size = 0
+    async with connection as conn:
+        chunks = iterate_citizens_json(conn=conn, import_id=import_id)
+        try:
+            async for chunk in chunks:
+                if cache_key is not None:
+                    sent_size += len(chunk)
+                    if sent_size <= response_cache.max_bytes:
+                        sent_chunks.append(chunk)
+                    else:
+                        cache_key, sent_chunks = None, None
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    if cache_key is not None:
+        response_cache.put(cache_key, b"".join(sent_chunks))
 
 
 @app.get(
@@ -199,22 +541,37 @@ async def get_citizens(
                HTTP_400_BAD_REQUEST: {"description": "Requested import session ID does not exist"}}
 )
 async def get_citizens_and_num_presents(
+        request: Request,
         import_id: int = Path(
             ...,
             title="The ID of import session to get num presents from",
             ge=1,
             description=IMPORT_ID_DESCRIPTION
         ),
-        db: DataBase = Depends(get_database)
+        sharded_db: ShardedDataBase = Depends(get_sharded_database)
 ):
-    async with db.pool.acquire() as conn:
-        num_presents_by_citizen_per_month = await get_num_presents_by_citizen_per_month(
+    db = sharded_db.for_import(import_id)
+    version = await get_current_import_version(db, import_id)
+    etag = make_etag(import_id, version)
+    cache_key = get_response_cache_key("birthdays", import_id, version)
+    early_response = cached_or_not_modified_response(request, etag, cache_key)
+    if early_response is not None:
+        return early_response
+
+    get_num_presents = (get_num_presents_by_citizen_per_month_numpy if BIRTHDAYS_ENGINE == "numpy"
+                        else get_num_presents_by_citizen_per_month)
+    async with acquire_for_import_read(db, request, import_id, version) as conn:
+        num_presents_by_citizen_per_month = await get_num_presents(
             conn=conn,
             import_id=import_id
         )
 
-        return JSONResponse(jsonable_encoder({"data": num_presents_by_citizen_per_month}),
-                            status_code=HTTP_200_OK)
+        response = JSONResponse(jsonable_encoder({"data": num_presents_by_citizen_per_month}),
+                                status_code=HTTP_200_OK)
+        if etag is not None:
+            response.headers["ETag"] = etag
+        response_cache.put(cache_key, response.body)
+        return response
 
 
 @app.get(
@@ -226,20 +583,135 @@ async def get_citizens_and_num_presents(
                HTTP_400_BAD_REQUEST: {"description": "Requested import session ID does not exist"}}
 )
 async def get_citizens_age_stats(
+        request: Request,
         import_id: int = Path(
             ...,
             title="The ID of import session to get age stats from",
             ge=1,
             description=IMPORT_ID_DESCRIPTION
         ),
-        db: DataBase = Depends(get_database)
+        sharded_db: ShardedDataBase = Depends(get_sharded_database)
 ):
-    async with db.pool.acquire() as conn:
-        age_stats_by_town: List[AgeStatsByTown] = await get_citizens_age_and_town(conn=conn, import_id=import_id)
+    db = sharded_db.for_import(import_id)
+    # Ages depend on current date, so statistics are valid only until the end of the day
+    current_date = datetime.utcnow().date()
+    version = await get_current_import_version(db, import_id)
+    etag = make_etag(import_id, version, current_date)
+    cache_key = get_response_cache_key("age_stats", import_id, version, current_date)
+    early_response = cached_or_not_modified_response(request, etag, cache_key)
+    if early_response is not None:
+        return early_response
+
+    get_age_stats_by_town = {
+        "database": get_age_percentiles_by_town,
+        "python": get_citizens_age_and_town
+    }.get(AGE_STATS_ENGINE, get_age_stats_from_histogram)
+    async with acquire_for_import_read(db, request, import_id, version) as conn:
+        age_stats_by_town: List[AgeStatsByTown] = await get_age_stats_by_town(conn=conn, import_id=import_id)
         age_stats_by_town_for_response = AgeStatsByTownInResponse(data=age_stats_by_town)
 
-        return JSONResponse(jsonable_encoder(age_stats_by_town_for_response),
-                            status_code=HTTP_200_OK)
+        response = JSONResponse(jsonable_encoder(age_stats_by_town_for_response),
+                                status_code=HTTP_200_OK)
+        if datetime.utcnow().date() == current_date:
+            if etag is not None:
+                response.headers["ETag"] = etag
+            response_cache.put(cache_key, response.body)
+        return response
+
+
+def parse_age_stats_breakdowns(breakdowns: List[str]) -> List[Tuple[str, ...]]:
+    """
+    Parses breakdowns of comma separated dimensions, dimensions of every breakdown are ordered
+    as in AGE_STATS_DIMENSIONS, so the same breakdowns are computed once. Breakdown "all" is all citizens
+    :return: distinct breakdowns in requested order
+    """
+    parsed_breakdowns = dict()
+    for breakdown in breakdowns:
+        if breakdown.strip() == "all":
+            parsed_breakdowns[()] = None
+            continue
+
+        dimensions = {dimension.strip() for dimension in breakdown.split(",")}
+        unknown_dimensions = dimensions.difference(AGE_STATS_DIMENSIONS)
+        if unknown_dimensions:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                                detail=f"Unknown dimensions {sorted(unknown_dimensions)}, "
+                                       f"allowed dimensions are {list(AGE_STATS_DIMENSIONS)}")
+        parsed_breakdown = tuple(dimension for dimension in AGE_STATS_DIMENSIONS if dimension in dimensions)
+        parsed_breakdowns[parsed_breakdown] = None
+
+    return list(parsed_breakdowns)
+
+
+def validate_quantiles(quantiles: List[float]) -> List[float]:
+    """
+    Validates that quantiles are from 0 to 1
+    :return: distinct quantiles in requested order
+    """
+    if any(not 0 <= quantile <= 1 for quantile in quantiles):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Quantiles must be from 0 to 1")
+
+    return list(dict.fromkeys(quantiles))
+
+
+@app.get(
+    "/imports/{import_id}/stat/percentile/age",
+    response_model=AgeStatsInResponse,
+    summary="Get age statistics grouped by specified dimensions",
+    responses={HTTP_200_OK: {"description": "Citizens' age percentiles of groups of every requested breakdown "
+                                            "within specified import ID",
+                             "content": GET_AGE_STATS_200_EXAMPLE},
+               HTTP_400_BAD_REQUEST: {"description": "Requested import session ID does not exist "
+                                                     "or breakdowns or quantiles are invalid"}}
+)
+async def get_citizens_age_stats_by_dimensions(
+        request: Request,
+        import_id: int = Path(
+            ...,
+            title="The ID of import session to get age stats from",
+            ge=1,
+            description=IMPORT_ID_DESCRIPTION
+        ),
+        breakdown: List[str] = Query(
+            ["town"],
+            description=f"Comma separated dimensions to group citizens by, one of {list(AGE_STATS_DIMENSIONS)}. "
+                        "Parameter can be repeated, breakdown \"all\" is all citizens of import"
+        ),
+        quantile: List[float] = Query(
+            [0.5, 0.75, 0.99],
+            description="Quantile of age from 0 to 1, parameter can be repeated"
+        ),
+        sharded_db: ShardedDataBase = Depends(get_sharded_database)
+):
+    db = sharded_db.for_import(import_id)
+    breakdowns = parse_age_stats_breakdowns(breakdown)
+    quantiles = validate_quantiles(quantile)
+
+    # Ages depend on current date, so statistics are valid only until the end of the day
+    current_date = datetime.utcnow().date()
+    version = await get_current_import_version(db, import_id)
+    etag = make_etag(import_id, version, current_date)
+    cache_key = get_response_cache_key("age_stats_by_dimensions", import_id, version, current_date,
+                                       tuple(breakdowns), tuple(quantiles))
+    early_response = cached_or_not_modified_response(request, etag, cache_key)
+    if early_response is not None:
+        return early_response
+
+    async with acquire_for_import_read(db, request, import_id, version) as conn:
+        age_stats = await get_age_stats_by_dimensions(
+            conn=conn,
+            import_id=import_id,
+            breakdowns=breakdowns,
+            quantiles=quantiles
+        )
+
+    response = JSONResponse(jsonable_encoder(AgeStatsInResponse(data=age_stats)), status_code=HTTP_200_OK)
+    if datetime.utcnow().date() == current_date:
+        if etag is not None:
+            response.headers["ETag"] = etag
+        response_cache.put(cache_key, response.body)
+    return response
 
 
 @app.delete(
@@ -259,7 +731,7 @@ async def reset_data(
                 "admin_password": "Think about it one more time!!!"
             }
         ),
-        db: DataBase = Depends(get_database)
+        sharded_db: ShardedDataBase = Depends(get_sharded_database)
 ):
     """
     Be careful!!! This is endpoint for internal purposes (refreshing database after tests).
@@ -273,10 +745,12 @@ async def reset_data(
     required_password = os.getenv("ADMIN_PASSWORD", "")
 
     if admin_credentials.admin_login == required_login and admin_credentials.admin_password == required_password:
-        async with db.pool.acquire() as conn:
-            await clear_db(conn=conn)
-            return JSONResponse(jsonable_encoder({"data_was_reset": "ok"}),
-                                status_code=HTTP_200_OK)
+        for shard in sharded_db.shards:
+            async with shard.pool.acquire() as conn:
+                await clear_db(conn=conn)
+        import_versions.reset()
+        return JSONResponse(jsonable_encoder({"data_was_reset": "ok"}),
+                            status_code=HTTP_200_OK)
     else:
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
                             detail="Wrong administrator credentials")
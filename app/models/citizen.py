@@ -1,12 +1,34 @@
+import json
 import re
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import chain
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from pydantic import BaseModel, validator, Extra
+import numpy as np
+from pydantic import BaseModel, ValidationError, validator, Extra
 
 MAX_STRING_PARAMETER_LENGTH = 256
 MIN_STRING_PARAMETER_LENGTH = 1
 NUMBER_OR_LETTER_PATTERN = re.compile("\\w")
+BIRTH_DATE_FORMAT = "%d.%m.%Y"
+GENDERS = frozenset(("male", "female"))
+# Citizens columns age statistics can be grouped by, in order of columns of grouping
+AGE_STATS_DIMENSIONS = ("town", "street", "building", "gender")
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_birth_date(date_value: str) -> date:
+    """
+    Parses birth date string, every distinct string is parsed only once
+    :param date_value: date in 'dd.mm.YYYY' format
+    :return: parsed date
+    """
+    return datetime.strptime(date_value, BIRTH_DATE_FORMAT).date()
+
+
+def has_number_or_letter(parameter_value: str) -> bool:
+    return NUMBER_OR_LETTER_PATTERN.search(parameter_value) is not None
 
 
 class Citizen(BaseModel):
@@ -36,8 +58,7 @@ class Citizen(BaseModel):
     @validator("town", "street", "building")
     def validate_parameter_name(cls, parameter_value: str):
 
-        numbers_or_letters = re.findall(NUMBER_OR_LETTER_PATTERN, parameter_value)
-        if len(numbers_or_letters) < 1:
+        if not has_number_or_letter(parameter_value):
             raise ValueError("Number of numbers or letters is invalid")
 
         return parameter_value
@@ -45,14 +66,14 @@ class Citizen(BaseModel):
     @validator("birth_date")
     def validate_birth_date(cls, date_value: str):
 
-        request_date = datetime.strptime(date_value, "%d.%m.%Y")
-        if request_date > datetime.utcnow():
+        request_date = parse_birth_date(date_value)
+        if request_date > datetime.utcnow().date():
             raise ValueError("Birth date is later than current date")
         return date_value
 
     @validator("gender")
     def validate_gender(cls, gender_value: str):
-        if gender_value not in {"male", "female"}:
+        if gender_value not in GENDERS:
             raise ValueError("Gender is invalid")
         return gender_value
 
@@ -64,22 +85,175 @@ class Citizen(BaseModel):
         return apartment_num
 
 
+CITIZEN_FIELDS = frozenset(Citizen.__fields__)
+
+
+def _is_valid_string(parameter_value: Any) -> bool:
+    return (type(parameter_value) is str
+            and MIN_STRING_PARAMETER_LENGTH <= len(parameter_value) <= MAX_STRING_PARAMETER_LENGTH)
+
+
+def _is_valid_non_negative_int(value: Any) -> bool:
+    return type(value) is int and value >= 0
+
+
 class CitizensToImport(BaseModel):
     citizens: List[Citizen]
 
     class Config:
         extra = Extra.forbid
 
+    @validator("citizens", pre=True, whole=True)
+    def validate_citizens_batch(cls, citizens_values: Any):
+        """
+        Validates all citizens of the batch in one pass before per-citizen validation.
+        Citizens which pass all checks are constructed without running pydantic validators
+        again, others are left as is, so standard validators report exactly the same errors.
+        """
+        if not isinstance(citizens_values, list):
+            return citizens_values
+
+        today = datetime.utcnow().date()
+        checked_dates = dict()
+        citizens_batch = list()
+
+        for citizen_values in citizens_values:
+            if type(citizen_values) is not dict or citizen_values.keys() != CITIZEN_FIELDS:
+                citizens_batch.append(citizen_values)
+                continue
+
+            birth_date = citizen_values["birth_date"]
+            is_valid_birth_date = _is_valid_string(birth_date)
+            if is_valid_birth_date and birth_date not in checked_dates:
+                try:
+                    checked_dates[birth_date] = parse_birth_date(birth_date) <= today
+                except ValueError:
+                    checked_dates[birth_date] = False
+
+            relatives = citizen_values["relatives"]
+            is_valid = (
+                is_valid_birth_date and checked_dates[birth_date]
+                and _is_valid_non_negative_int(citizen_values["citizen_id"])
+                and _is_valid_non_negative_int(citizen_values["apartment"])
+                and _is_valid_string(citizen_values["name"])
+                and type(citizen_values["gender"]) is str and citizen_values["gender"] in GENDERS
+                and all(_is_valid_string(citizen_values[parameter]) and has_number_or_letter(citizen_values[parameter])
+                        for parameter in ("town", "street", "building"))
+                and type(relatives) is list and all(type(relative_id) is int for relative_id in relatives)
+            )
+            if is_valid:
+                citizens_batch.append(Citizen.construct(citizen_values, CITIZEN_FIELDS))
+            else:
+                citizens_batch.append(citizen_values)
+
+        return citizens_batch
+
     @validator("citizens", whole=True)
     def validate_relatives_consistency(cls, citizens_values: List[Citizen]):
-        citizens_relatives = {citizen.citizen_id: set(citizen.relatives) for citizen in citizens_values}
-        for citizen_id in citizens_relatives:
-            for relative_id in citizens_relatives[citizen_id]:
-                if citizen_id not in citizens_relatives.get(relative_id, set()):
-                    raise ValueError("Relatives data is inconsistent")
+        """
+        Checks relatives graph over arrays of (citizen_id, relative_id) edges:
+        citizen ids are unique, every relative exists, no relative is listed twice
+        and every edge (a, b) has reverse edge (b, a).
+        """
+        num_citizens = len(citizens_values)
+        try:
+            citizens_ids = np.fromiter((citizen.citizen_id for citizen in citizens_values),
+                                       dtype=np.int64, count=num_citizens)
+        except OverflowError:
+            raise ValueError("Citizen id is invalid")
+        num_relatives = np.fromiter((len(citizen.relatives) for citizen in citizens_values),
+                                    dtype=np.int64, count=num_citizens)
+        try:
+            relatives_ids = np.fromiter(chain.from_iterable(citizen.relatives for citizen in citizens_values),
+                                        dtype=np.int64, count=int(num_relatives.sum()))
+        except OverflowError:
+            raise ValueError("Relative id is invalid")
+
+        sorted_citizens_ids = np.sort(citizens_ids)
+        duplicated_ids = np.flatnonzero(sorted_citizens_ids[1:] == sorted_citizens_ids[:-1])
+        if duplicated_ids.size:
+            raise ValueError(f"Citizen id {sorted_citizens_ids[duplicated_ids[0]]} is not unique")
+
+        if relatives_ids.size == 0:
+            return citizens_values
+
+        positions = np.minimum(np.searchsorted(sorted_citizens_ids, relatives_ids), num_citizens - 1)
+        unknown_relatives = np.flatnonzero(sorted_citizens_ids[positions] != relatives_ids)
+        if unknown_relatives.size:
+            edge = unknown_relatives[0]
+            citizen_id = np.repeat(citizens_ids, num_relatives)[edge]
+            raise ValueError(f"Relative id {relatives_ids[edge]} of citizen {citizen_id} does not exist")
+
+        # Edges are encoded as single keys over dense citizen indices, so one sort replaces lexsort by two columns
+        edges_from = np.repeat(np.searchsorted(sorted_citizens_ids, citizens_ids), num_relatives)
+        edges_to = positions
+        edges_keys = np.sort(edges_from * num_citizens + edges_to)
+        reverse_edges_keys = np.sort(edges_to * num_citizens + edges_from)
+
+        duplicated_relatives = np.flatnonzero(edges_keys[1:] == edges_keys[:-1])
+        if duplicated_relatives.size:
+            citizen_index, relative_index = divmod(int(edges_keys[duplicated_relatives[0]]), num_citizens)
+            raise ValueError(f"Relative id {sorted_citizens_ids[relative_index]} is duplicated "
+                             f"for citizen {sorted_citizens_ids[citizen_index]}")
+
+        asymmetric_edges = np.flatnonzero(edges_keys != reverse_edges_keys)
+        if asymmetric_edges.size:
+            # Both arrays are sorted, so the smaller key at first mismatch is missing in the other array
+            edge = asymmetric_edges[0]
+            if edges_keys[edge] < reverse_edges_keys[edge]:
+                citizen_index, relative_index = divmod(int(edges_keys[edge]), num_citizens)
+            else:
+                relative_index, citizen_index = divmod(int(reverse_edges_keys[edge]), num_citizens)
+            citizen_id, relative_id = sorted_citizens_ids[citizen_index], sorted_citizens_ids[relative_index]
+            raise ValueError(f"Relatives data is inconsistent: citizen {citizen_id} has relative "
+                             f"{relative_id}, but citizen {relative_id} does not have relative {citizen_id}")
+
         return citizens_values
 
 
+class CitizensStreamError(ValueError):
+    """
+    Raised when a line of streamed citizens can not be parsed or validated
+    """
+
+
+async def parse_citizens_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Citizen]:
+    """
+    Parses citizens from NDJSON body (one citizen object per line) chunk by chunk
+    :param chunks: raw request body chunks
+    :return: validated citizens in the order they were sent
+    """
+    buffer = b""
+    line_num = 0
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_num += 1
+            if line.strip():
+                yield _parse_citizen_line(line, line_num)
+
+    if buffer.strip():
+        yield _parse_citizen_line(buffer, line_num + 1)
+
+
+def _parse_citizen_line(line: bytes, line_num: int) -> Citizen:
+
+    try:
+        citizen_values = json.loads(line)
+    except ValueError:
+        raise CitizensStreamError(f"Line {line_num} is not valid JSON")
+
+    if not isinstance(citizen_values, dict):
+        raise CitizensStreamError(f"Line {line_num} is not a citizen object")
+
+    try:
+        return Citizen(**citizen_values)
+    except ValidationError as exception:
+        raise CitizensStreamError(f"Line {line_num}: {exception}")
+
+
 class CitizenInResponse(BaseModel):
     data: Citizen
 
@@ -103,17 +277,14 @@ class CitizenToUpdate(BaseModel):
     @validator("town", "street", "building")
     def validate_parameter_name(cls, parameter_value: str):
 
-        if parameter_value is not None:
-
-            numbers_or_letters = re.findall(NUMBER_OR_LETTER_PATTERN, parameter_value)
-            if len(numbers_or_letters) < 1:
-                raise ValueError("Number of numbers or letters is invalid")
+        if parameter_value is not None and not has_number_or_letter(parameter_value):
+            raise ValueError("Number of numbers or letters is invalid")
 
         return parameter_value
 
     @validator("gender")
     def validate_gender(cls, gender_value: str):
-        if gender_value is not None and gender_value not in {"male", "female"}:
+        if gender_value is not None and gender_value not in GENDERS:
             raise ValueError("Gender is invalid")
         return gender_value
 
@@ -121,8 +292,8 @@ class CitizenToUpdate(BaseModel):
     def validate_birth_date_format(cls, date_value):
 
         if date_value is not None:
-            request_date = datetime.strptime(date_value, "%d.%m.%Y")
-            if request_date > datetime.utcnow():
+            request_date = parse_birth_date(date_value)
+            if request_date > datetime.utcnow().date():
                 raise ValueError("Birth date is later than current date")
         return date_value
 
@@ -134,6 +305,32 @@ class CitizenToUpdate(BaseModel):
         return apartment_num
 
 
+class CitizenToUpdateInBatch(CitizenToUpdate):
+
+    citizen_id: int
+
+    @validator("citizen_id")
+    def validate_citizen_id(cls, citizen_id: int):
+
+        if citizen_id < 0:
+            raise ValueError("Citizen id is invalid")
+        return citizen_id
+
+
+class CitizensToUpdate(BaseModel):
+    citizens: List[CitizenToUpdateInBatch]
+
+    class Config:
+        extra = Extra.forbid
+
+    @validator("citizens", whole=True)
+    def validate_unique_citizen_id(cls, citizens: List[CitizenToUpdateInBatch]):
+
+        if len({citizen.citizen_id for citizen in citizens}) != len(citizens):
+            raise ValueError("Citizen id is not unique")
+        return citizens
+
+
 class SomeCitizensInResponse(BaseModel):
     data: List[Citizen]
 
@@ -150,6 +347,22 @@ class AgeStatsByTownInResponse(BaseModel):
     data: List[AgeStatsByTown]
 
 
+class AgeStatsGroup(BaseModel):
+
+    dimensions: Dict[str, str]
+    percentiles: Dict[str, float]
+
+
+class AgeStatsBreakdown(BaseModel):
+
+    breakdown: List[str]
+    groups: List[AgeStatsGroup]
+
+
+class AgeStatsInResponse(BaseModel):
+    data: List[AgeStatsBreakdown]
+
+
 class AdminCredentials(BaseModel):
 
     admin_login: str
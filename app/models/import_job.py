@@ -0,0 +1,25 @@
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class ImportJobState(str, Enum):
+
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class ImportJob(BaseModel):
+
+    job_id: int
+    state: ImportJobState
+    progress: float
+    import_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class ImportJobInResponse(BaseModel):
+    data: ImportJob
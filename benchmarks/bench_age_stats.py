@@ -0,0 +1,62 @@
+"""
+Compares computation of age percentiles by town from fetched ages and towns: per-town lists
+with separate np.percentile for every percentile, and one grouped quantiles pass over arrays.
+
+Run from project root:
+
+    python -m benchmarks.bench_age_stats
+"""
+import random
+import timeit
+from collections import defaultdict
+from typing import List
+
+import numpy as np
+
+from app.crud.citizen import make_age_stats_by_town
+from app.models.citizen import AgeStatsByTown
+from tests.utils import TOWNS
+
+NUM_CITIZENS = (10000, 100000, 1000000)
+NUM_REPEATS = 5
+
+
+def compute_per_town(ages: List[int], towns: List[str]) -> List[AgeStatsByTown]:
+    ages_by_town = defaultdict(list)
+    for age, town in zip(ages, towns):
+        ages_by_town[town].append(age)
+
+    return [
+        AgeStatsByTown(
+            town=town,
+            p50=float(round(np.percentile(ages_by_town[town], q=50, interpolation="linear"), 2)),
+            p75=float(round(np.percentile(ages_by_town[town], q=75, interpolation="linear"), 2)),
+            p99=float(round(np.percentile(ages_by_town[town], q=99, interpolation="linear"), 2))
+        )
+        for town in ages_by_town
+    ]
+
+
+def compute_grouped(ages: List[int], towns: List[str]) -> List[AgeStatsByTown]:
+    return make_age_stats_by_town(ages=np.fromiter(ages, dtype=np.int64, count=len(ages)), towns=towns)
+
+
+def main():
+    for num_citizens in NUM_CITIZENS:
+        ages = [random.randint(0, 100) for _ in range(num_citizens)]
+        towns = [random.choice(TOWNS) for _ in range(num_citizens)]
+
+        per_town_result = sorted(compute_per_town(ages, towns), key=lambda stats: stats.town)
+        grouped_result = sorted(compute_grouped(ages, towns), key=lambda stats: stats.town)
+        assert [stats.dict() for stats in per_town_result] == [stats.dict() for stats in grouped_result]
+
+        per_town_time = min(timeit.repeat(lambda: compute_per_town(ages, towns), number=1, repeat=NUM_REPEATS))
+        grouped_time = min(timeit.repeat(lambda: compute_grouped(ages, towns), number=1, repeat=NUM_REPEATS))
+
+        print(f"citizens: {num_citizens}")
+        print(f"per-town np.percentile: {per_town_time * 1000:.1f} ms")
+        print(f"grouped quantiles:      {grouped_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compares engines of GET birthdays response: presents read from aggregate maintained in database
+and presents counted in application with NumPy from relatives edges read by binary COPY.
+
+Requires database configured by the same environment variables as application.
+Benchmark imports sample of citizens with large families (it is not removed afterwards). Run from project root:
+
+    python -m benchmarks.bench_birthdays
+"""
+import asyncio
+import time
+
+from app.crud.citizen import (
+    get_num_presents_by_citizen_per_month,
+    get_num_presents_by_citizen_per_month_numpy,
+    insert_citizens_data
+)
+from app.db.database import db
+from app.db.db_utils import close_postgres_connection, connect_to_postgres
+from app.models.citizen import CitizensToImport
+from benchmarks.utils import generate_citizens_with_families
+
+NUM_CITIZENS = 10000
+FAMILY_SIZES = (4, 20, 50)
+NUM_REPEATS = 5
+
+
+async def measure(get_num_presents, import_id: int) -> (float, object):
+    timings = list()
+    for _ in range(NUM_REPEATS):
+        async with db.pool.acquire() as conn:
+            started_at = time.perf_counter()
+            result = await get_num_presents(conn=conn, import_id=import_id)
+            timings.append(time.perf_counter() - started_at)
+    return min(timings), result
+
+
+async def main():
+    await connect_to_postgres()
+
+    for family_size in FAMILY_SIZES:
+        citizens = CitizensToImport(
+            citizens=generate_citizens_with_families(num_citizens=NUM_CITIZENS, family_size=family_size)
+        ).citizens
+        async with db.pool.acquire() as conn:
+            import_id = await insert_citizens_data(conn=conn, citizens=citizens)
+
+        database_time, database_result = await measure(get_num_presents_by_citizen_per_month, import_id)
+        numpy_time, numpy_result = await measure(get_num_presents_by_citizen_per_month_numpy, import_id)
+        assert numpy_result == database_result
+
+        num_edges = NUM_CITIZENS * (family_size - 1)
+        print(f"citizens: {NUM_CITIZENS}, relatives edges: {num_edges}, import id: {import_id}")
+        print(f"database aggregate: {database_time * 1000:.1f} ms")
+        print(f"numpy:              {numpy_time * 1000:.1f} ms")
+
+    await close_postgres_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
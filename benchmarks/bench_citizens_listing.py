@@ -0,0 +1,72 @@
+"""
+Compares engines of GET citizens response: JSON streamed from server-side cursor
+and JSON assembled by PostgreSQL.
+
+Requires database configured by the same environment variables as application.
+Benchmark imports sample of citizens (it is not removed afterwards). Run from project root:
+
+    python -m benchmarks.bench_citizens_listing
+"""
+import asyncio
+import time
+
+from app.crud.citizen import get_citizens_json_from_database, insert_citizens_data, iterate_citizens_json
+from app.db.database import db
+from app.db.db_utils import close_postgres_connection, connect_to_postgres
+from app.models.citizen import CitizensToImport
+from benchmarks.utils import generate_citizens_with_families
+
+NUM_CITIZENS = 10000
+FAMILY_SIZE = 4
+NUM_REPEATS = 5
+
+
+async def read_streamed_json(import_id: int) -> (float, int):
+    async with db.pool.acquire() as conn:
+        started_at = time.perf_counter()
+        first_chunk_time = None
+        body_size = 0
+        async for chunk in iterate_citizens_json(conn=conn, import_id=import_id):
+            if first_chunk_time is None:
+                first_chunk_time = time.perf_counter() - started_at
+            body_size += len(chunk)
+        return first_chunk_time, body_size
+
+
+async def read_database_json(import_id: int) -> int:
+    async with db.pool.acquire() as conn:
+        citizens_json = await get_citizens_json_from_database(conn=conn, import_id=import_id)
+        return len(citizens_json.encode("utf-8"))
+
+
+async def measure(read_citizens, import_id: int) -> (float, object):
+    timings = list()
+    for _ in range(NUM_REPEATS):
+        started_at = time.perf_counter()
+        result = await read_citizens(import_id)
+        timings.append(time.perf_counter() - started_at)
+    return min(timings), result
+
+
+async def main():
+    await connect_to_postgres()
+
+    citizens = CitizensToImport(
+        citizens=generate_citizens_with_families(num_citizens=NUM_CITIZENS, family_size=FAMILY_SIZE)
+    ).citizens
+    async with db.pool.acquire() as conn:
+        import_id = await insert_citizens_data(conn=conn, citizens=citizens)
+
+    stream_time, (first_chunk_time, stream_size) = await measure(read_streamed_json, import_id)
+    database_time, database_size = await measure(read_database_json, import_id)
+
+    print(f"citizens: {NUM_CITIZENS}, import id: {import_id}")
+    print(f"stream:   {stream_time * 1000:.1f} ms total, {first_chunk_time * 1000:.1f} ms to first chunk, "
+          f"{stream_size} bytes")
+    print(f"database: {database_time * 1000:.1f} ms total, {database_size} bytes")
+
+    await close_postgres_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
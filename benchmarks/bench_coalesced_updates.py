@@ -0,0 +1,72 @@
+"""
+Compares throughput of concurrent citizen updates: every update on its own pool connection
+in its own transaction, and updates coalesced by CitizenUpdatesCoalescer into shared transactions.
+
+Requires database configured by the same environment variables as application.
+Benchmark imports sample of citizens (it is not removed afterwards). Run from project root:
+
+    python -m benchmarks.bench_coalesced_updates
+"""
+import asyncio
+import time
+
+from app.core.coalescer import CitizenUpdatesCoalescer
+from app.crud.citizen import insert_citizens_data, update_citizens_data
+from app.db.database import db
+from app.db.db_utils import close_postgres_connection, connect_to_postgres
+from app.models.citizen import CitizensToImport, CitizenToUpdate
+from benchmarks.utils import generate_citizens_with_families
+
+NUM_CITIZENS = 10000
+FAMILY_SIZE = 4
+NUM_WRITERS = (7, 50, 200)
+NUM_UPDATES_PER_WRITER = 20
+COALESCING_WINDOW = 0.002
+COALESCING_MAX_BATCH = 100
+
+
+async def update_on_own_connection(import_id: int, citizen_id: int, citizen: CitizenToUpdate) -> None:
+    async with db.pool.acquire() as conn:
+        await update_citizens_data(conn=conn, import_id=import_id, citizen_id=citizen_id, citizen=citizen)
+
+
+async def measure(update_citizen, import_id: int, num_writers: int) -> float:
+
+    async def write(writer_num: int):
+        for update_num in range(NUM_UPDATES_PER_WRITER):
+            citizen_id = (writer_num * NUM_UPDATES_PER_WRITER + update_num) % NUM_CITIZENS
+            await update_citizen(import_id, citizen_id, CitizenToUpdate(apartment=update_num))
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[write(writer_num) for writer_num in range(num_writers)])
+    return num_writers * NUM_UPDATES_PER_WRITER / (time.perf_counter() - started_at)
+
+
+async def main():
+    await connect_to_postgres()
+
+    citizens = CitizensToImport(
+        citizens=generate_citizens_with_families(num_citizens=NUM_CITIZENS, family_size=FAMILY_SIZE)
+    ).citizens
+    async with db.pool.acquire() as conn:
+        import_id = await insert_citizens_data(conn=conn, citizens=citizens)
+
+    coalescer = CitizenUpdatesCoalescer(window=COALESCING_WINDOW, max_batch=COALESCING_MAX_BATCH)
+
+    async def update_coalesced(import_id: int, citizen_id: int, citizen: CitizenToUpdate) -> None:
+        await coalescer.update(import_id=import_id, citizen_id=citizen_id, citizen=citizen)
+
+    for num_writers in NUM_WRITERS:
+        separate_throughput = await measure(update_on_own_connection, import_id, num_writers)
+        coalesced_throughput = await measure(update_coalesced, import_id, num_writers)
+
+        print(f"concurrent writers: {num_writers}")
+        print(f"separate transactions: {separate_throughput:.0f} updates/s")
+        print(f"coalesced updates:     {coalesced_throughput:.0f} updates/s")
+
+    await coalescer.stop()
+    await close_postgres_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
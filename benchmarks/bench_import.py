@@ -0,0 +1,68 @@
+"""
+Compares time to store validated import: COPY directly into live tables (insert_citizens_data),
+where foreign keys are checked for every copied row, and COPY into temporary staging tables validated
+with set-based queries and moved to live tables with one INSERT ... SELECT (insert_citizens_data_from_stream).
+
+Requires database configured by the same environment variables as application.
+Imported samples are not removed afterwards. Run from project root:
+
+    python -m benchmarks.bench_import
+"""
+import asyncio
+import time
+from typing import AsyncIterator, List
+
+from app.crud.citizen import insert_citizens_data, insert_citizens_data_from_stream
+from app.db.database import db
+from app.db.db_utils import close_postgres_connection, connect_to_postgres
+from app.models.citizen import Citizen, CitizensToImport
+from benchmarks.utils import generate_citizens_with_families
+
+NUM_CITIZENS = (10000, 50000)
+FAMILY_SIZE = 4
+NUM_REPEATS = 3
+
+
+async def insert_directly(conn, citizens: List[Citizen]) -> int:
+    return await insert_citizens_data(conn=conn, citizens=citizens)
+
+
+async def insert_through_staging(conn, citizens: List[Citizen]) -> int:
+
+    async def iterate_citizens() -> AsyncIterator[Citizen]:
+        for citizen in citizens:
+            yield citizen
+
+    return await insert_citizens_data_from_stream(conn=conn, citizens=iterate_citizens())
+
+
+async def measure_once(insert_citizens, citizens: List[Citizen]) -> float:
+    async with db.pool.acquire() as conn:
+        started_at = time.perf_counter()
+        await insert_citizens(conn, citizens)
+        return time.perf_counter() - started_at
+
+
+async def main():
+    await connect_to_postgres()
+
+    for num_citizens in NUM_CITIZENS:
+        citizens = CitizensToImport(
+            citizens=generate_citizens_with_families(num_citizens=num_citizens, family_size=FAMILY_SIZE)
+        ).citizens
+        direct_timings, staging_timings = list(), list()
+        # Runs are interleaved, so both paths see tables of the same size
+        for _ in range(NUM_REPEATS):
+            direct_timings.append(await measure_once(insert_directly, citizens))
+            staging_timings.append(await measure_once(insert_through_staging, citizens))
+        direct_time, staging_time = min(direct_timings), min(staging_timings)
+
+        print(f"citizens: {num_citizens}")
+        print(f"direct COPY:  {direct_time * 1000:.1f} ms")
+        print(f"staging COPY: {staging_time * 1000:.1f} ms")
+
+    await close_postgres_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Compares per-citizen pydantic validation of import payload with single-pass batch validation
+in CitizensToImport, including building records for COPY.
+
+Run from project root:
+
+    python -m benchmarks.bench_import_validation
+"""
+import timeit
+from datetime import datetime
+from typing import Dict, List, Union
+
+from app.models.citizen import Citizen, CitizensToImport, parse_birth_date
+from benchmarks.utils import generate_citizens_with_families
+
+NUM_CITIZENS = 10000
+FAMILY_SIZE = 4
+NUM_REPEATS = 5
+
+
+def validate_per_citizen(citizens: List[Dict[str, Union[str, int, List[int]]]]) -> list:
+    parse_birth_date.cache_clear()
+    validated_citizens = CitizensToImport.validate_relatives_consistency(
+        [Citizen(**citizen) for citizen in citizens]
+    )
+    return [(citizen.citizen_id, datetime.strptime(citizen.birth_date, "%d.%m.%Y")) for citizen in validated_citizens]
+
+
+def validate_batch(citizens: List[Dict[str, Union[str, int, List[int]]]]) -> list:
+    validated_citizens = CitizensToImport(citizens=citizens).citizens
+    return [(citizen.citizen_id, parse_birth_date(citizen.birth_date)) for citizen in validated_citizens]
+
+
+def main():
+    citizens = generate_citizens_with_families(num_citizens=NUM_CITIZENS, family_size=FAMILY_SIZE)
+
+    per_citizen_time = min(timeit.repeat(lambda: validate_per_citizen(citizens), number=1, repeat=NUM_REPEATS))
+    batch_time = min(timeit.repeat(lambda: validate_batch(citizens), setup=parse_birth_date.cache_clear,
+                                   number=1, repeat=NUM_REPEATS))
+
+    print(f"citizens: {NUM_CITIZENS}")
+    print(f"per-citizen validation: {per_citizen_time * 1000:.1f} ms")
+    print(f"batch validation:       {batch_time * 1000:.1f} ms")
+    print(f"speedup:                {per_citizen_time / batch_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
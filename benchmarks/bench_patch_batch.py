@@ -0,0 +1,79 @@
+"""
+Compares time to apply the same changes of many citizens by separate updates, each in its own transaction
+(update_citizens_data), and by one batch update in one transaction (update_citizens_data_batch).
+Every change moves citizen to another street and leaves the last member of every family without relatives.
+
+Requires database configured by the same environment variables as application.
+Benchmark imports sample of citizens (it is not removed afterwards). Run from project root:
+
+    python -m benchmarks.bench_patch_batch
+"""
+import asyncio
+import time
+from typing import List
+
+from app.crud.citizen import insert_citizens_data, update_citizens_data, update_citizens_data_batch
+from app.db.database import db
+from app.db.db_utils import close_postgres_connection, connect_to_postgres
+from app.models.citizen import CitizensToImport, CitizenToUpdateInBatch
+from benchmarks.utils import generate_citizens_with_families
+
+NUM_CITIZENS = 10000
+FAMILY_SIZE = 4
+NUM_CHANGES = (10, 100, 500)
+
+
+def generate_changes(num_changes: int, street: str) -> List[CitizenToUpdateInBatch]:
+    changes = list()
+    for family_start in range(0, num_changes, FAMILY_SIZE):
+        family = list(range(family_start, min(family_start + FAMILY_SIZE, num_changes)))
+        for citizen_id in family:
+            relatives = [relative_id for relative_id in family[:-1] if relative_id != citizen_id]
+            changes.append(CitizenToUpdateInBatch(
+                citizen_id=citizen_id,
+                street=street,
+                relatives=relatives if citizen_id != family[-1] else []
+            ))
+    return changes
+
+
+async def update_separately(import_id: int, changes: List[CitizenToUpdateInBatch]) -> None:
+    async with db.pool.acquire() as conn:
+        for change in changes:
+            await update_citizens_data(conn=conn, import_id=import_id, citizen_id=change.citizen_id, citizen=change)
+
+
+async def update_in_batch(import_id: int, changes: List[CitizenToUpdateInBatch]) -> None:
+    async with db.pool.acquire() as conn:
+        await update_citizens_data_batch(conn=conn, import_id=import_id, citizens=changes)
+
+
+async def measure(update_citizens, num_changes: int) -> float:
+    citizens = CitizensToImport(
+        citizens=generate_citizens_with_families(num_citizens=NUM_CITIZENS, family_size=FAMILY_SIZE)
+    ).citizens
+    async with db.pool.acquire() as conn:
+        import_id = await insert_citizens_data(conn=conn, citizens=citizens)
+
+    changes = generate_changes(num_changes=num_changes, street="Бассейная")
+    started_at = time.perf_counter()
+    await update_citizens(import_id, changes)
+    return time.perf_counter() - started_at
+
+
+async def main():
+    await connect_to_postgres()
+
+    for num_changes in NUM_CHANGES:
+        separate_time = await measure(update_separately, num_changes)
+        batch_time = await measure(update_in_batch, num_changes)
+
+        print(f"changes: {num_changes}")
+        print(f"separate updates: {separate_time * 1000:.1f} ms")
+        print(f"batch update:     {batch_time * 1000:.1f} ms")
+
+    await close_postgres_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
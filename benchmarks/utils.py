@@ -0,0 +1,24 @@
+import random
+from typing import Dict, List, Union
+
+from tests.utils import generate_citizens_sample
+
+
+def generate_citizens_with_families(
+        num_citizens: int,
+        family_size: int
+) -> List[Dict[str, Union[str, int, List[int]]]]:
+    """
+    Generates citizens sample where citizens are grouped in families of specified size
+    and every citizen is relative of all other members of his family
+    :param num_citizens: size of sample
+    :param family_size: number of citizens in one family
+    :return: shuffled sample of citizens
+    """
+    citizens = generate_citizens_sample(num_citizens=num_citizens, with_relatives=False)
+    for family_start in range(0, num_citizens, family_size):
+        family = list(range(family_start, min(family_start + family_size, num_citizens)))
+        for citizen_id in family:
+            citizens[citizen_id]["relatives"] = [relative_id for relative_id in family if relative_id != citizen_id]
+    random.shuffle(citizens)
+    return citizens
@@ -9,7 +9,7 @@ CREATE TABLE IF NOT EXISTS public.citizens (
       birth_date date,
       gender varchar,
       CONSTRAINT import_citizen_pkey PRIMARY KEY (import_id, citizen_id)
-      );
+      ) PARTITION BY HASH (import_id);
 
 CREATE TABLE IF NOT EXISTS public.relatives (
       import_id int8 NOT NULL,
@@ -18,6 +18,77 @@ CREATE TABLE IF NOT EXISTS public.relatives (
       CONSTRAINT import_citizen_fkey FOREIGN KEY (import_id, citizen_id) REFERENCES public.citizens(import_id, citizen_id),
       CONSTRAINT import_relative_fkey FOREIGN KEY (import_id, relative_id) REFERENCES public.citizens(import_id, citizen_id),
       CONSTRAINT import_citizen_relative_pkey PRIMARY KEY (import_id, citizen_id, relative_id)
+      ) PARTITION BY HASH (import_id);
+
+-- Number of presents citizen buys in month: number of his relatives with birthday in this month.
+-- Filled on import and adjusted by updates of birth dates and relatives
+CREATE TABLE IF NOT EXISTS public.presents_by_month (
+      import_id int8 NOT NULL,
+      citizen_id int8 NOT NULL,
+      month int4 NOT NULL,
+      presents int8 NOT NULL,
+      CONSTRAINT import_citizen_month_pkey PRIMARY KEY (import_id, citizen_id, month)
+      ) PARTITION BY HASH (import_id);
+
+-- Number of citizens of town born on date. Filled on import and adjusted by updates of towns and birth dates,
+-- so age statistics are computed from distinct birth dates instead of all citizens
+CREATE TABLE IF NOT EXISTS public.town_birth_dates (
+      import_id int8 NOT NULL,
+      town varchar NOT NULL,
+      birth_date date NOT NULL,
+      citizens int8 NOT NULL,
+      CONSTRAINT import_town_birth_date_pkey PRIMARY KEY (import_id, town, birth_date)
+      ) PARTITION BY HASH (import_id);
+
+-- Fixed set of hash partitions is created once: imports never run DDL on partitioned tables,
+-- which would take ACCESS EXCLUSIVE lock and wait for open read transactions
+DO $$
+BEGIN
+    FOR partition_num IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS public.citizens_p%1$s PARTITION OF public.citizens '
+            'FOR VALUES WITH (MODULUS 16, REMAINDER %1$s)',
+            partition_num
+        );
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS public.relatives_p%1$s PARTITION OF public.relatives '
+            'FOR VALUES WITH (MODULUS 16, REMAINDER %1$s)',
+            partition_num
+        );
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS public.presents_by_month_p%1$s PARTITION OF public.presents_by_month '
+            'FOR VALUES WITH (MODULUS 16, REMAINDER %1$s)',
+            partition_num
+        );
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS public.town_birth_dates_p%1$s PARTITION OF public.town_birth_dates '
+            'FOR VALUES WITH (MODULUS 16, REMAINDER %1$s)',
+            partition_num
+        );
+    END LOOP;
+END $$;
+
+CREATE SEQUENCE IF NOT EXISTS imports_seq START 1;
+
+-- Versions are taken from sequence, which is not restarted on reset, so version of import data
+-- is never reused and can be exposed as entity tag
+CREATE SEQUENCE IF NOT EXISTS imports_versions_seq START 1;
+
+-- Version of import data, changed on every update of import citizens
+CREATE TABLE IF NOT EXISTS public.imports (
+      import_id int8 PRIMARY KEY,
+      version int8 NOT NULL DEFAULT nextval('imports_versions_seq')
       );
 
-CREATE SEQUENCE IF NOT EXISTS imports_seq START 1;
\ No newline at end of file
+-- Imports are copied to temporary staging tables citizens_staging and relatives_staging created
+-- by application in import transaction, and then moved to the live tables in one statement
+
+CREATE TABLE IF NOT EXISTS public.import_jobs (
+      job_id bigserial PRIMARY KEY,
+      state varchar NOT NULL,
+      num_citizens int8 NOT NULL,
+      num_imported int8 NOT NULL DEFAULT 0,
+      import_id int8,
+      error varchar,
+      created_at timestamp NOT NULL DEFAULT timezone('utc', now())
+      );
@@ -0,0 +1,165 @@
+import asyncio
+from datetime import datetime
+
+from starlette.testclient import TestClient
+
+from app.core.cache import ImportVersions, ResponseCache, import_versions, response_cache
+from app.main import app
+from tests.utils import TestConfig, generate_citizens_sample
+
+test_conf = TestConfig()
+READ_ENDPOINTS = ("citizens", "citizens/birthdays", "towns/stat/percentile/age")
+
+
+def setup():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def teardown():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def test_read_endpoints_answer_not_modified():
+    """
+    Checks that read endpoints return entity tags and answer 304 without body
+    for requests with matching If-None-Match, until citizen is updated
+    :return:
+    """
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports",
+            json={"citizens": generate_citizens_sample(num_citizens=10, with_relatives=True)}
+        )
+        import_id = import_response.json()["data"]["import_id"]
+
+        etags = dict()
+        for endpoint in READ_ENDPOINTS:
+            response = client.get(f"/imports/{import_id}/{endpoint}")
+            assert response.status_code == 200
+            etags[endpoint] = response.headers["etag"]
+
+            not_modified_response = client.get(
+                f"/imports/{import_id}/{endpoint}",
+                headers={"If-None-Match": f'"other", W/{etags[endpoint]}'}
+            )
+            assert not_modified_response.status_code == 304
+            assert not_modified_response.content == b""
+            assert not_modified_response.headers["etag"] == etags[endpoint]
+
+        current_date = datetime.utcnow().strftime("%Y%m%d")
+        assert etags["towns/stat/percentile/age"].endswith(f'-{current_date}"')
+
+        patch_response = client.patch(
+            f"/imports/{import_id}/citizens/1",
+            json={"name": "Новое Имя"}
+        )
+        assert patch_response.status_code == 200
+
+        for endpoint in READ_ENDPOINTS:
+            response = client.get(
+                f"/imports/{import_id}/{endpoint}",
+                headers={"If-None-Match": etags[endpoint]}
+            )
+            assert response.status_code == 200
+            assert response.headers["etag"] != etags[endpoint]
+
+
+def test_entity_tags_are_not_reused_after_reset():
+    """
+    Checks that import created with the same id after reset does not match entity tag of old import
+    :return:
+    """
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+        import_response = client.post(
+            "/imports",
+            json={"citizens": generate_citizens_sample(num_citizens=5, with_relatives=False)}
+        )
+        import_id = import_response.json()["data"]["import_id"]
+        etag = client.get(f"/imports/{import_id}/citizens").headers["etag"]
+
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+        response_nonexistent_import_id = client.get(
+            f"/imports/{import_id}/citizens",
+            headers={"If-None-Match": "*"}
+        )
+        assert response_nonexistent_import_id.status_code == 400
+
+        import_response = client.post(
+            "/imports",
+            json={"citizens": generate_citizens_sample(num_citizens=5, with_relatives=False)}
+        )
+        assert import_response.json()["data"]["import_id"] == import_id
+        response = client.get(
+            f"/imports/{import_id}/citizens",
+            headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+
+
+def test_import_versions_are_listened_without_response_cache(monkeypatch):
+    """
+    Checks that import versions are kept up to date by notifications when response cache is disabled,
+    so conditional requests are answered without reading version from database
+    :return:
+    """
+    monkeypatch.setattr(response_cache, "max_bytes", 0)
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports",
+            json={"citizens": generate_citizens_sample(num_citizens=5, with_relatives=False)}
+        )
+        import_id = import_response.json()["data"]["import_id"]
+        etag = client.get(f"/imports/{import_id}/citizens").headers["etag"]
+
+        assert import_versions.listening
+        assert import_versions.get(import_id) is not None
+        response = client.get(
+            f"/imports/{import_id}/citizens",
+            headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+
+
+def test_import_versions_listener_reconnects_with_backoff(monkeypatch):
+    """
+    Checks that listener, which could not connect on start, is connected again
+    on next request after reconnect delay, and failed attempts are not repeated before that
+    :return:
+    """
+    loop = asyncio.get_event_loop()
+    versions = ImportVersions(response_cache=ResponseCache(max_bytes=1024), min_reconnect_delay=0.5)
+
+    monkeypatch.setattr("app.core.cache.SHARDS_DATABASE_URLS", ["postgresql://user@127.0.0.1:1/citizens_db"])
+    loop.run_until_complete(versions.start())
+    assert not versions.listening
+    assert versions.get(1) is None
+    assert versions._reconnect_task is None
+
+    monkeypatch.undo()
+    loop.run_until_complete(asyncio.sleep(0.5))
+    assert versions.get(1) is None
+    loop.run_until_complete(versions._reconnect_task)
+    assert versions.listening
+
+    loop.run_until_complete(versions.stop())
@@ -1,7 +1,9 @@
+import json
 from typing import Dict, List, Union
 
 from starlette.testclient import TestClient
 
+from app.core.cache import response_cache
 from app.main import app
 from tests.utils import TestConfig, import_data_sample, calculate_age_percentiles_by_town
 from tests.utils import generate_citizens_sample
@@ -87,4 +89,145 @@ def test_calculate_age_percentiles_by_town():
             assert response_result["town"] == calculation_result["town"]
             assert response_result["p50"] == calculation_result["p50"]
             assert response_result["p75"] == calculation_result["p75"]
-            assert response_result["p99"] == calculation_result["p99"]
\ No newline at end of file
+            assert response_result["p99"] == calculation_result["p99"]
+
+def test_calculate_age_percentiles_by_town_in_database(monkeypatch):
+    """
+    Checks that percentiles computed by database are the same as computed in application and in test
+    for imports of different sizes, so positions of percentiles fall between different neighbour ages
+    :return:
+    """
+    monkeypatch.setattr(response_cache, "max_bytes", 0)
+    with TestClient(app) as client:
+        for num_citizens in (1, 7, 100, 1001):
+            citizens: List[Dict[str, Union[str, int, List[int]]]] = generate_citizens_sample(
+                num_citizens=num_citizens,
+                with_relatives=False
+            )
+            import_response = client.post(
+                "/imports",
+                json={"citizens": citizens}
+            )
+            import_id = int(import_response.json()["data"]["import_id"])
+
+            monkeypatch.setattr("app.main.AGE_STATS_ENGINE", "database")
+            database_response = client.get(f"/imports/{import_id}/towns/stat/percentile/age")
+            assert database_response.status_code == 200
+            monkeypatch.setattr("app.main.AGE_STATS_ENGINE", "python")
+            python_response = client.get(f"/imports/{import_id}/towns/stat/percentile/age")
+
+            database_result = sorted(database_response.json()["data"], key=lambda stats: stats["town"])
+            assert database_result == sorted(python_response.json()["data"], key=lambda stats: stats["town"])
+            assert database_result == sorted(
+                calculate_age_percentiles_by_town(citizens_in_import=citizens),
+                key=lambda stats: stats["town"]
+            )
+
+        monkeypatch.setattr("app.main.AGE_STATS_ENGINE", "database")
+        nonexistent_import_response = client.get(f"/imports/{import_id + 1}/towns/stat/percentile/age")
+        assert nonexistent_import_response.status_code == 400
+
+
+def test_calculate_age_percentiles_by_town_from_histogram(monkeypatch):
+    """
+    Checks that percentiles computed from histogram of birth dates are the same as computed from ages
+    of all citizens after direct and streaming imports and after updates of towns and birth dates
+    :return:
+    """
+
+    def get_sorted_age_stats(client: TestClient, import_id: int, engine: str) -> List[Dict[str, Union[float, str]]]:
+        monkeypatch.setattr("app.main.AGE_STATS_ENGINE", engine)
+        response = client.get(f"/imports/{import_id}/towns/stat/percentile/age")
+        assert response.status_code == 200
+        return sorted(response.json()["data"], key=lambda stats: stats["town"])
+
+    citizens: List[Dict[str, Union[str, int, List[int]]]] = generate_citizens_sample(
+        num_citizens=100,
+        with_relatives=False
+    )
+    monkeypatch.setattr(response_cache, "max_bytes", 0)
+    with TestClient(app) as client:
+        import_id = int(client.post("/imports", json={"citizens": citizens}).json()["data"]["import_id"])
+        stream_import_id = int(client.post(
+            "/imports/stream",
+            data="\n".join(json.dumps(citizen) for citizen in citizens).encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        ).json()["data"]["import_id"])
+
+        expected_age_stats = sorted(
+            calculate_age_percentiles_by_town(citizens_in_import=citizens),
+            key=lambda stats: stats["town"]
+        )
+        assert get_sorted_age_stats(client, import_id, "histogram") == expected_age_stats
+        assert get_sorted_age_stats(client, stream_import_id, "histogram") == expected_age_stats
+
+        patch_response = client.patch(
+            f"/imports/{import_id}/citizens/0",
+            json={"town": "Новый город", "birth_date": "01.01.1950"}
+        )
+        assert patch_response.status_code == 200
+        patch_response = client.patch(
+            f"/imports/{import_id}/citizens/1",
+            json={"name": "Иван"}
+        )
+        assert patch_response.status_code == 200
+        patch_batch_response = client.patch(
+            f"/imports/{import_id}/citizens",
+            json={"citizens": [{"citizen_id": 2, "town": "Новый город"},
+                               {"citizen_id": 3, "birth_date": "29.02.2000"},
+                               {"citizen_id": 4, "town": citizens[4]["town"], "birth_date": citizens[4]["birth_date"]}]}
+        )
+        assert patch_batch_response.status_code == 200
+
+        updated_age_stats = get_sorted_age_stats(client, import_id, "histogram")
+        assert updated_age_stats == get_sorted_age_stats(client, import_id, "python")
+        assert "Новый город" in {stats["town"] for stats in updated_age_stats}
+
+        monkeypatch.setattr("app.main.AGE_STATS_ENGINE", "histogram")
+        nonexistent_import_response = client.get(f"/imports/{stream_import_id + 1}/towns/stat/percentile/age")
+        assert nonexistent_import_response.status_code == 400
+
+
+def test_calculate_age_percentiles_by_dimensions():
+    """
+    Checks that age percentiles of several breakdowns requested at once are the same as calculated
+    in test by every breakdown separately, and that unknown dimensions and quantiles are rejected
+    :return:
+    """
+    citizens: List[Dict[str, Union[str, int, List[int]]]] = generate_citizens_sample(
+        num_citizens=100,
+        with_relatives=False
+    )
+    with TestClient(app) as client:
+        import_id = int(client.post("/imports", json={"citizens": citizens}).json()["data"]["import_id"])
+
+        age_stats_response = client.get(
+            f"/imports/{import_id}/stat/percentile/age",
+            params=[("breakdown", "town"), ("breakdown", "gender,town"), ("breakdown", "all"),
+                    ("quantile", 0.5), ("quantile", 0.75), ("quantile", 0.99)]
+        )
+        assert age_stats_response.status_code == 200
+        age_stats = age_stats_response.json()["data"]
+        assert [breakdown_stats["breakdown"] for breakdown_stats in age_stats] == [["town"], ["town", "gender"], []]
+
+        assert sorted(
+            [dict(group["percentiles"], town=group["dimensions"]["town"]) for group in age_stats[0]["groups"]],
+            key=lambda stats: stats["town"]
+        ) == sorted(calculate_age_percentiles_by_town(citizens_in_import=citizens), key=lambda stats: stats["town"])
+
+        for group in age_stats[1]["groups"]:
+            group_citizens = [citizen for citizen in citizens if citizen["town"] == group["dimensions"]["town"]
+                              and citizen["gender"] == group["dimensions"]["gender"]]
+            assert calculate_age_percentiles_by_town(citizens_in_import=group_citizens)[0]["p99"] == \
+                group["percentiles"]["p99"]
+        assert sum(len(group["dimensions"]) for group in age_stats[2]["groups"]) == 0
+        assert calculate_age_percentiles_by_town(
+            citizens_in_import=[dict(citizen, town="") for citizen in citizens]
+        )[0]["p50"] == age_stats[2]["groups"][0]["percentiles"]["p50"]
+
+        unknown_dimension_response = client.get(f"/imports/{import_id}/stat/percentile/age?breakdown=town,name")
+        assert unknown_dimension_response.status_code == 400
+        invalid_quantile_response = client.get(f"/imports/{import_id}/stat/percentile/age?quantile=1.5")
+        assert invalid_quantile_response.status_code == 400
+        nonexistent_import_response = client.get(f"/imports/{import_id + 1}/stat/percentile/age?breakdown=all")
+        assert nonexistent_import_response.status_code == 400
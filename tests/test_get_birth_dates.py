@@ -1,7 +1,9 @@
+import json
 from typing import Dict, List, Union
 
 from starlette.testclient import TestClient
 
+from app.core.cache import response_cache
 from app.main import app
 from tests.utils import (
     TestConfig,
@@ -79,3 +81,94 @@ def test_calculate_num_presents_per_month():
 
         for month in map(str, range(1, 12 + 1)):
             assert birthdays_data[month] == num_birthdays[month]
+
+
+def test_calculate_num_presents_after_updates():
+    """
+    Checks that presents stay correct after birth dates and relatives are updated
+    by single and batch updates and after streaming import
+    :return:
+    """
+    citizens: List[Dict[str, Union[str, int, List[int]]]] = generate_citizens_sample(
+        num_citizens=30,
+        with_relatives=True
+    )
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports/stream",
+            data="\n".join(json.dumps(citizen) for citizen in citizens).encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert import_response.status_code == 201
+        import_id = int(import_response.json()["data"]["import_id"])
+
+        updates = (
+            (1, {"birth_date": "15.03.1990"}),
+            (2, {"relatives": [3, 4, 5]}),
+            (3, {"birth_date": "01.12.2001", "relatives": [2, 7]}),
+            (6, {"relatives": [6, 1]}),
+            (6, {"birth_date": "30.06.1985"}),
+            (1, {"relatives": []})
+        )
+        for citizen_id, citizen in updates:
+            patch_response = client.patch(f"/imports/{import_id}/citizens/{citizen_id}", json=citizen)
+            assert patch_response.status_code == 200
+
+        patch_response = client.patch(
+            f"/imports/{import_id}/citizens",
+            json={"citizens": [
+                {"citizen_id": 8, "birth_date": "10.10.2010", "relatives": [9, 10]},
+                {"citizen_id": 9, "relatives": [8]},
+                {"citizen_id": 10, "birth_date": "20.01.1970"},
+                {"citizen_id": 11, "birth_date": "20.02.1970", "relatives": [11]}
+            ]}
+        )
+        assert patch_response.status_code == 200
+
+        citizens_after = client.get(f"/imports/{import_id}/citizens").json()["data"]
+        num_birthdays = calculate_num_birthdays_for_citizens_per_month(citizens_in_import=citizens_after)
+        birthdays_data = client.get(f"/imports/{import_id}/citizens/birthdays").json()["data"]
+
+        for month in map(str, range(1, 12 + 1)):
+            assert birthdays_data[month] == num_birthdays[month]
+
+
+def test_calculate_num_presents_per_month_numpy_engine(monkeypatch):
+    """
+    Checks that presents counted in application from relatives edges are the same
+    as calculated in test and as read from database aggregate
+    :return:
+    """
+    citizens: List[Dict[str, Union[str, int, List[int]]]] = generate_citizens_sample(
+        num_citizens=100,
+        with_relatives=True
+    )
+    monkeypatch.setattr(response_cache, "max_bytes", 0)
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports",
+            json={"citizens": citizens}
+        )
+        import_id = int(import_response.json()["data"]["import_id"])
+        import_without_relatives_response = client.post(
+            "/imports",
+            json={"citizens": generate_citizens_sample(num_citizens=10, with_relatives=False)}
+        )
+        import_without_relatives_id = int(import_without_relatives_response.json()["data"]["import_id"])
+
+        monkeypatch.setattr("app.main.BIRTHDAYS_ENGINE", "numpy")
+        numpy_response = client.get(f"/imports/{import_id}/citizens/birthdays")
+        assert numpy_response.status_code == 200
+        num_birthdays = calculate_num_birthdays_for_citizens_per_month(citizens_in_import=citizens)
+        assert numpy_response.json()["data"] == num_birthdays
+
+        without_relatives_response = client.get(f"/imports/{import_without_relatives_id}/citizens/birthdays")
+        assert without_relatives_response.status_code == 200
+        assert without_relatives_response.json()["data"] == {str(month): [] for month in range(1, 12 + 1)}
+
+        nonexistent_import_response = client.get(f"/imports/{import_id + 100}/citizens/birthdays")
+        assert nonexistent_import_response.status_code == 400
+
+        monkeypatch.setattr("app.main.BIRTHDAYS_ENGINE", "database")
+        database_response = client.get(f"/imports/{import_id}/citizens/birthdays")
+        assert database_response.json() == numpy_response.json()
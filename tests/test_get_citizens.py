@@ -0,0 +1,135 @@
+from typing import Dict, List, Union
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+from starlette.testclient import TestClient
+
+from app.main import app
+from app.models.citizen import Citizen, SomeCitizensInResponse
+from tests.utils import TestConfig, import_data_sample, generate_citizens_sample
+
+test_conf = TestConfig()
+
+
+def setup():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def teardown():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def test_get_citizens_for_nonexistent_import_id():
+    """
+    Tests case with request to nonexistent import id.
+    Application should return 400 bad request
+    :return:
+    """
+    import_id = import_data_sample(
+        num_citizens=10,
+        with_relatives=False
+    )
+
+    with TestClient(app) as client:
+        response_nonexistent_import_id = client.get(
+            f"/imports/{import_id + 1}/citizens"
+        )
+
+        assert response_nonexistent_import_id.status_code == 400
+
+
+def test_get_citizens_streamed_in_chunks(monkeypatch):
+    """
+    Checks that citizens response streamed in several chunks is byte-for-byte
+    the same as JSON response built from models
+    :return:
+    """
+    monkeypatch.setattr("app.main.CITIZENS_LISTING_ENGINE", "stream")
+    monkeypatch.setattr("app.crud.citizen.CITIZENS_STREAM_CHUNK_SIZE", 7)
+    citizens: List[Dict[str, Union[str, int, List[int]]]] = generate_citizens_sample(
+        num_citizens=30,
+        with_relatives=True
+    )
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports",
+            json={"citizens": citizens}
+        )
+        assert import_response.status_code == 201
+        import_id = int(import_response.json()["data"]["import_id"])
+
+        citizens_response = client.get(f"/imports/{import_id}/citizens")
+        assert citizens_response.status_code == 200
+
+        expected_citizens = [
+            Citizen(**{**citizen, "relatives": sorted(citizen["relatives"])})
+            for citizen in sorted(citizens, key=lambda citizen: citizen["citizen_id"])
+        ]
+        expected_response = JSONResponse(jsonable_encoder(SomeCitizensInResponse(data=expected_citizens)))
+        assert citizens_response.content == expected_response.body
+
+
+def test_get_citizens_engines_return_same_data(monkeypatch):
+    """
+    Checks that JSON assembled in database contains the same citizens as streamed JSON
+    :return:
+    """
+    import_id = import_data_sample(
+        num_citizens=20,
+        with_relatives=True
+    )
+
+    with TestClient(app) as client:
+        monkeypatch.setattr("app.main.CITIZENS_LISTING_ENGINE", "stream")
+        streamed_response = client.get(f"/imports/{import_id}/citizens")
+        monkeypatch.setattr("app.main.CITIZENS_LISTING_ENGINE", "database")
+        database_response = client.get(f"/imports/{import_id}/citizens")
+
+        assert streamed_response.status_code == 200
+        assert database_response.status_code == 200
+        assert database_response.headers["content-type"] == "application/json"
+        assert database_response.json() == streamed_response.json()
+
+        monkeypatch.setattr("app.main.CITIZENS_LISTING_ENGINE", "database")
+        response_nonexistent_import_id = client.get(f"/imports/{import_id + 1}/citizens")
+        assert response_nonexistent_import_id.status_code == 400
+
+
+def test_get_citizens_relatives_are_sorted(monkeypatch):
+    """
+    Checks that relatives of citizen are returned in ascending order by both engines,
+    whatever order they were stored in
+    :return:
+    """
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports",
+            json={"citizens": generate_citizens_sample(num_citizens=5, with_relatives=False)}
+        )
+        import_id = import_response.json()["data"]["import_id"]
+        # Relatives are added one by one, so they are stored in descending order
+        for relatives in ([4], [4, 3], [4, 3, 2], [4, 3, 2, 0]):
+            patch_response = client.patch(
+                f"/imports/{import_id}/citizens/1",
+                json={"relatives": relatives}
+            )
+            assert patch_response.status_code == 200
+
+        for engine in ("stream", "database"):
+            monkeypatch.setattr("app.main.CITIZENS_LISTING_ENGINE", engine)
+            citizens_response = client.get(f"/imports/{import_id}/citizens")
+            assert citizens_response.status_code == 200
+            citizens = {citizen["citizen_id"]: citizen for citizen in citizens_response.json()["data"]}
+            assert citizens[1]["relatives"] == [0, 2, 3, 4]
@@ -1,13 +1,17 @@
+import asyncio
+import json
+import time
 from copy import deepcopy
 from datetime import datetime
 
+import asyncpg
 from dateutil.relativedelta import relativedelta
 from starlette.testclient import TestClient
 
-from app.core.config import IMPORT_ENDPOINT_QUERY_BODY_EXAMPLE
+from app.core.config import DATABASE_URL, IMPORT_ENDPOINT_QUERY_BODY_EXAMPLE
 from app.main import app
 from app.models.citizen import MAX_STRING_PARAMETER_LENGTH
-from tests.utils import TestConfig, CITIZEN_EXAMPLE
+from tests.utils import TestConfig, CITIZEN_EXAMPLE, generate_citizens_sample
 
 test_conf = TestConfig()
 
@@ -68,6 +72,61 @@ def test_import_inconsistent_relatives():
         assert response.status_code == 400
 
 
+def test_import_duplicated_relative_id():
+    """
+    Tests case when relative id is listed twice for one citizen.
+    Application should return 400 bad request
+    :return:
+    """
+    first_citizen = deepcopy(CITIZEN_EXAMPLE)
+    first_citizen["relatives"] = [2, 2]
+    second_citizen = deepcopy(CITIZEN_EXAMPLE)
+    second_citizen["citizen_id"] = 2
+    second_citizen["relatives"] = [1]
+    with TestClient(app) as client:
+        response = client.post(
+            "/imports",
+            json={"citizens": [first_citizen, second_citizen]}
+        )
+
+        assert response.status_code == 400
+
+
+def test_import_nonexistent_relative_id():
+    """
+    Tests case when relative id is not presented in import.
+    Application should return 400 bad request
+    :return:
+    """
+    citizen_with_nonexistent_relative = deepcopy(CITIZEN_EXAMPLE)
+    citizen_with_nonexistent_relative["relatives"] = [5]
+    with TestClient(app) as client:
+        response = client.post(
+            "/imports",
+            json={"citizens": [citizen_with_nonexistent_relative]}
+        )
+
+        assert response.status_code == 400
+
+
+def test_import_out_of_range_relative_id():
+    """
+    Tests case when relative id does not fit into 64-bit integer.
+    Application should return 400 bad request with error about relative id
+    :return:
+    """
+    citizen_with_huge_relative = deepcopy(CITIZEN_EXAMPLE)
+    citizen_with_huge_relative["relatives"] = [2 ** 64]
+    with TestClient(app) as client:
+        response = client.post(
+            "/imports",
+            json={"citizens": [citizen_with_huge_relative]}
+        )
+
+        assert response.status_code == 400
+        assert "Relative id is invalid" in response.text
+
+
 def test_import_wrong_date_format():
     """
     Tests case with wrong date in during uploading citizens.
@@ -290,3 +349,209 @@ def test_import_without_any_number_or_letter_in_string_parameter():
 
             assert import_response.status_code == 400
 
+
+def test_import_ndjson_stream():
+    """
+    Tests streaming import of citizens in NDJSON format.
+    Application should return 201 created and all citizens should be imported
+    :return:
+    """
+    citizens = generate_citizens_sample(num_citizens=30, with_relatives=True)
+    body = "\n".join(json.dumps(citizen) for citizen in citizens)
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports/stream",
+            data=body.encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert import_response.status_code == 201
+        import_id = import_response.json()["data"]["import_id"]
+
+        citizens_response = client.get(f"/imports/{import_id}/citizens")
+        imported_citizens = {citizen["citizen_id"]: citizen for citizen in citizens_response.json()["data"]}
+        assert len(imported_citizens) == len(citizens)
+        for citizen in citizens:
+            assert sorted(imported_citizens[citizen["citizen_id"]]["relatives"]) == sorted(citizen["relatives"])
+
+
+def test_import_ndjson_stream_inconsistent_relatives():
+    """
+    Tests case with inconsistent relatives in streaming import.
+    Application should return 400 bad request
+    :return:
+    """
+    first_citizen = deepcopy(CITIZEN_EXAMPLE)
+    first_citizen["relatives"] = [2]
+    second_citizen = deepcopy(CITIZEN_EXAMPLE)
+    second_citizen["citizen_id"] = 2
+    body = "\n".join(json.dumps(citizen) for citizen in (first_citizen, second_citizen))
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports/stream",
+            data=body.encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        assert import_response.status_code == 400
+
+
+def test_import_ndjson_stream_invalid_line():
+    """
+    Tests case with invalid citizen in the middle of streaming import.
+    Application should return 400 bad request
+    :return:
+    """
+    citizen_with_wrong_gender = deepcopy(CITIZEN_EXAMPLE)
+    citizen_with_wrong_gender["citizen_id"] = 2
+    citizen_with_wrong_gender["gender"] = "nope"
+    body = "\n".join(json.dumps(citizen) for citizen in (CITIZEN_EXAMPLE, citizen_with_wrong_gender))
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports/stream",
+            data=body.encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        assert import_response.status_code == 400
+
+
+def test_import_mixed_clean_and_coercible_citizens():
+    """
+    Tests case when some citizens need type coercion (e.g. citizen_id sent as string)
+    and others are already clean. Both kinds should be accepted.
+    Application should return 201 created
+    :return:
+    """
+    clean_citizen = deepcopy(CITIZEN_EXAMPLE)
+    coercible_citizen = deepcopy(CITIZEN_EXAMPLE)
+    coercible_citizen["citizen_id"] = "2"
+    coercible_citizen["apartment"] = "8"
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports",
+            json={
+                "citizens": [clean_citizen, coercible_citizen]
+            }
+        )
+        assert import_response.status_code == 201
+        import_id = import_response.json()["data"]["import_id"]
+
+        citizens_response = client.get(f"/imports/{import_id}/citizens")
+        citizens_ids = sorted(citizen["citizen_id"] for citizen in citizens_response.json()["data"])
+        assert citizens_ids == [1, 2]
+
+
+def test_import_ndjson_stream_nonexistent_relative_id():
+    """
+    Tests case with relative id which is not presented in streaming import.
+    Application should return 400 bad request
+    :return:
+    """
+    citizen_with_nonexistent_relative = deepcopy(CITIZEN_EXAMPLE)
+    citizen_with_nonexistent_relative["relatives"] = [5]
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports/stream",
+            data=json.dumps(citizen_with_nonexistent_relative).encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        assert import_response.status_code == 400
+        assert import_response.json()["detail"] == "Detected nonexistent relative_id"
+
+
+def test_import_ndjson_stream_duplicated_citizen_id():
+    """
+    Tests case when citizen_id is duplicated in streaming import.
+    Application should return 400 bad request
+    :return:
+    """
+    body = "\n".join(json.dumps(CITIZEN_EXAMPLE) for _ in range(2))
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports/stream",
+            data=body.encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        assert import_response.status_code == 400
+        assert import_response.json()["detail"] == "Citizen id is not unique"
+
+
+def test_import_does_not_wait_for_open_read_transaction():
+    """
+    Tests that import is not blocked by transaction, which has read citizens and is still open.
+    Reading transaction is terminated by server after a few seconds, so import waiting for it
+    would finish only after that
+    :return:
+    """
+    loop = asyncio.get_event_loop()
+    idle_timeout_seconds = 5
+
+    async def open_read_transaction():
+        conn = await asyncpg.connect(str(DATABASE_URL))
+        await conn.execute(f"SET idle_in_transaction_session_timeout = '{idle_timeout_seconds}s'")
+        await conn.execute("BEGIN")
+        await conn.fetch("SELECT * FROM public.citizens JOIN public.relatives USING (import_id, citizen_id)")
+        return conn
+
+    reader_conn = loop.run_until_complete(open_read_transaction())
+    try:
+        with TestClient(app) as client:
+            started_at = time.monotonic()
+            import_response = client.post(
+                "/imports",
+                json={"citizens": generate_citizens_sample(num_citizens=10, with_relatives=True)}
+            )
+            assert import_response.status_code == 201
+            assert time.monotonic() - started_at < idle_timeout_seconds
+    finally:
+        reader_conn.terminate()
+
+
+def test_reset_keeps_partitions():
+    """
+    Tests that imports are stored in fixed set of partitions, which are emptied but not dropped on reset
+    :return:
+    """
+    loop = asyncio.get_event_loop()
+
+    async def count_partitions_rows():
+        conn = await asyncpg.connect(str(DATABASE_URL))
+        try:
+            partitions = await conn.fetch(
+                """
+                SELECT partitions.relname partition_name
+                FROM pg_inherits JOIN pg_class partitions ON partitions.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent IN ('public.citizens'::regclass, 'public.relatives'::regclass)
+                """
+            )
+            return {
+                row["partition_name"]: await conn.fetchval(f"SELECT count(*) FROM public.{row['partition_name']}")
+                for row in partitions
+            }
+        finally:
+            await conn.close()
+
+    partitions_before_import = loop.run_until_complete(count_partitions_rows())
+    with TestClient(app) as client:
+        for _ in range(3):
+            import_response = client.post(
+                "/imports",
+                json={"citizens": generate_citizens_sample(num_citizens=10, with_relatives=True)}
+            )
+            assert import_response.status_code == 201
+
+        partitions_after_import = loop.run_until_complete(count_partitions_rows())
+        assert partitions_after_import.keys() == partitions_before_import.keys()
+        assert sum(partitions_after_import.values()) > 0
+
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+    partitions_after_reset = loop.run_until_complete(count_partitions_rows())
+    assert partitions_after_reset.keys() == partitions_before_import.keys()
+    assert sum(partitions_after_reset.values()) == 0
@@ -0,0 +1,104 @@
+import asyncio
+from typing import Dict, List, Union
+
+import asyncpg
+from starlette.testclient import TestClient
+
+from app.core.config import DATABASE_URL
+from app.main import app
+from tests.utils import TestConfig, generate_citizens_sample
+
+test_conf = TestConfig()
+MAX_NUM_POLLS = 100
+
+
+def setup():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def teardown():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def test_async_import():
+    """
+    Tests import in async mode.
+    Application should return 202 accepted with job id, job should finish
+    with import id of uploaded citizens
+    :return:
+    """
+    citizens: List[Dict[str, Union[str, int, List[int]]]] = generate_citizens_sample(
+        num_citizens=20,
+        with_relatives=True
+    )
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports",
+            params={"async_mode": "true"},
+            json={"citizens": citizens}
+        )
+        assert import_response.status_code == 202
+        job_id = import_response.json()["data"]["job_id"]
+
+        for _ in range(MAX_NUM_POLLS):
+            job_response = client.get(f"/imports/jobs/{job_id}")
+            assert job_response.status_code == 200
+            job = job_response.json()["data"]
+            if job["state"] in ("done", "failed"):
+                break
+
+        assert job["state"] == "done"
+        assert job["progress"] == 1.0
+
+        citizens_response = client.get(f"/imports/{job['import_id']}/citizens")
+        assert citizens_response.status_code == 200
+        assert len(citizens_response.json()["data"]) == len(citizens)
+
+
+def test_get_nonexistent_import_job():
+    """
+    Tests case with request to nonexistent import job.
+    Application should return 400 bad request
+    :return:
+    """
+    with TestClient(app) as client:
+        job_response = client.get("/imports/jobs/100500")
+
+        assert job_response.status_code == 400
+
+
+def test_interrupted_import_job_is_failed_on_startup():
+    """
+    Tests case when process running import job was stopped.
+    Job left in running state without owner should be marked as failed when application starts
+    :return:
+    """
+
+    async def create_orphan_job() -> int:
+        conn = await asyncpg.connect(str(DATABASE_URL))
+        try:
+            return await conn.fetchval(
+                "INSERT INTO public.import_jobs (state, num_citizens) VALUES ('running', 10) RETURNING job_id"
+            )
+        finally:
+            await conn.close()
+
+    job_id = asyncio.get_event_loop().run_until_complete(create_orphan_job())
+
+    with TestClient(app) as client:
+        job_response = client.get(f"/imports/jobs/{job_id}")
+        assert job_response.status_code == 200
+        assert job_response.json()["data"]["state"] == "failed"
+        assert job_response.json()["data"]["error"] == "Import was interrupted"
@@ -1,10 +1,16 @@
+import asyncio
 from datetime import datetime
+from typing import List
 
+import asyncpg
 from dateutil.relativedelta import relativedelta
+from starlette.exceptions import HTTPException
 from starlette.testclient import TestClient
 
+from app.core.coalescer import citizen_updates_coalescer
+from app.core.config import DATABASE_URL
 from app.main import app
-from app.models.citizen import MAX_STRING_PARAMETER_LENGTH
+from app.models.citizen import MAX_STRING_PARAMETER_LENGTH, CitizenToUpdate
 from tests.utils import import_data_sample, TestConfig
 
 test_conf = TestConfig()
@@ -242,3 +248,209 @@ def test_patch_with_null_value():
         )
 
         assert patch_response.status_code == 400
+
+
+def test_patch_relatives_diff_is_symmetric():
+    """
+    Tests case when relatives are added and removed.
+    Only supplied fields should change, relatives should be updated for both citizens
+    :return:
+    """
+    citizen_id = 1
+
+    def check_relatives_are_symmetric(client: TestClient, expected_relatives: List[int]) -> None:
+        citizens = {
+            citizen["citizen_id"]: citizen
+            for citizen in client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"]
+        }
+        assert sorted(citizens[citizen_id]["relatives"]) == sorted(expected_relatives)
+        for other_id, other_citizen in citizens.items():
+            if other_id == citizen_id:
+                continue
+            assert (citizen_id in other_citizen["relatives"]) == (other_id in expected_relatives)
+
+    with TestClient(app) as client:
+        citizen_before = client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"][citizen_id]
+
+        # Citizen is detached from everyone first, so both directions of added edges do not exist yet
+        for new_relatives in ([], [2, 3], [3, 4]):
+            patch_response = client.patch(
+                f"/imports/{test_conf.IMPORT_ID}/citizens/{citizen_id}",
+                json={"relatives": new_relatives, "apartment": 0}
+            )
+            assert patch_response.status_code == 200
+            updated_citizen = patch_response.json()["data"]
+            assert updated_citizen["relatives"] == new_relatives
+            assert updated_citizen["apartment"] == 0
+            assert updated_citizen["name"] == citizen_before["name"]
+            assert updated_citizen["birth_date"] == citizen_before["birth_date"]
+
+            check_relatives_are_symmetric(client=client, expected_relatives=new_relatives)
+
+
+def test_patch_import_without_version():
+    """
+    Tests case when import has no version row. Citizen should be updated anyway
+    :return:
+    """
+
+    async def delete_import_version():
+        conn = await asyncpg.connect(str(DATABASE_URL))
+        try:
+            await conn.execute("DELETE FROM public.imports WHERE import_id = $1", test_conf.IMPORT_ID)
+        finally:
+            await conn.close()
+
+    asyncio.get_event_loop().run_until_complete(delete_import_version())
+    with TestClient(app) as client:
+        patch_response = client.patch(
+            f"/imports/{test_conf.IMPORT_ID}/citizens/2",
+            json={"name": "Без Версии"}
+        )
+        assert patch_response.status_code == 200
+        assert patch_response.json()["data"]["name"] == "Без Версии"
+
+    setup()
+
+
+def test_patch_nonexistent_or_duplicated_relative():
+    """
+    Tests case with nonexistent or duplicated relative during updating citizens.
+    Application should return 400 bad request and keep citizen unchanged
+    :return:
+    """
+    with TestClient(app) as client:
+        citizen_before = client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"][1]
+
+        for relatives in ([NUM_CITIZENS_IN_SAMPLE + 100], [1, 1]):
+            patch_response = client.patch(
+                f"/imports/{test_conf.IMPORT_ID}/citizens/{citizen_before['citizen_id']}",
+                json={"relatives": relatives, "name": "Другое Имя"}
+            )
+            assert patch_response.status_code == 400
+
+        citizen_after = client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"][1]
+        assert citizen_after == citizen_before
+
+
+def test_patch_citizens_batch():
+    """
+    Tests update of several citizens in one request.
+    Relatives should be updated symmetrically across the whole batch
+    :return:
+    """
+    with TestClient(app) as client:
+        citizens_before = {
+            citizen["citizen_id"]: citizen
+            for citizen in client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"]
+        }
+
+        patch_response = client.patch(
+            f"/imports/{test_conf.IMPORT_ID}/citizens",
+            json={"citizens": [
+                {"citizen_id": 6, "relatives": [5], "street": "Бассейная"},
+                {"citizen_id": 5, "relatives": [6]},
+                {"citizen_id": 7, "name": "Новое Имя"}
+            ]}
+        )
+        assert patch_response.status_code == 200
+        updated_citizens = patch_response.json()["data"]
+        assert [citizen["citizen_id"] for citizen in updated_citizens] == [6, 5, 7]
+        assert updated_citizens[0]["relatives"] == [5]
+        assert updated_citizens[0]["street"] == "Бассейная"
+        assert updated_citizens[0]["name"] == citizens_before[6]["name"]
+        assert updated_citizens[1]["relatives"] == [6]
+        assert updated_citizens[2]["name"] == "Новое Имя"
+        assert 5 not in updated_citizens[2]["relatives"]
+        assert 6 not in updated_citizens[2]["relatives"]
+
+        citizens_after = {
+            citizen["citizen_id"]: citizen
+            for citizen in client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"]
+        }
+        for citizen_id, citizen in citizens_after.items():
+            for relative_id in citizen["relatives"]:
+                assert citizen_id in citizens_after[relative_id]["relatives"]
+        assert citizens_after[7] == updated_citizens[2]
+
+
+def test_patch_citizens_batch_is_atomic():
+    """
+    Tests batch with inconsistent relatives, nonexistent citizen or duplicated citizen.
+    Application should return 400 bad request and keep all citizens unchanged
+    :return:
+    """
+    with TestClient(app) as client:
+        citizens_before = client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"]
+
+        for citizens in (
+                [{"citizen_id": 1, "name": "Другое Имя"},
+                 {"citizen_id": 2, "relatives": [3]},
+                 {"citizen_id": 3, "relatives": [1]}],
+                [{"citizen_id": 1, "name": "Другое Имя"},
+                 {"citizen_id": NUM_CITIZENS_IN_SAMPLE + 100, "name": "Другое Имя"}],
+                [{"citizen_id": 1, "name": "Другое Имя"},
+                 {"citizen_id": 1, "town": "Другой Город"}],
+                [{"citizen_id": 1, "name": "Другое Имя"},
+                 {"citizen_id": 2}],
+                []
+        ):
+            patch_response = client.patch(
+                f"/imports/{test_conf.IMPORT_ID}/citizens",
+                json={"citizens": citizens}
+            )
+            assert patch_response.status_code == 400
+
+        citizens_after = client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"]
+        assert citizens_after == citizens_before
+
+
+def test_patch_coalesced_updates(monkeypatch):
+    """
+    Tests concurrent updates applied by coalescer in shared transactions.
+    Failed updates should not affect other updates of the same transaction
+    :return:
+    """
+    batches_sizes = list()
+    apply_batch = citizen_updates_coalescer._apply
+
+    async def count_batch(pending):
+        batches_sizes.append(len(pending))
+        await apply_batch(pending)
+
+    monkeypatch.setattr(citizen_updates_coalescer, "window", 0.05)
+    monkeypatch.setattr(citizen_updates_coalescer, "max_batch", 5)
+    monkeypatch.setattr(citizen_updates_coalescer, "_apply", count_batch)
+
+    async def update_citizens():
+        updates = [(citizen_id, CitizenToUpdate(apartment=100 + citizen_id)) for citizen_id in range(6)]
+        updates.append((NUM_CITIZENS_IN_SAMPLE + 100, CitizenToUpdate(apartment=1)))
+        updates.append((7, CitizenToUpdate(relatives=[NUM_CITIZENS_IN_SAMPLE + 100])))
+        return await asyncio.gather(
+            *[citizen_updates_coalescer.update(import_id=test_conf.IMPORT_ID, citizen_id=citizen_id, citizen=citizen)
+              for citizen_id, citizen in updates],
+            return_exceptions=True
+        )
+
+    with TestClient(app) as client:
+        relatives_before = client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"][7]["relatives"]
+        results = asyncio.get_event_loop().run_until_complete(update_citizens())
+
+        assert batches_sizes == [5, 3]
+        for citizen_id, updated_citizen in enumerate(results[:6]):
+            assert updated_citizen.apartment == 100 + citizen_id
+        for failed_update in results[6:]:
+            assert isinstance(failed_update, HTTPException)
+            assert failed_update.status_code == 400
+
+        citizens_after = client.get(f"/imports/{test_conf.IMPORT_ID}/citizens").json()["data"]
+        for citizen_id in range(6):
+            assert citizens_after[citizen_id]["apartment"] == 100 + citizen_id
+        assert citizens_after[7]["relatives"] == relatives_before
+
+        patch_response = client.patch(
+            f"/imports/{test_conf.IMPORT_ID}/citizens/8",
+            json={"name": "Новое Имя"}
+        )
+        assert patch_response.status_code == 200
+        assert patch_response.json()["data"]["name"] == "Новое Имя"
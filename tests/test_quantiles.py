@@ -0,0 +1,73 @@
+import random
+
+import numpy as np
+
+from app.core.quantiles import grouped_quantiles, grouped_weighted_quantiles
+
+QUANTILES = (0, 0.5, 0.75, 0.99, 1)
+
+
+def test_grouped_quantiles_are_the_same_as_numpy_quantiles():
+    """
+    Checks that quantiles of integer and float values computed for all groups at once
+    are the same as computed by np.quantile for every group separately
+    :return:
+    """
+    for num_values in (1, 2, 7, 100, 1001):
+        group_codes = np.array([random.randint(0, 5) for _ in range(num_values)], dtype=np.int64)
+        integer_values = np.array([random.randint(-10, 100) for _ in range(num_values)], dtype=np.int64)
+        float_values = np.array([random.uniform(-10, 100) for _ in range(num_values)], dtype=np.float64)
+
+        for values in (integer_values, float_values):
+            present_group_codes, group_quantiles = grouped_quantiles(
+                values=values,
+                group_codes=group_codes,
+                quantiles=QUANTILES
+            )
+
+            assert present_group_codes.tolist() == sorted(set(group_codes.tolist()))
+            for group_code, quantiles in zip(present_group_codes, group_quantiles):
+                group_values = values[group_codes == group_code]
+                for quantile, group_quantile in zip(QUANTILES, quantiles):
+                    assert group_quantile == np.quantile(group_values, q=quantile, interpolation="linear")
+
+
+def test_grouped_quantiles_of_no_values():
+    """
+    Checks that there are no groups when there are no values
+    :return:
+    """
+    present_group_codes, group_quantiles = grouped_quantiles(
+        values=np.array([], dtype=np.int64),
+        group_codes=np.array([], dtype=np.int64),
+        quantiles=QUANTILES
+    )
+
+    assert len(present_group_codes) == 0
+    assert group_quantiles.shape == (0, len(QUANTILES))
+
+
+def test_grouped_weighted_quantiles_are_the_same_as_quantiles_of_repeated_values():
+    """
+    Checks that quantiles of distinct values with weights are the same as quantiles of values repeated by weights
+    :return:
+    """
+    for num_values in (1, 2, 7, 100):
+        group_codes = np.array([random.randint(0, 5) for _ in range(num_values)], dtype=np.int64)
+        values = np.array([random.randint(0, 100) for _ in range(num_values)], dtype=np.int64)
+        weights = np.array([random.randint(1, 20) for _ in range(num_values)], dtype=np.int64)
+
+        present_group_codes, group_quantiles = grouped_weighted_quantiles(
+            values=values,
+            group_codes=group_codes,
+            weights=weights,
+            quantiles=QUANTILES
+        )
+        expected_group_codes, expected_group_quantiles = grouped_quantiles(
+            values=np.repeat(values, weights),
+            group_codes=np.repeat(group_codes, weights),
+            quantiles=QUANTILES
+        )
+
+        assert present_group_codes.tolist() == expected_group_codes.tolist()
+        assert group_quantiles.tolist() == expected_group_quantiles.tolist()
@@ -0,0 +1,126 @@
+import asyncio
+from typing import List
+
+from asyncpg.pool import Pool
+from databases import DatabaseURL
+from starlette.testclient import TestClient
+
+from app.core.config import DATABASE_URL
+from app.db.database import READ_AFTER_LSN_HEADER, db
+from app.db.db_utils import create_pool
+from app.main import app
+from tests.utils import TestConfig, generate_citizens_sample
+
+test_conf = TestConfig()
+# Replicas are pools of test database with their own application names. The database is not in recovery,
+# so it has replayed every write
+REPLICAS_APPLICATION_NAMES = ("test_replica_1", "test_replica_2")
+
+
+def setup():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def teardown():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+async def create_replica_pools() -> List[Pool]:
+    return [await create_pool(DatabaseURL(f"{DATABASE_URL}?application_name={application_name}"))
+            for application_name in REPLICAS_APPLICATION_NAMES]
+
+
+async def close_replica_pools(replica_pools: List[Pool]) -> None:
+    for replica_pool in replica_pools:
+        await replica_pool.close()
+
+
+def test_reads_are_routed_to_least_loaded_fresh_replica():
+    """
+    Checks that connections for reads are acquired from the least loaded replica, and from primary
+    when replicas have not replayed required WAL position or do not pass freshness check
+    :return:
+    """
+
+    async def get_application_name(min_lsn=None, is_fresh=None) -> str:
+        async with db.acquire_for_read(min_lsn=min_lsn, is_fresh=is_fresh) as conn:
+            return await conn.fetchval("SELECT current_setting('application_name')")
+
+    async def is_not_fresh(_) -> bool:
+        return False
+
+    async def get_application_names_of_concurrent_reads() -> List[str]:
+        async with db.acquire_for_read() as first_conn:
+            async with db.acquire_for_read() as second_conn:
+                return [await conn.fetchval("SELECT current_setting('application_name')")
+                        for conn in (first_conn, second_conn)]
+
+    with TestClient(app):
+        configured_replica_pools = db.replica_pools
+        db.set_replica_pools(run(create_replica_pools()))
+        try:
+            write_lsn = run(db.get_write_lsn())
+
+            assert run(get_application_name()) in REPLICAS_APPLICATION_NAMES
+            assert run(get_application_name(min_lsn=write_lsn)) in REPLICAS_APPLICATION_NAMES
+            assert run(get_application_name(min_lsn="FFFFFFFF/0")) not in REPLICAS_APPLICATION_NAMES
+            assert run(get_application_name(is_fresh=is_not_fresh)) not in REPLICAS_APPLICATION_NAMES
+            assert sorted(run(get_application_names_of_concurrent_reads())) == list(REPLICAS_APPLICATION_NAMES)
+        finally:
+            run(close_replica_pools(db.replica_pools))
+            db.set_replica_pools(configured_replica_pools)
+
+
+def test_writes_return_read_after_lsn():
+    """
+    Checks that writes return WAL position of write when there are replicas,
+    and that reads which pass it see the write
+    :return:
+    """
+    with TestClient(app) as client:
+        configured_replica_pools = db.replica_pools
+        db.set_replica_pools(run(create_replica_pools()))
+        try:
+            import_response = client.post(
+                "/imports",
+                json={"citizens": generate_citizens_sample(num_citizens=10, with_relatives=True)}
+            )
+            import_id = import_response.json()["data"]["import_id"]
+            assert READ_AFTER_LSN_HEADER.lower() in import_response.headers
+
+            patch_response = client.patch(f"/imports/{import_id}/citizens/0", json={"name": "Иван"})
+            assert patch_response.status_code == 200
+            read_after_lsn = patch_response.headers[READ_AFTER_LSN_HEADER]
+
+            citizens_response = client.get(
+                f"/imports/{import_id}/citizens",
+                headers={READ_AFTER_LSN_HEADER: read_after_lsn}
+            )
+            assert citizens_response.status_code == 200
+            citizens = {citizen["citizen_id"]: citizen for citizen in citizens_response.json()["data"]}
+            assert citizens[0]["name"] == "Иван"
+
+            invalid_lsn_response = client.get(
+                f"/imports/{import_id}/citizens/birthdays",
+                headers={READ_AFTER_LSN_HEADER: "last write"}
+            )
+            assert invalid_lsn_response.status_code == 400
+        finally:
+            run(close_replica_pools(db.replica_pools))
+            db.set_replica_pools(configured_replica_pools)
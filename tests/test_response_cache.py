@@ -0,0 +1,115 @@
+from starlette.testclient import TestClient
+
+from app.core.cache import ResponseCache, import_versions, response_cache
+from app.main import app
+from tests.utils import TestConfig, generate_citizens_sample, import_data_sample
+
+test_conf = TestConfig()
+
+
+def setup():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def teardown():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def test_response_cache_evicts_least_recently_used_bodies():
+    """
+    Checks that cache keeps total size of bodies within memory budget
+    :return:
+    """
+    cache = ResponseCache(max_bytes=10)
+    cache.put(("citizens", 1, 1), b"1234")
+    cache.put(("citizens", 2, 1), b"5678")
+    assert cache.get(("citizens", 1, 1)) == b"1234"
+
+    cache.put(("citizens", 3, 1), b"90ab")
+    assert cache.size == 8
+    assert cache.get(("citizens", 2, 1)) is None
+    assert cache.get(("citizens", 1, 1)) == b"1234"
+
+    cache.put(("citizens", 4, 1), b"too large body")
+    assert cache.get(("citizens", 4, 1)) is None
+
+    cache.evict_import(1)
+    assert cache.get(("citizens", 1, 1)) is None
+    assert cache.size == 4
+
+
+def test_cached_responses_reflect_patch():
+    """
+    Checks that responses are served from cache and are not stale after citizen is updated
+    :return:
+    """
+    import_id = import_data_sample(num_citizens=10, with_relatives=True)
+
+    with TestClient(app) as client:
+        assert import_versions.listening
+
+        first_response = client.get(f"/imports/{import_id}/citizens")
+        assert first_response.status_code == 200
+        assert response_cache.size == len(first_response.content)
+        second_response = client.get(f"/imports/{import_id}/citizens")
+        assert second_response.content == first_response.content
+
+        birthdays_response = client.get(f"/imports/{import_id}/citizens/birthdays")
+        assert birthdays_response.status_code == 200
+
+        patch_response = client.patch(
+            f"/imports/{import_id}/citizens/1",
+            json={"name": "Новое Имя"}
+        )
+        assert patch_response.status_code == 200
+
+        updated_response = client.get(f"/imports/{import_id}/citizens")
+        assert updated_response.status_code == 200
+        updated_citizen = next(citizen for citizen in updated_response.json()["data"] if citizen["citizen_id"] == 1)
+        assert updated_citizen["name"] == "Новое Имя"
+
+
+def test_cached_responses_are_dropped_on_reset():
+    """
+    Checks that import with the same id created after reset is not served from cache
+    :return:
+    """
+    setup()
+
+    with TestClient(app) as client:
+        import_response = client.post(
+            "/imports",
+            json={"citizens": generate_citizens_sample(num_citizens=5, with_relatives=False)}
+        )
+        import_id = import_response.json()["data"]["import_id"]
+        first_response = client.get(f"/imports/{import_id}/citizens")
+        assert first_response.status_code == 200
+
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+        assert response_cache.size == 0
+
+        import_response = client.post(
+            "/imports",
+            json={"citizens": generate_citizens_sample(num_citizens=7, with_relatives=False)}
+        )
+        new_import_id = import_response.json()["data"]["import_id"]
+        assert new_import_id == import_id
+        new_response = client.get(f"/imports/{new_import_id}/citizens")
+        assert new_response.status_code == 200
+        assert len(new_response.json()["data"]) == 7
@@ -0,0 +1,122 @@
+import asyncio
+from pathlib import Path
+
+import asyncpg
+from databases import DatabaseURL
+from starlette.testclient import TestClient
+
+from app.core.cache import response_cache
+from app.core.config import DATABASE_URL
+from app.db.database import DataBase, db, sharded_db
+from app.db.db_utils import create_pool
+from app.main import app
+from tests.utils import TestConfig, generate_citizens_sample
+
+test_conf = TestConfig()
+# Database of the second shard is created on the same server as test database
+SHARD_DATABASE_NAME = f"{DATABASE_URL.database}_shard_test"
+SHARD_DATABASE_URL = DATABASE_URL.replace(database=SHARD_DATABASE_NAME)
+INIT_SQL_PATH = Path(__file__).parent.parent / "db_init" / "init.sql"
+
+
+def setup():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def teardown():
+
+    with TestClient(app) as client:
+        client.delete(
+            "/reset_data",
+            json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                  "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+        )
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+async def create_shard() -> DataBase:
+    """
+    Creates database of the second shard from init script, if it does not exist, and connects to it
+    :return: shard database
+    """
+    conn = await asyncpg.connect(str(DATABASE_URL))
+    try:
+        if not await conn.fetchval("SELECT TRUE FROM pg_database WHERE datname = $1", SHARD_DATABASE_NAME):
+            await conn.execute(f'CREATE DATABASE "{SHARD_DATABASE_NAME}"')
+            shard_conn = await asyncpg.connect(str(SHARD_DATABASE_URL))
+            try:
+                await shard_conn.execute(INIT_SQL_PATH.read_text())
+            finally:
+                await shard_conn.close()
+    finally:
+        await conn.close()
+
+    shard = DataBase()
+    shard.pool = await create_pool(DatabaseURL(str(SHARD_DATABASE_URL)))
+    return shard
+
+
+async def count_imports(shard: DataBase) -> int:
+    async with shard.pool.acquire() as conn:
+        return await conn.fetchval("SELECT count(*) FROM imports")
+
+
+def test_imports_are_stored_in_shards(monkeypatch):
+    """
+    Checks that imports are stored in shards in turn, that reads and updates of import are routed
+    to its shard by import_id, and that reset clears all shards
+    :return:
+    """
+    monkeypatch.setattr(response_cache, "max_bytes", 0)
+
+    with TestClient(app) as client:
+        configured_shards = sharded_db.shards
+        shard = run(create_shard())
+        monkeypatch.setattr(sharded_db, "shards", [db, shard])
+        monkeypatch.setattr(sharded_db, "_imports_in_progress", [0, 0])
+        try:
+            citizens_by_import_id = dict()
+            for _ in range(4):
+                citizens = generate_citizens_sample(num_citizens=10, with_relatives=True)
+                import_response = client.post("/imports", json={"citizens": citizens})
+                assert import_response.status_code == 201
+                citizens_by_import_id[import_response.json()["data"]["import_id"]] = citizens
+
+            import_ids = list(citizens_by_import_id)
+            assert [import_id % 2 for import_id in import_ids[:2]] == [import_id % 2 for import_id in import_ids[2:]]
+            assert sorted(import_id % 2 for import_id in import_ids) == [0, 0, 1, 1]
+            assert run(count_imports(db)) == 2
+            assert run(count_imports(shard)) == 2
+
+            for import_id, citizens in citizens_by_import_id.items():
+                patch_response = client.patch(f"/imports/{import_id}/citizens/0", json={"name": f"Иван {import_id}"})
+                assert patch_response.status_code == 200
+
+                citizens_response = client.get(f"/imports/{import_id}/citizens")
+                assert citizens_response.status_code == 200
+                got_citizens = {citizen["citizen_id"]: citizen for citizen in citizens_response.json()["data"]}
+                assert len(got_citizens) == len(citizens)
+                assert got_citizens[0]["name"] == f"Иван {import_id}"
+
+                assert client.get(f"/imports/{import_id}/citizens/birthdays").status_code == 200
+                assert client.get(f"/imports/{import_id}/towns/stat/percentile/age").status_code == 200
+
+            client.delete(
+                "/reset_data",
+                json={"admin_login": f"{test_conf.ADMIN_LOGIN}",
+                      "admin_password": f"{test_conf.ADMIN_PASSWORD}"}
+            )
+            assert run(count_imports(db)) == 0
+            assert run(count_imports(shard)) == 0
+        finally:
+            monkeypatch.setattr(sharded_db, "shards", configured_shards)
+            run(shard.pool.close())
@@ -0,0 +1,25 @@
+import asyncio
+
+from starlette.testclient import TestClient
+
+from app.db.database import db
+from app.db.statements import STATEMENTS
+from app.main import app
+
+
+def test_statements_are_prepared_on_pool_connections():
+    """
+    Checks that every registered statement is prepared on pool connection before it is first used
+    :return:
+    """
+
+    async def get_prepared_statements():
+        async with db.pool.acquire() as conn:
+            return await conn.fetch("SELECT statement FROM pg_prepared_statements")
+
+    with TestClient(app):
+        prepared_statements_rows = asyncio.get_event_loop().run_until_complete(get_prepared_statements())
+
+    prepared_statements = {row["statement"] for row in prepared_statements_rows}
+    for statement in STATEMENTS.values():
+        assert statement.sql in prepared_statements